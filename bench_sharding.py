@@ -0,0 +1,117 @@
+import argparse
+import contextlib
+import io
+import logging
+import math
+import statistics
+import time
+
+from testing.fake_cluster import FakeCluster, FakeMetricsBackend
+from jobs.job import nodetype_label
+
+class WallClock:
+    """FakeCluster clock on real time, so its api_latency is spent like a real API round-trip."""
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0))
+
+class FakeNodeMetrics(FakeMetricsBackend):
+    """FakeMetricsBackend with the latency of one metrics API call per read."""
+    def get_node_samples(self, node_names):
+        self.cluster.api_call()
+        return super().get_node_samples(node_names)
+
+class InlineCoordinator:
+    """ShardCoordinator without processes: runs the shard workers one after the other
+    and keeps their times, the slowest of them is what a cycle waits for."""
+    def __init__(self, workers):
+        self.workers = workers
+        self.elapsed = []
+
+    def merge(self, replies, unknown=()):
+        from sharding import ShardCoordinator
+        return ShardCoordinator.merge(replies, unknown)
+
+    def collect(self, submitted_at=None):
+        replies = [worker.step(0, submitted_at) for worker in self.workers]
+        self.elapsed = [reply["elapsed"] for reply in replies]
+        return self.merge(replies)
+
+def build_cluster(node_count, api_latency):
+    cluster = FakeCluster(WallClock(), cores=8)
+    names = [f"node{index}" for index in range(node_count)]
+    for name in names:
+        cluster.add_node(name, {"nodetype": nodetype_label(name), "role": "worker"}, listed_at=0.0)
+    cluster.api_latency = api_latency
+    cluster.install()
+    return cluster, names
+
+def build_unsharded(cluster, names):
+    from metrics_backend import CachedMetricsBackend
+    from monitor import MonitorNode
+    from local_controller import LocalController
+    from middleware import Middleware
+    backend = CachedMetricsBackend(FakeNodeMetrics(cluster), ttl=1.0)
+    return Middleware(*[LocalController(name, MonitorNode(name, backend)) for name in names])
+
+def build_sharded(cluster, names, nodes_per_shard):
+    from metrics_backend import CachedMetricsBackend
+    from monitor import MonitorNode
+    from local_controller import LocalController
+    from sharding import HashRing, ShardWorker, ShardedMiddleware
+    shards = max(math.ceil(len(names) / nodes_per_shard), 1)
+    workers = []
+    for shard, shard_names in HashRing(range(shards)).assign(names).items():
+        backend = CachedMetricsBackend(FakeNodeMetrics(cluster), ttl=1.0)
+        controllers = {name: LocalController(name, MonitorNode(name, backend)) for name in shard_names}
+        workers.append(ShardWorker(shard, controllers))
+    coordinator = InlineCoordinator(workers)
+    return ShardedMiddleware(names, coordinator), coordinator, shards
+
+def decide(middleware):
+    # the part of GlobalController.run_cycle up to the placement decision
+    with contextlib.redirect_stdout(io.StringIO()):
+        middleware.refresh_active_nodes()
+        middleware.update_local_states()
+        middleware.avg_cluster_cpu_capacity()
+        middleware.determine_next_node()
+
+def measure(node_count, args):
+    cluster, names = build_cluster(node_count, args.api_latency)
+    unsharded = build_unsharded(cluster, names)
+    sharded, coordinator, shards = build_sharded(cluster, names, args.nodes_per_shard)
+    results = {"unsharded": [], "shard": [], "coordinator": [], "sharded": []}
+    for _ in range(args.cycles):
+        started = time.perf_counter()
+        decide(unsharded)
+        results["unsharded"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        decide(sharded)
+        total = time.perf_counter() - started
+        # shard workers run in parallel processes, the coordinator waits for the slowest one
+        slowest = max(coordinator.elapsed)
+        coordinator_time = total - sum(coordinator.elapsed)
+        results["shard"].append(slowest)
+        results["coordinator"].append(coordinator_time)
+        results["sharded"].append(slowest + coordinator_time)
+    return shards, {key: statistics.median(values) for key, values in results.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure controller cycle time up to the placement decision against node count')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 100, 1000], help='Node counts to measure')
+    parser.add_argument('--nodes-per-shard', type=int, default=50, help='Nodes per shard worker, shards grow with the node count')
+    parser.add_argument('--api-latency', type=float, default=0.005, help='Seconds every fake API call takes')
+    parser.add_argument('--cycles', type=int, default=5, help='Cycles measured per node count, the median is printed')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print("nodes,shards,unsharded_s,sharded_s,slowest_shard_s,coordinator_s")
+    for node_count in args.nodes:
+        shards, medians = measure(node_count, args)
+        print(f"{node_count},{shards},{medians['unsharded']:.3f},{medians['sharded']:.3f},{medians['shard']:.3f},{medians['coordinator']:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ["imported", "built", "decision"]
+
+def child(controller_args):
+    """Runs inside the measured process and reports each startup milestone on stdout."""
+    import main
+    print("imported", flush=True)
+
+    args = main.build_parser().parse_args(controller_args + ['--jobs-file', os.devnull])
+    job_queue, middleware, global_controller = main.build(args)
+    print("built", flush=True)
+
+    # save_metrics writes into the working directory, keep it out of the repo
+    os.chdir(tempfile.mkdtemp())
+    global_controller.run_cycle(job_queue)
+    print("decision", flush=True)
+
+def measure(controller_args):
+    """Wall time from spawning the interpreter to each milestone."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', '--'] + controller_args,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    timings = {}
+    for line in process.stdout:
+        phase = line.strip()
+        if phase in PHASES:
+            timings[phase] = time.perf_counter() - start
+    process.wait()
+    error = process.stderr.read().strip().splitlines()
+    return timings, (error[-1] if process.returncode and error else None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure controller startup time up to the first control decision')
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh processes to measure')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('controller_args', nargs='*', help='Arguments passed to main.py, after --')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.controller_args)
+        return
+
+    results = {phase: [] for phase in PHASES}
+    error = None
+    for _ in range(args.runs):
+        timings, error = measure(args.controller_args)
+        for phase, elapsed in timings.items():
+            results[phase].append(elapsed)
+
+    print("phase,runs,median_s,max_s")
+    for phase in PHASES:
+        if results[phase]:
+            print(f"{phase},{len(results[phase])},{statistics.median(results[phase]):.3f},{max(results[phase]):.3f}")
+    if error:
+        # without a reachable cluster only the import phase can be measured
+        print(f"Stopped early: {error}")
+
+if __name__ == "__main__":
+    main()
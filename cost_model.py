@@ -0,0 +1,72 @@
+import numpy as np
+
+# stress-ng options a job pod is labelled with, see jobs.job.stressor_labels
+STRESSORS = ("cpu", "io", "vm")
+
+class RecursiveLeastSquares:
+    """Online linear regression y = theta . x with exponential forgetting.
+
+    update() costs O(n^2) per observation with n features, no history is
+    kept. With forgetting < 1 old observations fade out, so the fit follows
+    slow drift such as a node type changing.
+
+    Forgetting only applies to the features an observation has (non-zero
+    x), and the trace of P never exceeds its initial value: directions the
+    data does not excite, such as --vm on a --cpu only workload or a
+    single --cpu value, would otherwise wind P up until the fit diverges.
+    """
+    def __init__(self, n, forgetting=0.995, delta=100.0, theta=None):
+        self.forgetting = forgetting
+        self.theta = np.zeros(n) if theta is None else np.asarray(theta, dtype=float)
+        self.P = delta * np.eye(n)      # covariance, large delta = little trust in the initial theta
+        self.max_trace = delta * n
+        self.count = 0
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=float)
+        active = np.ix_(x != 0, x != 0)
+        self.P[active] /= self.forgetting
+        Px = self.P @ x
+        gain = Px / (1.0 + x @ Px)
+        self.theta = self.theta + gain * (y - x @ self.theta)
+        self.P = self.P - np.outer(gain, Px)
+        # round-off in the subtraction would otherwise make P asymmetric and then indefinite
+        self.P = (self.P + self.P.T) / 2
+        trace = np.trace(self.P)
+        if trace > self.max_trace:
+            self.P *= self.max_trace / trace
+        self.count += 1
+
+    def predict(self, x):
+        return float(np.asarray(x, dtype=float) @ self.theta)
+
+class JobCostModel:
+    """Expected CPU (cores) of a job from its stress-ng parameters.
+
+    Fits cores = c0 + c_cpu * --cpu + c_io * --io + c_vm * --vm from the
+    measured usage of running job pods. Until it has seen MIN_OBSERVATIONS it
+    answers with the prior: one core per --cpu and --vm worker, like
+    Job.resources() requests.
+    """
+    MIN_OBSERVATIONS = 10
+    MIN_CPU = 0.1       # cores, a job never expects less: headroom checks and free slots divide by it
+
+    def __init__(self, forgetting=0.995):
+        # start at the prior so early estimates are not wild
+        self.rls = RecursiveLeastSquares(1 + len(STRESSORS), forgetting, theta=[0.0, 1.0, 0.1, 1.0])
+
+    @staticmethod
+    def features(stressors):
+        return [1.0] + [float(stressors.get(name, 0)) for name in STRESSORS]
+
+    def observe(self, stressors, cpu):
+        self.rls.update(self.features(stressors), cpu)
+
+    def expected_cpu(self, stressors):
+        x = self.features(stressors)
+        if self.rls.count < self.MIN_OBSERVATIONS:
+            return max(x[1] + 0.1 * x[2] + x[3], self.MIN_CPU)
+        return max(self.rls.predict(x), self.MIN_CPU)
+
+    def coefficients(self):
+        return dict(zip(("base",) + STRESSORS, (round(float(c), 3) for c in self.rls.theta)))
@@ -0,0 +1,270 @@
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import contextlib
+import kube
+from kube import client
+
+from middleware import NODE_INVENTORY
+
+# ---- manual node actions, as forced_cutoff.py does them --------------------
+
+def add_node(core_v1_api, node_info):
+    node = client.V1Node(
+        api_version="v1",
+        kind="Node",
+        metadata=client.V1ObjectMeta(
+            name=node_info["name"],
+            labels=node_info["label"]
+        ),
+        status=client.V1NodeStatus(
+            addresses=[
+                client.V1NodeAddress(
+                    type="InternalIP",
+                    address=node_info["ip"]
+                )
+            ]
+        )
+    )
+    try:
+        core_v1_api.create_node(body=node)
+        logging.info(f"Fault Injection: Node {node_info['name']} created successfully")
+    except client.rest.ApiException as e:
+        logging.error(f"Fault Injection: Error creating node: {e}")
+
+def remove_node(core_v1_api, node_name):
+    try:
+        core_v1_api.delete_node(name=node_name)
+        logging.info(f"Fault Injection: {node_name} removed successfully")
+    except client.rest.ApiException as e:
+        logging.error(f"Fault Injection: Error deleting node: {e}")
+
+# ---- faults ------------------------------------------------------------------
+#
+# Every fault has inject/clear for the simulated cluster (FakeCluster) and,
+# where the real API allows it, inject_real/clear_real. detected/recovered
+# read the controller's node state: a dict like Middleware.snapshot() entries.
+
+class NodeRemoval:
+    name = "node-removal"
+    real = True
+
+    def __init__(self, node):
+        self.node = node
+
+    def inject(self, cluster):
+        kube.core_v1().delete_node(self.node["name"])
+
+    def clear(self, cluster):
+        add_node(kube.core_v1(), self.node)
+
+    inject_real = inject
+    clear_real = clear
+
+    def detected(self, nodes):
+        state = nodes.get(self.node["name"], {})
+        return not state.get("active") or state.get("stale") or not state.get("healthy", True)
+
+    def recovered(self, nodes):
+        state = nodes.get(self.node["name"], {})
+        return state.get("active") and not state.get("stale") and state.get("healthy", True)
+
+class NodeNotReady(NodeRemoval):
+    """Kubelet gone: the node stays listed, stops renewing its lease and reports no metrics;
+    Ready turns Unknown only after the node monitor grace period."""
+    name = "node-notready"
+    real = False
+
+    def inject(self, cluster):
+        cluster.set_ready(self.node["name"], False)
+
+    def clear(self, cluster):
+        cluster.set_ready(self.node["name"], True)
+
+    # the missing metrics alone would read as stale at once, detection is NodeHealthMonitor taking the node out
+    def detected(self, nodes):
+        return not nodes.get(self.node["name"], {}).get("healthy", True)
+
+class MetricsOutage:
+    """metrics-server unavailable for every node."""
+    name = "metrics-outage"
+    real = True
+
+    def __init__(self, node=None):
+        self.node = node
+        self.replicas = 1
+
+    def inject(self, cluster):
+        cluster.metrics_down = True
+
+    def clear(self, cluster):
+        cluster.metrics_down = False
+
+    def inject_real(self, cluster):
+        apps_v1_api = kube.apps_v1()
+        scale = apps_v1_api.read_namespaced_deployment_scale("metrics-server", "kube-system")
+        self.replicas = scale.spec.replicas or 1
+        apps_v1_api.patch_namespaced_deployment_scale("metrics-server", "kube-system", {"spec": {"replicas": 0}})
+
+    def clear_real(self, cluster):
+        kube.apps_v1().patch_namespaced_deployment_scale("metrics-server", "kube-system", {"spec": {"replicas": self.replicas}})
+
+    def detected(self, nodes):
+        return any(state.get("stale") for state in nodes.values() if state.get("active"))
+
+    def recovered(self, nodes):
+        return not self.detected(nodes)
+
+FAULTS = {fault.name: fault for fault in (NodeRemoval, NodeNotReady, MetricsOutage)}
+
+# ---- harness -----------------------------------------------------------------
+
+def measure_simulated(fault_type, node, jobs_file, warmup=120, duration=90, timeout=600, interval=15):
+    """Inject one fault into a fresh simulated cluster running the real controller.
+
+    Times are on the simulated clock: detect is from injection to the first
+    cycle the controller treats the fault as such, recover from clearing the
+    fault to the first cycle the controller is healthy again.
+    """
+    from replay import ReplayEngine
+    from scaling_policy import ScalingPolicy
+
+    # keep every node up, the faults are what takes them away
+    policy = ScalingPolicy()
+    policy.scale_down.stabilization_cycles = sys.maxsize
+    engine = ReplayEngine(0.0, len(NODE_INVENTORY), jobs_file, policy=policy)
+    fault = fault_type(node)
+    now = 0.0
+    cycle_times = {"before": [], "during": []}
+
+    def cycle(phase):
+        """Runs the next cycle; returns the node states and the time the cycle ended."""
+        nonlocal now
+        started = max(now, engine.clock.time())
+        engine.step(started)
+        finished = engine.clock.time()
+        if phase:
+            cycle_times[phase].append(finished - started)
+        now = started + interval
+        return engine.middleware.snapshot(), finished
+
+    while now < warmup:
+        cycle("before")
+    lost_before = engine.cluster.jobs_lost()
+
+    # faults strike between two cycles, on average half an interval before the next one
+    injected_at = now - interval / 2
+    engine.clock.set(injected_at)
+    fault.inject(engine.cluster)
+    detected_at = None
+    while now < injected_at + duration:
+        nodes, finished = cycle("during")
+        if detected_at is None and fault.detected(nodes):
+            detected_at = finished
+    cleared_at = now - interval / 2
+    engine.clock.set(cleared_at)
+    fault.clear(engine.cluster)
+    recovered_at = None
+    while now < cleared_at + timeout:
+        nodes, finished = cycle(None)
+        if fault.recovered(nodes):
+            recovered_at = finished
+            break
+
+    def mean(values):
+        return round(sum(values) / len(values), 3) if values else None
+
+    return {
+        "fault": fault.name,
+        "target": node["name"].split('.')[0] if node else "",
+        "mode": "simulated",
+        "detect_s": round(detected_at - injected_at, 1) if detected_at is not None else None,
+        "recover_s": round(recovered_at - cleared_at, 1) if recovered_at is not None else None,
+        "jobs_lost": engine.cluster.jobs_lost() - lost_before,
+        "cycle_s_before": mean(cycle_times["before"]),
+        "cycle_s_during": mean(cycle_times["during"]),
+    }
+
+def read_snapshot(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def wait_for(predicate, snapshot_path, timeout, poll=1.0):
+    """Seconds until the controller snapshot satisfies predicate, None on timeout."""
+    start = time.time()
+    while time.time() - start < timeout:
+        if predicate(read_snapshot(snapshot_path).get("nodes", {})):
+            return round(time.time() - start, 1)
+        time.sleep(poll)
+    return None
+
+def measure_real(fault_type, node, snapshot_path, duration=90, timeout=600):
+    """Inject one fault into the real cluster while main.py runs and watch its snapshot file."""
+    fault = fault_type(node)
+    core_v1_api = kube.core_v1()
+    running = 0
+    if node:
+        pods = core_v1_api.list_namespaced_pod(namespace="jobs", field_selector=f"spec.nodeName={node['name']},status.phase=Running")
+        running = len(pods.items)
+    injected_at = time.time()
+    fault.inject_real(None)
+    detect_s = wait_for(fault.detected, snapshot_path, duration)
+    time.sleep(max(injected_at + duration - time.time(), 0))
+    fault.clear_real(None)
+    recover_s = wait_for(fault.recovered, snapshot_path, timeout)
+    return {
+        "fault": fault.name,
+        "target": node["name"].split('.')[0] if node else "",
+        "mode": "real",
+        "detect_s": detect_s,
+        "recover_s": recover_s,
+        # removing a node takes its running jobs with it
+        "jobs_lost": running if fault_type is NodeRemoval else 0,
+        "cycle_s_before": None,
+        "cycle_s_during": None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Inject faults and measure how fast the controller detects and recovers from them')
+    parser.add_argument('--faults', default=','.join(FAULTS), help=f'Comma separated faults: {", ".join(FAULTS)}')
+    parser.add_argument('--node', type=int, default=1, help='Inventory index of the node to fail')
+    parser.add_argument('--duration', type=float, default=90, help='Seconds each fault lasts')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for recovery')
+    parser.add_argument('--jobs-file', default='./static/jobs.txt', help='Jobs the simulated controller works through')
+    parser.add_argument('--real', action='store_true', help='Inject into the real cluster; main.py has to be running')
+    parser.add_argument('--snapshot-file', default='controller_snapshot.json', help='Snapshot written by main.py, for --real')
+    parser.add_argument('--verbose', action='store_true', help='Show the controller log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    if not args.verbose and not args.real:
+        logging.disable(logging.CRITICAL)
+    node = NODE_INVENTORY[args.node]
+
+    results = []
+    for name in args.faults.split(','):
+        fault_type = FAULTS[name.strip()]
+        if args.real:
+            if not fault_type.real:
+                print(f"# {fault_type.name} can only be injected into the simulated cluster, skipped", file=sys.stderr)
+                continue
+            results.append(measure_real(fault_type, node, args.snapshot_file, args.duration, args.timeout))
+        else:
+            # run_cycle prints section separators to stdout
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                results.append(measure_simulated(fault_type, node, args.jobs_file, duration=args.duration, timeout=args.timeout))
+
+    if results:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+
+if __name__ == "__main__":
+    main()
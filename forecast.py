@@ -0,0 +1,31 @@
+class HoltForecaster:
+    """Holt's linear trend (double exponential smoothing) over one series.
+
+    update() takes one observation per controller cycle; forecast(steps)
+    extrapolates the smoothed level along the smoothed per-cycle trend.
+    """
+    def __init__(self, alpha=0.5, beta=0.3):
+        self.alpha = alpha      # weight of the newest observation in the level
+        self.beta = beta        # weight of the newest level change in the trend
+        self.level = None
+        self.trend = 0.0
+        self.count = 0
+
+    def update(self, value):
+        if self.level is None:
+            self.level = value
+        else:
+            previous = self.level
+            self.level = self.alpha * value + (1 - self.alpha) * (self.level + self.trend)
+            self.trend = self.beta * (self.level - previous) + (1 - self.beta) * self.trend
+        self.count += 1
+        return self.level
+
+    def is_ready(self):
+        # the trend means nothing before two observations
+        return self.count >= 2
+
+    def forecast(self, steps=1):
+        if self.level is None:
+            return None
+        return self.level + steps * self.trend
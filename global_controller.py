@@ -1,76 +1,284 @@
+import os
+import json
+import math
 import time
 import logging
-from jobs.job import JobSubmitter as Job
+import kube
+from collections import deque
+from jobs.job import JobSubmitter as Job, IndexedJobSubmitter
+from jobs.queue import Job as QueuedJob
+from forecast import HoltForecaster
+from scaling_policy import PolicyEngine
 
 class GlobalController:
     def __init__(self, middleware):
         self.middleware = middleware
-        
+
         self.DESIRED_CPU_UTILIZATION_RANGE = (75, 85)
-        self.OPERATING_POINT = 80.0
-        self.SCALE_DOWN_THRESHOLD = 0.2
         self.polling_interval = 15
-        
-        self.LOW_CYCLE_COUNT = 4
-        self.low_cluster_util_count_down = self.LOW_CYCLE_COUNT
+
+        # thresholds, stabilization, cooldowns and step sizes, see scaling-policy.yaml
+        self.policy = PolicyEngine()
+        self.last_job_submission_time = 0
+        self.SUBMIT_INTERVAL = 15       # seconds between job submissions
+        self.batch_size = 1             # queued jobs submitted together as one Indexed Job
+        # optional warm_start.WarmStart, single jobs go to its idle pool pods when there is one
+        self.warm_start = None
+
+        # predictive scale up from the utilization trend and the queued work
+        self.predictive = False
+        self.NODE_READY_TIME = 60       # seconds from create_node until a node takes jobs
+        self.NODE_POD_CAPACITY = 8      # pods a joining node adds, LocalController.MAX_PODS_LIMIT
+        # job CPU limits over requests, >1 packs more jobs on a node than it has cores
+        self.cpu_overcommit = 1.0
+        self.util_trend = HoltForecaster()
+
+        # optional LeaderElector, only the leader scales the cluster and submits jobs
+        self.elector = None
+        self.was_leader = False
+        self.submitted_jobs = 0     # jobs taken from the queue, mirrored on the lease
+
+        # state published for monitor_cluster.py after every cycle, None disables it
+        self.snapshot_path = None
+        self.submit_times = deque(maxlen=256)
+        self.SUBMIT_RATE_WINDOW = 300   # seconds
+
+    def is_leader(self):
+        return self.elector is None or self.elector.is_leader()
+
+    # a new leader skips the jobs its predecessor already took from the same queue
+    def resume_from_lease(self, queue):
+        submitted = int(self.elector.get_annotation("submitted-jobs", 0))
+        while self.submitted_jobs < submitted and queue.has_next_job():
+            queue.get_next_job()
+            self.submitted_jobs += 1
+        logging.critical(f"Global Controller: Leading, resuming after {self.submitted_jobs} submitted jobs")
+
+    # record the submission on the lease first, a deposed leader fails here instead of double-submitting
+    def claim_submission(self, count=1):
+        if self.elector is None:
+            return True
+        return self.elector.update_annotation("submitted-jobs", self.submitted_jobs + count)
+
+    # the next job plus up to limit - 1 (batch_size - 1 by default) queued right behind it that can share its pod template
+    def take_batch(self, queue, limit=None):
+        limit = self.batch_size if limit is None else min(self.batch_size, limit)
+        batch = [queue.get_next_job()]
+        key = batch[0].batch_key() if limit > 1 else None
+        while len(batch) < limit:
+            candidate = queue.peek_next_job()
+            if candidate is None or candidate.batch_key() != key:
+                break
+            batch.append(queue.get_next_job())
+        return batch
+
+    # requests and limits of a job, no bigger than the largest node can bind
+    def job_resources(self, job):
+        return job.resources(self.cpu_overcommit, self.middleware.largest_allocatable())
+
+    # False if nothing was submitted, the batch is still the caller's
+    def submit_batch(self, node_name, batch):
+        resources = self.job_resources(batch[0])
+        expected_cpu = self.middleware.cost_model.expected_cpu(batch[0].stressors)
+        if len(batch) == 1:
+            if self.warm_start and self.warm_start.take(node_name, batch[0].to_args_list(), resources):
+                # the pool pod already holds the requests
+                self.middleware.reserve(node_name, {"requests": {}}, expected_cpu=expected_cpu)
+                return True
+            if not Job(node_name, batch[0].to_args_list(), batch[0].enqueued_at, resources, batch[0].tenant).submit():
+                return False
+            self.middleware.reserve(node_name, resources, expected_cpu=expected_cpu)
+            return True
+        # take_batch was limited to the node's free slots, every index starts at once and is in the ledger
+        if not IndexedJobSubmitter(node_name, [job.to_args_list() for job in batch], min(job.enqueued_at for job in batch),
+                                   resources, [job.tenant for job in batch]).submit():
+            return False
+        self.middleware.reserve(node_name, resources, len(batch), expected_cpu)
+        return True
+
+    # pod slots the queued jobs will hold at once while they are submitted batch_size per SUBMIT_INTERVAL,
+    # one slot per job like the running pods and MAX_CLUSTER_PODS it is compared with
+    def backlog_demand(self, queue):
+        backlog = queue.backlog()
+        if not backlog["jobs"]:
+            return 0.0
+        if not backlog["mean_timeout"]:
+            # no --timeout anywhere, every job holds its slot for good
+            return float(backlog["jobs"])
+        # Little's law: arrival rate x mean timeout, never more than the queued jobs
+        concurrent_jobs = self.batch_size * backlog["mean_timeout"] / self.SUBMIT_INTERVAL
+        return min(concurrent_jobs, backlog["jobs"])
+
+    # predictive scale up signal, the measured utilization is handled by the policy
+    def predicts_saturation(self, queue):
+        if not self.predictive:
+            return False
+        target = self.policy.policy.target_utilization
+        # look as far ahead as a new node needs to come online
+        horizon = max(math.ceil(self.NODE_READY_TIME / self.polling_interval), 1)
+        if self.util_trend.is_ready():
+            forecast = self.util_trend.forecast(horizon)
+            logging.info(f"Global Controller: CPU utilization forecast in {horizon} cycles: {forecast:.1f}%")
+            if forecast > target:
+                return True
+        demand = self.backlog_demand(queue)
+        running = self.middleware.cluster_metrics["total_pods"][-1]["value"] if self.middleware.cluster_metrics.get("total_pods") else 0
+        capacity = self.middleware.MAX_CLUSTER_PODS + len(self.middleware.pending_nodes()) * self.NODE_POD_CAPACITY
+        logging.info(f"Global Controller: Pod demand {running} running + {demand:.1f} queued, capacity {capacity}")
+        return running + demand > capacity
+
+    def scale_up(self, step):
+        added = 0
+        for _ in range(step):
+            draining = self.middleware.draining_nodes()
+            node_name = self.middleware.find_inactive_nodes()
+            if draining:
+                # a node that is still draining is the quickest capacity to get back
+                added += self.middleware.cancel_drain(draining[0])
+            elif node_name:
+                added += self.middleware.add_node(node_name)
+            else:
+                logging.info("Global Controller: No more available nodes to add.")
+                break
+        return added
+
+    def scale_down(self, step):
+        drained = 0
+        for _ in range(step):
+            # look for the node with the least work left and drain it
+            remove_node_name = self.middleware.determine_node_to_remove()
+            if not remove_node_name:
+                break
+            drained += self.middleware.start_drain(remove_node_name)
+        return drained
+
+    def submit_rate(self, now=None):
+        """Jobs submitted per minute over the last SUBMIT_RATE_WINDOW seconds."""
+        now = now or time.time()
+        recent = [t for t in self.submit_times if now - t <= self.SUBMIT_RATE_WINDOW]
+        return len(recent) * 60 / self.SUBMIT_RATE_WINDOW
+
+    def write_snapshot(self, queue, cycle_latency):
+        if not self.snapshot_path:
+            return
+        snapshot = {
+            "timestamp": time.time(),
+            "leader": self.is_leader(),
+            "cycle_latency": cycle_latency,
+            "polling_interval": self.polling_interval,
+            "queue_depth": queue.depth(),
+            "submit_rate": self.submit_rate(),
+            "submitted_jobs": self.submitted_jobs,
+            "max_cluster_pods": self.middleware.MAX_CLUSTER_PODS,
+            "nodes": self.middleware.snapshot(),
+            "api": kube.stats.snapshot(),
+        }
+        # write and rename, readers never see a partial file
+        temporary = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temporary, 'w') as file:
+                json.dump(snapshot, file)
+            os.replace(temporary, self.snapshot_path)
+        except OSError as e:
+            logging.error(f"Global Controller: Failed to write snapshot: {e}")
 
     def run(self, queue):
-        last_job_submission_time = 0
         try:
             while True:
                 if not self.middleware.check_metrics_availability():
                     logging.error("Global Controller: Metrics not available... skipping cycle.")
                     time.sleep(self.polling_interval)
                     continue
-                current_time = time.time()
-                # heartbeat
-                self.middleware.refresh_active_nodes()
-                # call local controllers to update their states based on local metrics
-                self.middleware.update_local_states()
-                # determine average cluster CPU utilization
-                avg_cluster_cpu_util = self.middleware.avg_cluster_cpu_capacity()
-
-                # rule based global controller
-                if avg_cluster_cpu_util > self.OPERATING_POINT:
-                    # UPSCALE
-                    # wait until either - a node is available to add to the cluster or CPU utilization decreases
-                    logging.critical("Global Controller: Attempting to scale up...")
-                    node_name = self.middleware.find_inactive_nodes()
-                    if node_name:
-                        self.middleware.add_node(node_name)
-                    else:
-                        logging.info("Global Controller: No more available nodes to add.")
-                    self.low_cluster_util_count_down = self.LOW_CYCLE_COUNT
-                elif avg_cluster_cpu_util < self.SCALE_DOWN_THRESHOLD * self.OPERATING_POINT:
-                    # DOWNSCALE
-                    # wait for at least 5 continuous cycles before scaling down
-                    self.low_cluster_util_count_down -= 1
-                    logging.critical(f"Global Controller: Attempting to scale down in...{self.low_cluster_util_count_down} cycles")
-                    if self.low_cluster_util_count_down == 0:
-                        # look for unused nodes and remove them
-                        remove_node_name = self.middleware.determine_node_to_remove()
-                        if remove_node_name:
-                            self.middleware.remove_node(remove_node_name)
-                        self.low_cluster_util_count_down = self.LOW_CYCLE_COUNT # reset
-                
-                # default case
-                # MAINTAIN and SUBMIT JOBS
-                node_name = self.middleware.determine_next_node()
-                logging.info('Global Controller: Next node to submit job: %s', node_name)
-                if node_name:
-                    if queue.has_next_job() and current_time - last_job_submission_time >= 15:
-                        job_args = queue.get_next_job().to_args_list()
-                        job = Job(node_name, job_args)
-                        job.submit()
-                        last_job_submission_time = current_time
-                    else:
-                        logging.info("Global Controller: No more jobs in the queue.")
-                        # exit the program
-                        self.middleware.save_metrics()
-                else:
-                    logging.info("Global Controller: All nodes have reached max pod capacity.")
+                started = time.perf_counter()
+                self.run_cycle(queue)
+                self.write_snapshot(queue, time.perf_counter() - started)
                 time.sleep(self.polling_interval)
 
         except KeyboardInterrupt:
             print("\nGlobal Controller: Simulation stopped by user.")
-            self.middleware.cleanup_cluster()
+            if self.is_leader():
+                self.middleware.cleanup_cluster()
+
+    # one heartbeat, scaling decision and job submission
+    def run_cycle(self, queue):
+        current_time = time.time()
+        # heartbeat
+        self.middleware.refresh_active_nodes()
+        # call local controllers to update their states based on local metrics
+        self.middleware.update_local_states()
+        # determine average cluster CPU utilization
+        avg_cluster_cpu_util = self.middleware.avg_cluster_cpu_capacity()
+        self.util_trend.update(avg_cluster_cpu_util)
+
+        # standbys keep their node state and metric history warm but do not act
+        leader = self.is_leader()
+        if leader and not self.was_leader and self.elector:
+            self.resume_from_lease(queue)
+        self.was_leader = leader
+        if not leader:
+            logging.info("Global Controller: Standby, waiting for leadership.")
+            return
+
+        # remove nodes whose drain has finished, jobs that could not start on them go back to the front of the queue
+        requeued = self.middleware.progress_drains()
+        if requeued:
+            queue.requeue([QueuedJob(" ".join(["stress-ng"] + args), tenant) for args, tenant in requeued])
+
+        # rule based global controller, the rules come from the scaling policy
+        direction, step = self.policy.decide(avg_cluster_cpu_util, current_time,
+                                             pressure=self.predicts_saturation(queue),
+                                             # queued jobs will need the capacity soon, do not give nodes back
+                                             hold_down=self.predictive and queue.has_next_job())
+        if direction == "up":
+            # UPSCALE
+            logging.critical(f"Global Controller: Attempting to scale up by {step} nodes...")
+            if self.scale_up(step):
+                self.policy.record("up", current_time)
+        elif direction == "down":
+            # DOWNSCALE
+            logging.critical(f"Global Controller: Attempting to scale down by {step} nodes...")
+            if self.scale_down(step):
+                self.policy.record("down", current_time)
+        elif self.policy.down_streak:
+            remaining = max(self.policy.policy.scale_down.stabilization_cycles - self.policy.down_streak, 0)
+            logging.critical(f"Global Controller: Attempting to scale down in...{remaining} cycles")
+
+        # default case
+        # MAINTAIN and SUBMIT JOBS
+        if self.warm_start:
+            self.warm_start.refill([node["name"] for node in self.middleware.nodes.values()
+                                    if node["is_active"] and node["healthy"] and not node["draining_since"]])
+        next_job = queue.peek_next_job()
+        resources = self.job_resources(next_job) if next_job else None
+        expected_cpu = self.middleware.cost_model.expected_cpu(next_job.stressors) if next_job else None
+        node_name = self.middleware.determine_next_node(resources, expected_cpu)
+        logging.info('Global Controller: Next node to submit job: %s', node_name)
+        if node_name:
+            if queue.has_next_job() and current_time - self.last_job_submission_time >= self.SUBMIT_INTERVAL:
+                # no more jobs than the node has slots for: indexes past them would start later outside max_pods and the ledger
+                slots = self.middleware.free_slots(node_name, resources, expected_cpu)
+                if slots == 0:
+                    logging.info(f"Global Controller: {node_name} has no free slots, not submitting.")
+                    return
+                batch = self.take_batch(queue, slots)
+                # submitted_jobs is the prefix of the queue file taken so far, jobs given back and taken again are in it
+                taken = len([job for job in batch if not job.requeued])
+                claimed = self.claim_submission(taken)
+                # taken from the queue either way, resume_from_lease counts on it
+                self.submitted_jobs += taken
+                if not claimed:
+                    logging.error("Global Controller: Lost leadership, not submitting.")
+                    return
+                self.last_job_submission_time = current_time
+                if not self.submit_batch(node_name, batch):
+                    # tried again after SUBMIT_INTERVAL, not counted a second time then
+                    logging.error(f"Global Controller: Could not submit {len(batch)} jobs, requeueing them.")
+                    queue.requeue(batch)
+                    return
+                self.submit_times.extend([current_time] * len(batch))
+            else:
+                logging.info("Global Controller: No more jobs in the queue.")
+                # exit the program
+                self.middleware.save_metrics()
+        else:
+            logging.info("Global Controller: All nodes have reached max pod capacity.")
@@ -0,0 +1,149 @@
+import logging
+import threading
+import kube
+from kube import client, watch
+
+class Informer:
+    """Keeps a local cache of Kubernetes objects in sync with list + watch.
+
+    list_fn is any list_* method of the generated clients, e.g.
+    Informer(batch_v1_api.list_namespaced_job, namespace="jobs"). Handlers are
+    called as handler(event_type, obj) from the informer thread; after a relist
+    every object is replayed as ADDED, so handlers have to be idempotent.
+
+    With extract, the list and the watch are read undecoded like
+    kube.list_compact, and the cache and the handlers get extract(raw dict)
+    instead of model objects.
+    """
+    def __init__(self, list_fn, name=None, extract=None, **list_kwargs):
+        self.list_fn = list_fn
+        self.extract = extract
+        self.list_kwargs = list_kwargs
+        self.name = name or list_fn.__name__
+        self.WATCH_TIMEOUT = 300        # seconds before the server closes a watch
+        self.RETRY_DELAY = 1            # seconds, doubled up to MAX_RETRY_DELAY on errors
+        self.MAX_RETRY_DELAY = 30
+
+        self.store = {}
+        self.handlers = []
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+        self.stopped = threading.Event()
+        self.watcher = None
+        self.thread = None
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"informer-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.watcher:
+            self.watcher.stop()
+
+    def wait_for_sync(self, timeout=None):
+        return self.synced.wait(timeout)
+
+    def items(self):
+        with self.lock:
+            return list(self.store.values())
+
+    def get(self, name, namespace=None):
+        with self.lock:
+            return self.store.get(self.key(name, namespace))
+
+    @staticmethod
+    def key(name, namespace=None):
+        return f"{namespace}/{name}" if namespace else name
+
+    @classmethod
+    def raw_key(cls, obj):
+        return cls.key(kube.field(obj, "metadata.name"), kube.field(obj, "metadata.namespace"))
+
+    def dispatch(self, event_type, obj, key=None):
+        key = key or self.key(obj.metadata.name, obj.metadata.namespace)
+        with self.lock:
+            if event_type == "DELETED":
+                self.store.pop(key, None)
+            else:
+                self.store[key] = obj
+        for handler in self.handlers:
+            try:
+                handler(event_type, obj)
+            except Exception as e:
+                logging.error(f"Informer {self.name}: Handler failed: {e}")
+
+    def relist(self):
+        if self.extract:
+            list_meta = {}
+            objects = kube.list_compact(self.list_fn, lambda item: (self.raw_key(item), self.extract(item)),
+                                        list_meta=list_meta, **self.list_kwargs)
+            resource_version = list_meta.get("resourceVersion")
+        else:
+            response = self.list_fn(**self.list_kwargs)
+            objects = [(self.key(obj.metadata.name, obj.metadata.namespace), obj) for obj in response.items]
+            resource_version = response.metadata.resource_version
+        with self.lock:
+            stale = set(self.store)
+        for key, obj in objects:
+            stale.discard(key)
+            self.dispatch("ADDED", obj, key)
+        # objects deleted while we were not watching
+        for key in stale:
+            with self.lock:
+                obj = self.store.get(key)
+            if obj is not None:
+                self.dispatch("DELETED", obj, key)
+        self.synced.set()
+        return resource_version
+
+    def compact_events(self, resource_version):
+        """Watch events with the object as a raw dict, the watch side of kube.list_compact."""
+        response = self.list_fn(watch=True, resource_version=resource_version, timeout_seconds=self.WATCH_TIMEOUT,
+                                _preload_content=False, **self.list_kwargs)
+        try:
+            for line in watch.watch.iter_resp_lines(response):
+                if self.stopped.is_set():
+                    return
+                if line.strip():
+                    yield kube.json_loads(line)
+        finally:
+            response.release_conn()
+
+    def run(self):
+        delay = self.RETRY_DELAY
+        resource_version = None
+        while not self.stopped.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self.relist()
+                if self.extract:
+                    events = self.compact_events(resource_version)
+                else:
+                    self.watcher = watch.Watch()
+                    events = self.watcher.stream(self.list_fn, resource_version=resource_version,
+                                                 timeout_seconds=self.WATCH_TIMEOUT, **self.list_kwargs)
+                for event in events:
+                    if event["type"] == "ERROR":
+                        # typically 410 Gone, the resource version is too old
+                        resource_version = None
+                        break
+                    obj = event["object"]
+                    if self.extract:
+                        resource_version = kube.field(obj, "metadata.resourceVersion")
+                        self.dispatch(event["type"], self.extract(obj), self.raw_key(obj))
+                    else:
+                        resource_version = obj.metadata.resource_version
+                        self.dispatch(event["type"], obj)
+                delay = self.RETRY_DELAY
+            except Exception as e:
+                resource_version = None
+                if isinstance(e, client.ApiException) and e.status == 410:
+                    continue
+                logging.error(f"Informer {self.name}: Watch failed: {e}")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
@@ -0,0 +1,130 @@
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jobs.queue import Job
+
+class JobIngestServer:
+    """Local HTTP endpoint that enqueues jobs into a running controller.
+
+    POST /jobs  {"tenant": "svc-a", "cmd": "stress-ng --cpu 2 --timeout 60s"}
+                {"tenant": "svc-a", "jobs": ["stress-ng ...", "stress-ng ..."]}
+    GET  /status
+
+    Producers are slowed down once the queue passes SOFT_LIMIT of its capacity
+    and rejected with 429 (and a Retry-After hint) once the queue is full or the
+    cluster pod budget (Middleware.MAX_CLUSTER_PODS) is saturated.
+    """
+    def __init__(self, queue, middleware=None, host="127.0.0.1", port=8080):
+        self.queue = queue
+        self.middleware = middleware
+        self.host = host
+        self.port = port
+
+        self.MAX_QUEUE_DEPTH = 1000
+        self.MAX_TENANT_DEPTH = 250
+        self.SOFT_LIMIT = 0.8           # fraction of MAX_QUEUE_DEPTH where producers get delayed
+        self.MAX_DELAY = 0.5            # seconds, keeps enqueue latency sub-second
+        self.SATURATION_THRESHOLD = 1.0 # running pods / MAX_CLUSTER_PODS
+        self.RETRY_AFTER = 15           # seconds, one controller polling interval
+
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        ingest = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/jobs":
+                    return self.reply(404, {"error": "not found"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    tenant, cmds = ingest.parse_request(request)
+                except (ValueError, TypeError) as e:
+                    return self.reply(400, {"error": str(e)})
+                status, body = ingest.submit(tenant, cmds)
+                self.reply(status, body)
+
+            def do_GET(self):
+                if self.path != "/status":
+                    return self.reply(404, {"error": "not found"})
+                self.reply(200, ingest.status())
+
+            def reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if status == 429:
+                    self.send_header("Retry-After", str(ingest.RETRY_AFTER))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Job Ingest: {self.address_string()} {format % args}")
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="job-ingest", daemon=True)
+        self.thread.start()
+        logging.info(f"Job Ingest: Listening on http://{self.host}:{self.server.server_port}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def parse_request(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("request body must be a JSON object")
+        tenant = str(request.get("tenant") or self.queue.default_tenant)
+        if "jobs" in request:
+            cmds = request["jobs"]
+        elif "cmd" in request:
+            cmds = [request["cmd"]]
+        else:
+            raise ValueError("expected 'cmd' or 'jobs'")
+        if not isinstance(cmds, list) or not all(isinstance(cmd, str) and cmd.strip() for cmd in cmds):
+            raise ValueError("jobs must be non-empty command strings")
+        return tenant, cmds
+
+    def submit(self, tenant, cmds):
+        # a first look, the limits are enforced again where the jobs go in, under the queue lock
+        depth = self.queue.depth()
+        if depth + len(cmds) > self.MAX_QUEUE_DEPTH:
+            return 429, {"error": "queue full", "depth": depth}
+        if self.queue.depth(tenant) + len(cmds) > self.MAX_TENANT_DEPTH:
+            return 429, {"error": "tenant queue full", "tenant": tenant}
+        if self.middleware and self.middleware.cluster_saturation() >= self.SATURATION_THRESHOLD:
+            return 429, {"error": "cluster saturated", "max_cluster_pods": self.middleware.MAX_CLUSTER_PODS}
+
+        try:
+            jobs = [Job(cmd=cmd.strip()) for cmd in cmds]
+        except (ValueError, IndexError) as e:
+            return 400, {"error": f"invalid stress-ng command: {e}"}
+
+        # slow producers down linearly between the soft limit and a full queue
+        soft_depth = self.SOFT_LIMIT * self.MAX_QUEUE_DEPTH
+        if depth > soft_depth:
+            time.sleep(self.MAX_DELAY * (depth - soft_depth) / (self.MAX_QUEUE_DEPTH - soft_depth))
+
+        # concurrent requests all passed the first look, only the ones that still fit get in
+        full = self.queue.put_many_within(jobs, tenant, self.MAX_QUEUE_DEPTH, self.MAX_TENANT_DEPTH)
+        if full == "queue":
+            return 429, {"error": "queue full", "depth": self.queue.depth()}
+        if full == "tenant":
+            return 429, {"error": "tenant queue full", "tenant": tenant}
+        logging.info(f"Job Ingest: Accepted {len(jobs)} job(s) from tenant {tenant}")
+        return 202, {"accepted": len(jobs), "tenant": tenant, "depth": self.queue.depth()}
+
+    def status(self):
+        status = {"depth": self.queue.depth(), "tenants": self.queue.depths()}
+        if self.middleware:
+            status["max_cluster_pods"] = self.middleware.MAX_CLUSTER_PODS
+            status["saturation"] = self.middleware.cluster_saturation()
+        return status
@@ -1,37 +1,161 @@
 import logging
-from kubernetes import client, config
+import kube
+from kube import client
+import time
 import uuid
+import shlex
+import json
+from jobs.queue import parse_duration
+
+# stress-ng --timeout of the job in seconds, set on the job pods so a drain can tell how long they still run
+TIMEOUT_ANNOTATION = "timeout-seconds"
+STRESSOR_LABEL_PREFIX = "stress-"
+# warm_start.WarmStart pool pods: "idle" while they wait for a job, "taken" once handed one
+WARM_POOL_LABEL = "warm-pool"
+# job pods without the idle pool pods, which run nothing yet
+JOB_POD_SELECTOR = f"{WARM_POOL_LABEL}!=idle"
+# set by the Job controller on the pods of an Indexed Job
+COMPLETION_INDEX_ANNOTATION = "batch.kubernetes.io/job-completion-index"
+# JSON list with the TenantJobQueue tenant of every completion index, a requeued job goes back to its tenant
+TENANTS_ANNOTATION = "tenants"
+
+def args_timeout_seconds(args):
+    """--timeout from a stress-ng argument list ("60", "60s", "5m", "1h"), None if missing."""
+    if "--timeout" not in args or args.index("--timeout") + 1 >= len(args):
+        return None
+    return parse_duration(args[args.index("--timeout") + 1])
+
+def nodetype_label(node_name):
+    """nodetype label of a node, the node affinity of its job pods asks for it."""
+    return f"worker{node_name.split('.')[0].replace('node', '')}"
+
+def stressor_labels(args):
+    """stress-cpu/stress-io/stress-vm pod labels with the worker counts, per pod CPU usage is attributed by them."""
+    labels = {}
+    for name in ("cpu", "io", "vm"):
+        option = f"--{name}"
+        if option in args and args.index(option) + 1 < len(args):
+            labels[f"{STRESSOR_LABEL_PREFIX}{name}"] = str(args[args.index(option) + 1])
+    return labels
+
+def pod_remaining_seconds(pod, now=None):
+    """Seconds a running job pod still needs until its --timeout, None if unknown."""
+    annotations = pod.metadata.annotations or {}
+    if TIMEOUT_ANNOTATION in annotations:
+        timeout = float(annotations[TIMEOUT_ANNOTATION])
+    else:
+        # jobs submitted before the annotation existed
+        containers = pod.spec.containers or []
+        timeout = args_timeout_seconds(containers[0].args or []) if containers else None
+    if timeout is None:
+        return None
+    if not pod.status or not pod.status.start_time:
+        return timeout
+    elapsed = (now or time.time()) - pod.status.start_time.timestamp()
+    return max(timeout - elapsed, 0.0)
+
+def pod_job_args(pod):
+    """stress-ng arguments a job pod runs, the line of its completion index for an Indexed Job pod."""
+    container = pod.spec.containers[0]
+    if container.args:
+        return list(container.args)
+    index = (pod.metadata.annotations or {}).get(COMPLETION_INDEX_ANNOTATION)
+    if index is None or not container.command:
+        return None
+    for line in container.command[-1].splitlines():
+        case, _, args = line.partition(") exec stress-ng ")
+        if args and case.strip() == index:
+            return shlex.split(args.rstrip(" ;"))
+    return None
+
+def pod_tenant(pod):
+    """Tenant the job of a job pod was queued for, None if it had none."""
+    annotations = pod.metadata.annotations or {}
+    if TENANTS_ANNOTATION not in annotations:
+        return None
+    tenants = json.loads(annotations[TENANTS_ANNOTATION])
+    index = int(annotations.get(COMPLETION_INDEX_ANNOTATION, 0))
+    return tenants[index] if index < len(tenants) else None
+
+def pod_nodetype(pod):
+    """nodetype the node affinity of a job pod asks for, None without one."""
+    affinity = pod.spec.affinity
+    if not affinity or not affinity.node_affinity or not affinity.node_affinity.required_during_scheduling_ignored_during_execution:
+        return None
+    for term in affinity.node_affinity.required_during_scheduling_ignored_during_execution.node_selector_terms or []:
+        for expression in term.match_expressions or []:
+            if expression.key == "nodetype" and expression.values:
+                return expression.values[0]
+    return None
+
+def resource_requirements(resources):
+    """V1ResourceRequirements from Job.resources() (cores and bytes), None without resources."""
+    if not resources:
+        return None
+    def quantities(values):
+        result = {}
+        if values.get("cpu") is not None:
+            result["cpu"] = f"{max(round(values['cpu'] * 1000), 1)}m"
+        if values.get("memory") is not None:
+            result["memory"] = str(int(values["memory"]))
+        return result or None
+    return client.V1ResourceRequirements(requests=quantities(resources.get("requests", {})),
+                                         limits=quantities(resources.get("limits", {})))
 
 class JobSubmitter:
-    def __init__(self, node_name, job_args):
+    def __init__(self, node_name, job_args, enqueued_at=None, resources=None, tenant=None):
         self.job_args = job_args
+        self.enqueued_at = enqueued_at
+        self.tenants = [tenant] if tenant else None
+        # requests and limits from Job.resources(), the scheduler and the Middleware ledger count them
+        self.resources = resources
         self.node_name = node_name.split('.')[0]
         self.worker_number = self.node_name.replace('node', '')
+        self.nodetype = nodetype_label(node_name)
 
         self.image = "polinux/stress-ng"
         self.namespace = 'jobs'
 
-        config.load_kube_config()
-        self.batch_v1_api = client.BatchV1Api()
-        self.core_v1_api = client.CoreV1Api()
+        self.batch_v1_api = kube.batch_v1()
+        self.core_v1_api = kube.core_v1()
 
         self.create_namespace_if_not_exists()
 
 
+    # namespaces already known to exist, checked once per process instead of once per job
+    known_namespaces = set()
+
+    # False if the namespace could not be read or created, the job is not submitted then
     def create_namespace_if_not_exists(self):
+        if self.namespace in JobSubmitter.known_namespaces:
+            return True
         try:
             self.core_v1_api.read_namespace(name=self.namespace)
         except client.exceptions.ApiException as e:
-            if e.status == 404:
-                namespace = client.V1Namespace(
-                    metadata=client.V1ObjectMeta(name=self.namespace)
-                )
+            if e.status != 404:
+                logging.error(f"Job Queue: Failed to read namespace {self.namespace}: {e}")
+                return False
+            namespace = client.V1Namespace(
+                metadata=client.V1ObjectMeta(name=self.namespace)
+            )
+            try:
                 self.core_v1_api.create_namespace(body=namespace)
                 print(f"Created namespace: {self.namespace}")
+            except client.exceptions.ApiException as e:
+                # 409: created by someone else in the meantime
+                if e.status != 409:
+                    logging.error(f"Job Queue: Failed to create namespace {self.namespace}: {e}")
+                    return False
+        JobSubmitter.known_namespaces.add(self.namespace)
+        return True
 
     def create_job(self):
         job_id = str(uuid.uuid4())[:8]
         job_name = f"job-node{self.worker_number}-{job_id}"
+        timeout = args_timeout_seconds(self.job_args)
+        pod_annotations = {TIMEOUT_ANNOTATION: str(timeout)} if timeout is not None else {}
+        if self.tenants:
+            pod_annotations[TENANTS_ANNOTATION] = json.dumps(self.tenants)
 
         job = client.V1Job(
             api_version="batch/v1",
@@ -42,6 +166,11 @@ class JobSubmitter:
                 labels={
                     "app": f"job-node{self.worker_number}",
                     "job-id": job_id
+                },
+                # read back by the JobTracker to compute queue wait and latency
+                annotations={
+                    "enqueued-at": str(self.enqueued_at or time.time()),
+                    "submitted-at": str(time.time())
                 }
             ),
             spec=client.V1JobSpec(
@@ -49,17 +178,19 @@ class JobSubmitter:
                 backoff_limit=0,
                 template=client.V1PodTemplateSpec(
                     metadata=client.V1ObjectMeta(
-                        labels={
+                        labels=dict({
                             "app": f"job-node{self.worker_number}",
                             "job-id": job_id
-                        }
+                        }, **stressor_labels(self.job_args)),
+                        annotations=pod_annotations or None
                     ),
                     spec=client.V1PodSpec(
                         containers=[
                             client.V1Container(
                                 name="job",
                                 image=self.image,
-                                args=self.job_args
+                                args=self.job_args,
+                                resources=resource_requirements(self.resources)
                             )
                         ],
                         restart_policy="Never",
@@ -72,7 +203,7 @@ class JobSubmitter:
                                                 client.V1NodeSelectorRequirement(
                                                     key="nodetype",
                                                     operator="In",
-                                                    values=[f"worker{self.worker_number}"]
+                                                    values=[self.nodetype]
                                                 )
                                             ]
                                         )
@@ -94,9 +225,62 @@ class JobSubmitter:
         return job
 
     def submit(self):
+        """False if the job was not submitted: its namespace is not there or the Job was rejected."""
+        if not self.create_namespace_if_not_exists():
+            return False
         logging.info(f"Job Queue: Submitting job: {self.job_args}")
-        job = self.create_job()
-        self.batch_v1_api.create_namespaced_job(namespace=self.namespace, body=job)
+        return self.create(self.create_job())
+
+    def create(self, job):
+        # 422 invalid spec, 403 quota exceeded, ...: the caller requeues the job instead of stopping
+        try:
+            self.batch_v1_api.create_namespaced_job(namespace=self.namespace, body=job)
+        except client.exceptions.ApiException as e:
+            logging.error(f"Job Queue: Failed to create job {job.metadata.name}: {e.status} {e.reason}")
+            return False
+        return True
+
+class IndexedJobSubmitter(JobSubmitter):
+    """Submits a batch of compatible jobs as one Indexed Job.
+
+    One create call and one Job object instead of one per queued line: every
+    completion index runs the stress-ng arguments of one job, picked from a
+    shell case over $JOB_COMPLETION_INDEX. All indexes run at once
+    (parallelism == completions), so the batch must fit the node's free slots.
+    The jobs share the pod template, so they must have the same resources,
+    --timeout and worker counts (Job.batch_key): the stressor labels of the
+    first job stand for all of them. The JobTracker records every index as a job of its own.
+    """
+    def __init__(self, node_name, jobs_args, enqueued_at=None, resources=None, tenants=None):
+        super().__init__(node_name, jobs_args[0], enqueued_at, resources)
+        self.jobs_args = jobs_args
+        # one per index, a batch may hold jobs of several tenants
+        self.tenants = tenants if tenants and any(tenants) else None
+
+    def index_script(self):
+        cases = "\n".join(f"{index}) exec stress-ng {shlex.join(args)} ;;" for index, args in enumerate(self.jobs_args))
+        return f'case "$JOB_COMPLETION_INDEX" in\n{cases}\nesac'
+
+    def create_job(self):
+        job = super().create_job()
+        job.metadata.labels["batch-size"] = str(len(self.jobs_args))
+        job.spec.completion_mode = "Indexed"
+        job.spec.completions = len(self.jobs_args)
+        job.spec.parallelism = len(self.jobs_args)
+        # a failed index must not stop the others, and is not retried either
+        job.spec.backoff_limit = None
+        job.spec.backoff_limit_per_index = 0
+        job.spec.max_failed_indexes = len(self.jobs_args)
+        container = job.spec.template.spec.containers[0]
+        container.command = ["/bin/sh", "-c", self.index_script()]
+        container.args = None
+        return job
+
+    def submit(self):
+        if not self.create_namespace_if_not_exists():
+            return False
+        logging.info(f"Job Queue: Submitting {len(self.jobs_args)} jobs as one Indexed Job")
+        return self.create(self.create_job())
 
 # Usage example
 if __name__ == "__main__":
@@ -1,17 +1,48 @@
 from queue import Queue
+from collections import deque, OrderedDict
 from typing import Optional
 from dataclasses import dataclass, field
+import threading
+import time
 import re
 
+def parse_duration(value) -> float:
+    """stress-ng style duration ("60", "60s", "5m", "1h", "1d") in seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = str(value)
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def parse_size(value) -> float:
+    """stress-ng style size ("256M", "4G", "512k", "1024b") in bytes, binary units."""
+    units = {"b": 1, "k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+    value = str(value)
+    if value[-1].lower() in units:
+        return float(value[:-1]) * units[value[-1].lower()]
+    return float(value)
+
 @dataclass
 class Job:
     cmd: str
     stressors: dict = field(default_factory=dict)
     duration: Optional[str] = None
+    enqueued_at: Optional[float] = None
+    # put back after it was taken once (requeue), GlobalController.submitted_jobs already counts it
+    requeued: bool = False
+    # TenantJobQueue tenant it was enqueued for, requeue() puts it back there
+    tenant: Optional[str] = None
+
+    VM_BYTES_DEFAULT = "256M"       # stress-ng --vm-bytes default, per --vm worker
+    IO_WORKER_CPU = 0.1             # cores an --io worker uses
+    BASE_MEMORY = 64 * 2 ** 20      # bytes for stress-ng itself
 
-    def __init__(self, cmd: str):
+    def __init__(self, cmd: str, tenant: Optional[str] = None):
         self.cmd = cmd
         self.stressors = self.parse_stressors(cmd)
+        self.enqueued_at = time.time()
+        self.requeued = False
+        self.tenant = tenant
         
     def parse_stressors(self, cmd: str) -> dict:
         """Parse the stress-ng command options and store them in a dictionary."""
@@ -40,6 +71,52 @@ class Job:
 
         return stressors
 
+    @property
+    def cpu(self) -> int:
+        return self.stressors.get("cpu", 1)
+
+    def resources(self, cpu_overcommit: float = 1.0, largest: Optional[dict] = None) -> dict:
+        """Pod requests and limits from the stressors: cores and bytes.
+
+        Every --cpu and --vm worker keeps a core busy, --io workers mostly wait
+        on sync. --vm workers each allocate --vm-bytes (stress-ng default 256M,
+        percentages of free memory count as the default). CPU requests are the
+        limits divided by cpu_overcommit; memory is not overcommitted since
+        running out of it gets pods OOM killed instead of throttled.
+
+        The scheduler never binds a pod that requests more than a node's
+        allocatable, so requests are capped at `largest`, the allocatable of
+        the largest node, when given. Such a job takes a whole node and its
+        limits stay as they are.
+        """
+        vm = self.stressors.get("vm", 0)
+        vm_bytes = str(self.stressors.get("vm-bytes", self.VM_BYTES_DEFAULT))
+        if vm_bytes.endswith("%"):
+            vm_bytes = self.VM_BYTES_DEFAULT
+        # --cpu 0 runs one worker per online CPU, no telling how many that is: request one, no limit
+        cpu_workers = self.stressors.get("cpu", 0) or (1 if "cpu" in self.stressors else 0)
+        cpu_limit = max(cpu_workers + vm + self.IO_WORKER_CPU * self.stressors.get("io", 0), self.IO_WORKER_CPU)
+        memory = self.BASE_MEMORY + vm * parse_size(vm_bytes)
+        requests = {"cpu": cpu_limit / cpu_overcommit, "memory": memory}
+        if largest:
+            requests = {resource: min(amount, largest[resource]) for resource, amount in requests.items()}
+        return {
+            "requests": requests,
+            "limits": {"cpu": cpu_limit if self.stressors.get("cpu") != 0 else None, "memory": memory},
+        }
+
+    def batch_key(self) -> tuple:
+        """Jobs with equal keys can share an Indexed Job's pod template, stressor labels included."""
+        resources = self.resources()
+        workers = tuple(self.stressors.get(name, 0) for name in ("cpu", "io", "vm"))
+        return (self.timeout_seconds, workers, tuple(sorted(resources["requests"].items())), tuple(sorted(resources["limits"].items())))
+
+    @property
+    def timeout_seconds(self) -> Optional[float]:
+        """stress-ng --timeout (e.g. "60", "60s", "5m", "1h") in seconds, None if not set."""
+        timeout = self.stressors.get("timeout")
+        return parse_duration(timeout) if timeout is not None else None
+
     def to_args_list(self) -> list:
         args = []
         for key, value in self.stressors.items():
@@ -50,6 +127,18 @@ class Job:
         args.append("--metrics-brief")
         return args
 
+def summarize_backlog(jobs) -> dict:
+    """Queued work: job count, total --cpu workers and cpu-seconds (--cpu x --timeout).
+    Jobs without a timeout count with the mean timeout of the others."""
+    timeouts = [job.timeout_seconds for job in jobs if job.timeout_seconds is not None]
+    mean_timeout = sum(timeouts) / len(timeouts) if timeouts else 0.0
+    return {
+        "jobs": len(jobs),
+        "cpu": sum(job.cpu for job in jobs),
+        "cpu_seconds": sum(job.cpu * (job.timeout_seconds if job.timeout_seconds is not None else mean_timeout) for job in jobs),
+        "mean_timeout": mean_timeout,
+    }
+
 class JobQueue:
     def __init__(self, queue_file: str):
         self.queue_file = queue_file
@@ -72,4 +161,139 @@ class JobQueue:
         return None
 
     def has_next_job(self) -> bool:
-        return not self.job_queue.empty()
\ No newline at end of file
+        return not self.job_queue.empty()
+
+    def requeue(self, jobs: list):
+        """Put jobs back in front of the queue, in their order, e.g. those taken back from a draining node."""
+        for job in jobs:
+            job.requeued = True
+        with self.job_queue.mutex:
+            self.job_queue.queue.extendleft(reversed(jobs))
+            self.job_queue.unfinished_tasks += len(jobs)
+            self.job_queue.not_empty.notify(len(jobs))
+
+    def peek_next_job(self) -> Optional[Job]:
+        with self.job_queue.mutex:
+            return self.job_queue.queue[0] if self.job_queue.queue else None
+
+    def depth(self) -> int:
+        return self.job_queue.qsize()
+
+    def backlog(self) -> dict:
+        with self.job_queue.mutex:
+            jobs = list(self.job_queue.queue)
+        return summarize_backlog(jobs)
+
+class TenantJobQueue:
+    """Per-tenant job queues served in weighted round-robin (fair share) order.
+
+    Exposes the same get_next_job/has_next_job interface as JobQueue so the
+    GlobalController can consume it unchanged. Safe to fill from the ingestion
+    server threads while the controller drains it.
+    """
+    def __init__(self, queue_file: Optional[str] = None, default_tenant: str = "default", weights: Optional[dict] = None):
+        self.default_tenant = default_tenant
+        self.weights = weights or {}
+        self.queues = OrderedDict()     # tenant -> deque of Job
+        self.credits = {}               # tenant -> jobs left in the current round
+        self.lock = threading.Lock()
+        if queue_file:
+            self.load_jobs(queue_file)
+
+    def load_jobs(self, queue_file: str):
+        try:
+            with open(queue_file, 'r') as f:
+                self.put_many([Job(cmd=line.strip()) for line in f], self.default_tenant)
+        except Exception as e:
+            print(f"Error loading job queue: {e}")
+
+    def put(self, job: Job, tenant: Optional[str] = None):
+        self.put_many([job], tenant)
+
+    def put_many(self, jobs: list, tenant: Optional[str] = None):
+        tenant = tenant or self.default_tenant
+        if not jobs:
+            return
+        for job in jobs:
+            job.tenant = tenant
+        with self.lock:
+            self.tenant_queue(tenant).extend(jobs)
+
+    def put_many_within(self, jobs: list, tenant: Optional[str], max_depth: int, max_tenant_depth: int) -> Optional[str]:
+        """put_many unless it takes the queue past max_depth or the tenant past max_tenant_depth,
+        checked and inserted under one lock; the limit that was hit, None if the jobs were added."""
+        tenant = tenant or self.default_tenant
+        if not jobs:
+            return None
+        for job in jobs:
+            job.tenant = tenant
+        with self.lock:
+            if sum(len(queued) for queued in self.queues.values()) + len(jobs) > max_depth:
+                return "queue"
+            if len(self.queues.get(tenant, ())) + len(jobs) > max_tenant_depth:
+                return "tenant"
+            self.tenant_queue(tenant).extend(jobs)
+        return None
+
+    # caller holds self.lock
+    def tenant_queue(self, tenant: str) -> deque:
+        if tenant not in self.queues:
+            self.queues[tenant] = deque()
+            self.credits[tenant] = self.weights.get(tenant, 1)
+        return self.queues[tenant]
+
+    def requeue(self, jobs: list, tenant: Optional[str] = None):
+        """Put jobs back in front of their tenants' queues, in their order; tenant for jobs that lost theirs."""
+        for job in jobs:
+            job.requeued = True
+        with self.lock:
+            for job in reversed(jobs):
+                self.tenant_queue(job.tenant or tenant or self.default_tenant).appendleft(job)
+
+    def get_next_job(self) -> Optional[Job]:
+        with self.lock:
+            # visit tenants in round-robin order, each one may take `weight` jobs per round
+            for _ in range(2 * len(self.queues)):
+                if not self.queues:
+                    return None
+                tenant, jobs = next(iter(self.queues.items()))
+                if jobs and self.credits[tenant] > 0:
+                    self.credits[tenant] -= 1
+                    job = jobs.popleft()
+                    if not jobs:
+                        # drop idle tenants so they do not hold a turn
+                        del self.queues[tenant]
+                        del self.credits[tenant]
+                    return job
+                # turn used up, move tenant to the back and refill its credits
+                self.queues.move_to_end(tenant)
+                self.credits[tenant] = self.weights.get(tenant, 1)
+            return None
+
+    def has_next_job(self) -> bool:
+        with self.lock:
+            return any(self.queues.values())
+
+    def peek_next_job(self) -> Optional[Job]:
+        """The job get_next_job would return, left in the queue."""
+        with self.lock:
+            # the first tenant with credits left, else every turn is used up and the round starts over
+            for tenant, jobs in self.queues.items():
+                if jobs and self.credits[tenant] > 0:
+                    return jobs[0]
+            return next((jobs[0] for jobs in self.queues.values() if jobs), None)
+
+    def depth(self, tenant: Optional[str] = None) -> int:
+        with self.lock:
+            if tenant is not None:
+                return len(self.queues.get(tenant, ()))
+            return sum(len(jobs) for jobs in self.queues.values())
+
+    def depths(self) -> dict:
+        with self.lock:
+            return {tenant: len(jobs) for tenant, jobs in self.queues.items()}
+
+    def backlog(self) -> dict:
+        with self.lock:
+            jobs = [job for jobs in self.queues.values() for job in jobs]
+        return summarize_backlog(jobs)
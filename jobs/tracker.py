@@ -0,0 +1,155 @@
+import time
+import logging
+import threading
+import kube
+
+from informer import Informer
+from jobs.job import COMPLETION_INDEX_ANNOTATION
+
+LATENCY_METRICS = ["queue_wait", "scheduling_latency", "start_latency", "runtime", "total_latency"]
+
+def percentile(values, q):
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def summarize_jobs(records, percentiles=(50, 90, 99)):
+    summary = {}
+    for metric in LATENCY_METRICS:
+        values = [record[metric] for record in records if record.get(metric) is not None]
+        summary[metric] = {"count": len(values)}
+        for q in percentiles:
+            summary[metric][f"p{q}"] = percentile(values, q)
+    summary["failed"] = len([record for record in records if record["status"] != "succeeded"])
+    summary["total"] = len(records)
+    return summary
+
+def to_epoch(timestamp):
+    return timestamp.timestamp() if timestamp else None
+
+class JobTracker:
+    """Watches Jobs and their pods in the jobs namespace and records, per job,
+    queue wait (enqueue -> submit), scheduling latency (submit -> pod scheduled),
+    start latency (submit -> container start, image pull included), runtime
+    (container start -> finish) and the final status. An Indexed Job batch
+    gets one record per completion index, timed by that index's pod.
+
+    Records are appended to metrics["jobs"], normally Middleware.cluster_metrics,
+    before the Job's ttl_seconds_after_finished removes it.
+    """
+    def __init__(self, metrics=None, namespace="jobs"):
+        self.namespace = namespace
+        self.metrics = metrics if metrics is not None else {}
+        self.metrics.setdefault("jobs", [])
+
+        self.batch_v1_api = kube.batch_v1()
+        self.core_v1_api = kube.core_v1()
+
+        self.pod_times = {}         # job name -> completion index (None for a plain Job) -> {"scheduled_at", "started_at", "finished_at", "status", "node"}
+        self.recorded = set()       # job uids already recorded
+        self.lock = threading.Lock()
+
+        self.job_informer = Informer(self.batch_v1_api.list_namespaced_job, name="jobs", namespace=self.namespace)
+        self.pod_informer = Informer(self.core_v1_api.list_namespaced_pod, name="job-pods", namespace=self.namespace)
+        self.pod_informer.add_handler(self.on_pod_event)
+        self.job_informer.add_handler(self.on_job_event)
+
+    def start(self):
+        # pods first, so their timings are known when a job finishes; done in the
+        # background so the controller does not wait for the initial list
+        def start_informers():
+            self.pod_informer.start()
+            self.pod_informer.wait_for_sync(timeout=10)
+            self.job_informer.start()
+        threading.Thread(target=start_informers, name="job-tracker-start", daemon=True).start()
+
+    def stop(self):
+        self.job_informer.stop()
+        self.pod_informer.stop()
+
+    def on_pod_event(self, event_type, pod):
+        job_name = (pod.metadata.labels or {}).get("job-name")
+        if not job_name or event_type == "DELETED" or not pod.status:
+            return
+        index = (pod.metadata.annotations or {}).get(COMPLETION_INDEX_ANNOTATION)
+        times = {"node": pod.spec.node_name}
+        for condition in pod.status.conditions or []:
+            if condition.type == "PodScheduled" and condition.status == "True":
+                times["scheduled_at"] = to_epoch(condition.last_transition_time)
+        for container in pod.status.container_statuses or []:
+            state = container.state
+            if state and state.running:
+                times["started_at"] = to_epoch(state.running.started_at)
+            elif state and state.terminated:
+                times["started_at"] = to_epoch(state.terminated.started_at)
+                times["finished_at"] = to_epoch(state.terminated.finished_at)
+                times["status"] = "succeeded" if state.terminated.exit_code == 0 else "failed"
+        with self.lock:
+            self.pod_times.setdefault(job_name, {}).setdefault(index, {}).update({k: v for k, v in times.items() if v})
+
+    def on_job_event(self, event_type, job):
+        status = job.status
+        finished_at = None
+        result = None
+        for condition in (status.conditions if status else None) or []:
+            if condition.type in ("Complete", "Failed") and condition.status == "True":
+                result = "succeeded" if condition.type == "Complete" else "failed"
+                finished_at = to_epoch(condition.last_transition_time)
+        if result == "succeeded" and status.completion_time:
+            finished_at = to_epoch(status.completion_time)
+        if result is None and event_type == "DELETED":
+            # removed before it finished, e.g. by Middleware.cleanup_node
+            result = "deleted"
+            finished_at = time.time()
+        if result is None:
+            return
+        with self.lock:
+            if job.metadata.uid in self.recorded:
+                return
+            self.recorded.add(job.metadata.uid)
+            pod_times = self.pod_times.pop(job.metadata.name, {})
+        self.record(job, result, finished_at, pod_times)
+
+    def record(self, job, result, finished_at, pod_times):
+        if job.spec and job.spec.completion_mode == "Indexed":
+            # every index is a queued job of its own, with its own start and finish
+            for index in range(job.spec.completions or 0):
+                times = pod_times.get(str(index), {})
+                self.record_one(job, f"{job.metadata.name}/{index}", times.get("status", result),
+                                times.get("finished_at", finished_at), times)
+        else:
+            self.record_one(job, job.metadata.name, result, finished_at, pod_times.get(None, {}))
+
+    def record_one(self, job, name, result, finished_at, pod_times):
+        annotations = job.metadata.annotations or {}
+        enqueued_at = float(annotations["enqueued-at"]) if "enqueued-at" in annotations else None
+        submitted_at = float(annotations.get("submitted-at", 0)) or to_epoch(job.metadata.creation_timestamp)
+        scheduled_at = pod_times.get("scheduled_at")
+        started_at = pod_times.get("started_at") or to_epoch(job.status.start_time)
+
+        def elapsed(start, end):
+            return max(end - start, 0.0) if start and end else None
+
+        record = {
+            "job": name,
+            "node": pod_times.get("node"),
+            "status": result,
+            "enqueued_at": enqueued_at,
+            "submitted_at": submitted_at,
+            "finished_at": finished_at,
+            "queue_wait": elapsed(enqueued_at, submitted_at),
+            "scheduling_latency": elapsed(submitted_at, scheduled_at),
+            "start_latency": elapsed(submitted_at, pod_times.get("started_at")),
+            "runtime": elapsed(started_at, finished_at),
+            "total_latency": elapsed(enqueued_at or submitted_at, finished_at),
+        }
+        self.metrics["jobs"].append(record)
+        logging.info(f"Job Tracker: {record['job']} {result}, queue wait {record['queue_wait']}s, runtime {record['runtime']}s")
+
+    def summary(self):
+        return summarize_jobs(list(self.metrics["jobs"]))
@@ -0,0 +1,266 @@
+import json
+import time
+import random
+import logging
+import functools
+import importlib
+import threading
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    `from kube import client` is cheap at import time; the kubernetes package
+    (and its generated models) is only loaded once the controller makes its
+    first API call or builds its first object.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+client = LazyModule("kubernetes.client")
+watch = LazyModule("kubernetes.watch")
+
+_lock = threading.Lock()
+_api_client = None
+_apis = {}
+
+class TokenBucket:
+    """Client-side QPS/burst limit shared by the API calls of the process.
+
+    Tokens refill at `qps` up to `burst`. Lower priority lanes leave part of
+    the burst to the lanes above them: a "submission" call only gets a token
+    while half the burst remains, so heartbeats and metrics keep flowing
+    while a bulk submission drains the bucket.
+    """
+    LANE_RESERVE = {"heartbeat": 0.0, "default": 0.25, "submission": 0.5}
+
+    def __init__(self, qps=20.0, burst=40):
+        self.qps = qps
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, lane="default"):
+        """Takes a token, waiting for one if needed; returns the seconds waited."""
+        needed = min(1 + self.LANE_RESERVE[lane] * self.burst, self.burst)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= 1
+                    return waited
+                wait = (needed - self.tokens) / self.qps
+            time.sleep(wait)
+            waited += wait
+
+class EndpointStats:
+    """Calls, errors, retries, throttling and latency per API method."""
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency, throttled=0.0, error=False, retried=False):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "throttled_s": 0.0,
+                                                         "latency_s": 0.0, "max_latency_s": 0.0})
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += int(retried)
+            stats["throttled_s"] += throttled
+            stats["latency_s"] += latency
+            stats["max_latency_s"] = max(stats["max_latency_s"], latency)
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: dict(stats, mean_latency_s=stats["latency_s"] / stats["calls"])
+                    for endpoint, stats in self.endpoints.items()}
+
+# heartbeat before everything else, bulk submission last
+LANES = {
+    "list_node": "heartbeat",
+    "read_node": "heartbeat",
+    "list_namespaced_lease": "heartbeat",
+    "read_namespaced_lease": "heartbeat",
+    "create_namespaced_lease": "heartbeat",
+    "replace_namespaced_lease": "heartbeat",
+    "list_cluster_custom_object": "heartbeat",
+    "list_namespaced_custom_object": "heartbeat",
+    # per node metrics scrapes: one call per node and cycle, they grow with the cluster
+    "get_cluster_custom_object": "scrape",
+    "connect_get_node_proxy_with_path": "scrape",
+    "create_namespaced_job": "submission",
+    "read_namespace": "submission",
+    "create_namespace": "submission",
+}
+# lanes the limiter does not hold back, a fixed budget would stretch the cycle with every node added
+UNLIMITED_LANES = {"scrape"}
+MUTATING_PREFIXES = ("create_", "patch_", "replace_", "delete_")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+limiter = TokenBucket()
+stats = EndpointStats()
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5      # seconds, doubled per attempt
+BACKOFF_CAP = 10.0
+
+def configure(qps=None, burst=None, max_retries=None):
+    global limiter, MAX_RETRIES
+    if qps is not None or burst is not None:
+        limiter = TokenBucket(qps or limiter.qps, burst or limiter.burst)
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+
+def retry_after(error, mutating):
+    """Seconds the server asked to wait if `error` is worth retrying, else None.
+
+    Writes are only retried when the apiserver did not process them (429,
+    503), a create that timed out may have gone through.
+    """
+    if isinstance(error, client.ApiException):
+        if error.status not in RETRY_STATUSES or (mutating and error.status not in (429, 503)):
+            return None
+        header = (error.headers or {}).get("Retry-After")
+        try:
+            return float(header) if header else 0.0
+        except ValueError:
+            return 0.0
+    urllib3 = importlib.import_module("urllib3")
+    if isinstance(error, urllib3.exceptions.HTTPError) and not mutating:
+        return 0.0
+    return None
+
+def call(endpoint, method, fn, *args, **kwargs):
+    """One API call through the rate limiter, with jittered exponential backoff on transient errors."""
+    lane = LANES.get(method, "default")
+    mutating = method.startswith(MUTATING_PREFIXES)
+    attempt = 0
+    while True:
+        throttled = limiter.acquire(lane) if lane not in UNLIMITED_LANES else 0.0
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            wait = retry_after(e, mutating)
+            retry = wait is not None and attempt < MAX_RETRIES
+            stats.record(endpoint, time.monotonic() - started, throttled, error=True, retried=retry)
+            if not retry:
+                raise
+            # full jitter, so callers that failed together do not retry together
+            delay = max(wait, random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+            logging.warning(f"Kube: {endpoint} failed ({getattr(e, 'status', None) or type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        stats.record(endpoint, time.monotonic() - started, throttled)
+        return result
+
+class RateLimitedApi:
+    """Wraps a generated API class so every method goes through call()."""
+    def __init__(self, api, name):
+        self._api = api
+        self._name = name
+
+    def __getattr__(self, attr):
+        target = getattr(self._api, attr)
+        if attr.startswith("_") or not callable(target):
+            return target
+        # keeps __doc__, watch.Watch reads the return type from it
+        @functools.wraps(target)
+        def method(*args, **kwargs):
+            return call(f"{self._name}.{attr}", attr, target, *args, **kwargs)
+        setattr(self, attr, method)
+        return method
+
+def load_config():
+    """Load the kubeconfig (or in-cluster config) once per process."""
+    global _api_client
+    with _lock:
+        if _api_client is None:
+            from kubernetes import config
+            try:
+                config.load_kube_config()
+            except config.ConfigException:
+                config.load_incluster_config()
+            _api_client = client.ApiClient()
+        return _api_client
+
+def api(name):
+    """Shared instance of a generated API class, e.g. api("CoreV1Api")."""
+    if name not in _apis:
+        api_client = load_config()
+        with _lock:
+            _apis.setdefault(name, RateLimitedApi(getattr(client, name)(api_client), name))
+    return _apis[name]
+
+def core_v1():
+    return api("CoreV1Api")
+
+def batch_v1():
+    return api("BatchV1Api")
+
+def apps_v1():
+    return api("AppsV1Api")
+
+def custom_objects():
+    return api("CustomObjectsApi")
+
+def coordination_v1():
+    return api("CoordinationV1Api")
+
+_loads = None
+
+def json_loads(data):
+    """orjson when it is installed, it decodes large lists several times faster than json."""
+    global _loads
+    if _loads is None:
+        try:
+            _loads = importlib.import_module("orjson").loads
+        except ImportError:
+            _loads = json.loads
+    return _loads(data)
+
+def field(obj, path, default=None):
+    """Value at a dotted path ("spec.nodeName") of a raw API object, default if any part is missing."""
+    for key in path.split('.'):
+        if not isinstance(obj, dict) or obj.get(key) is None:
+            return default
+        obj = obj[key]
+    return obj
+
+def list_compact(list_fn, extract, page_size=500, list_meta=None, **kwargs):
+    """extract(item) of every item of a list call, without building model objects.
+
+    The response is fetched undecoded (_preload_content=False) and parsed
+    with json_loads, so a pod costs a dict instead of a tree of V1 models.
+    Pass field_selector/label_selector to filter on the server. Large lists
+    are paged with limit/continue. A list_meta dict gets the list's metadata
+    (resourceVersion, to watch from).
+    """
+    records = []
+    token = None
+    while True:
+        page = dict(kwargs, _continue=token) if token else kwargs
+        try:
+            response = list_fn(limit=page_size, _preload_content=False, **page)
+        except client.ApiException as e:
+            if e.status != 410 or not token:
+                raise
+            # continue token expired, the list changed too much: start over
+            records, token = [], None
+            continue
+        body = json_loads(response.data)
+        records.extend(extract(item) for item in body.get("items") or ())
+        token = field(body, "metadata.continue")
+        if not token:
+            if list_meta is not None:
+                list_meta.update(body.get("metadata") or {})
+            return records
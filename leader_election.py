@@ -0,0 +1,179 @@
+import os
+import socket
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+import urllib3
+
+import kube
+from kube import client
+
+class LeaderElector:
+    """Lease based leader election (coordination.k8s.io/v1) between GlobalController replicas.
+
+    Every replica tries to acquire or renew the Lease each RETRY_PERIOD. A lease
+    is taken over once its holder has not renewed it for LEASE_DURATION, as seen
+    on the local clock (like client-go, so clock skew between replicas does not
+    matter). A leader that could not renew within RENEW_DEADLINE stops acting
+    before anyone else can take over.
+
+    Lease annotations double as a small fenced store: update_annotation only
+    succeeds while the lease is still ours (resourceVersion checked writes).
+    """
+    def __init__(self, name="global-controller", namespace="default", identity=None,
+                 lease_duration=15, renew_deadline=10, retry_period=2):
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity or f"{socket.gethostname()}-{os.getpid()}"
+        self.LEASE_DURATION = lease_duration
+        self.RENEW_DEADLINE = renew_deadline
+        self.RETRY_PERIOD = retry_period
+
+        self.coordination_api = kube.coordination_v1()
+        self.lease = None
+        self.leading = False
+        self.last_renew = 0.0           # monotonic time of our last successful renew
+        self.observed_record = None     # (holder, renew_time) of the last lease seen
+        self.observed_at = 0.0          # monotonic time observed_record last changed
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # serializes our own lease writes
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="leader-election", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout=self.RETRY_PERIOD * 2)
+        self.release()
+
+    def is_leader(self):
+        with self.lock:
+            if self.leading and time.monotonic() - self.last_renew > self.RENEW_DEADLINE:
+                logging.error(f"Leader Election: {self.identity} failed to renew the lease in time")
+                self.leading = False
+            return self.leading
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with self.write_lock:
+                    self.try_acquire_or_renew()
+            except Exception as e:
+                logging.error(f"Leader Election: Error updating lease {self.namespace}/{self.name}: {e}")
+            self.is_leader()
+            self.stopped.wait(self.RETRY_PERIOD)
+
+    def try_acquire_or_renew(self):
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.coordination_api.read_namespaced_lease(name=self.name, namespace=self.namespace)
+        except client.ApiException as e:
+            if e.status != 404:
+                raise
+            lease = client.V1Lease(
+                metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace, annotations={}),
+                spec=client.V1LeaseSpec(
+                    holder_identity=self.identity,
+                    lease_duration_seconds=self.LEASE_DURATION,
+                    acquire_time=now,
+                    renew_time=now,
+                    lease_transitions=0
+                )
+            )
+            try:
+                created = self.coordination_api.create_namespaced_lease(namespace=self.namespace, body=lease)
+            except client.ApiException as e:
+                if e.status == 409:     # another replica created it first
+                    return
+                raise
+            self.became_leader(created)
+            return
+
+        spec = lease.spec
+        record = (spec.holder_identity, spec.renew_time)
+        if record != self.observed_record:
+            self.observed_record = record
+            self.observed_at = time.monotonic()
+        duration = spec.lease_duration_seconds or self.LEASE_DURATION
+        expired = not spec.holder_identity or time.monotonic() - self.observed_at > duration
+
+        if spec.holder_identity != self.identity and not expired:
+            with self.lock:
+                if self.leading:
+                    logging.critical(f"Leader Election: Lease taken over by {spec.holder_identity}")
+                self.leading = False
+            return
+
+        if spec.holder_identity != self.identity:
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+            spec.acquire_time = now
+            logging.critical(f"Leader Election: Taking over lease from {spec.holder_identity}")
+        spec.holder_identity = self.identity
+        spec.renew_time = now
+        spec.lease_duration_seconds = self.LEASE_DURATION
+        try:
+            # replace carries the resourceVersion we read, a concurrent writer makes it fail with 409
+            updated = self.coordination_api.replace_namespaced_lease(name=self.name, namespace=self.namespace, body=lease)
+        except client.ApiException as e:
+            if e.status == 409:
+                with self.lock:
+                    self.leading = False
+                return
+            raise
+        self.became_leader(updated)
+
+    def became_leader(self, lease):
+        with self.lock:
+            if not self.leading:
+                logging.critical(f"Leader Election: {self.identity} is now the leader")
+            self.lease = lease
+            self.leading = True
+            self.last_renew = time.monotonic()
+            self.observed_record = (lease.spec.holder_identity, lease.spec.renew_time)
+            self.observed_at = self.last_renew
+
+    def get_annotation(self, key, default=None):
+        with self.lock:
+            if self.lease is None:
+                return default
+            return (self.lease.metadata.annotations or {}).get(key, default)
+
+    def update_annotation(self, key, value):
+        """Write key=value on the lease; returns False (and steps down) if we are no longer the leader."""
+        with self.write_lock:
+            if not self.is_leader():
+                return False
+            lease = self.lease
+            lease.metadata.annotations = dict(lease.metadata.annotations or {}, **{key: str(value)})
+            try:
+                updated = self.coordination_api.replace_namespaced_lease(name=self.name, namespace=self.namespace, body=lease)
+            except (client.ApiException, urllib3.exceptions.HTTPError) as e:
+                # a write that did not reach the apiserver is a lost claim too, the caller must not act on it
+                logging.error(f"Leader Election: Lost the lease while writing {key}: {getattr(e, 'reason', None) or e}")
+                with self.lock:
+                    self.leading = False
+                return False
+            with self.lock:
+                self.lease = updated
+            return True
+
+    def release(self):
+        # let a standby take over right away instead of waiting for the lease to expire
+        with self.write_lock, self.lock:
+            if not self.leading or self.lease is None:
+                return
+            self.leading = False
+            lease = self.lease
+        lease.spec.holder_identity = None
+        lease.spec.lease_duration_seconds = 1
+        try:
+            self.coordination_api.replace_namespaced_lease(name=self.name, namespace=self.namespace, body=lease)
+            logging.info(f"Leader Election: {self.identity} released the lease")
+        except client.ApiException as e:
+            logging.error(f"Leader Election: Error releasing lease: {e.reason}")
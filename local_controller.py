@@ -1,37 +1,121 @@
 import math
+import logging
 from monitor import MonitorNode
+from jobs.queue import parse_size
+
+def load_gain(path):
+    """Steady-state gain matrix G11..G22 and the memory of the memory-bound pods it was
+    fit with (bytes, None if not recorded) from the CSV model_system.py --mimo prints."""
+    values = {}
+    with open(path, 'r') as file:
+        for line in file:
+            key, _, value = line.strip().partition(',')
+            if key.startswith('G') and value:
+                values[key] = float(value)
+            elif key == "VMBytes" and value:
+                values[key] = parse_size(value)
+    return [[values["G11"], values["G12"]], [values["G21"], values["G22"]]], values.get("VMBytes")
 
 class LocalController:
-    def __init__(self, node_name: str):
+    def __init__(self, node_name: str, monitor=None, mode="cpu", gain=None, gain_memory=None):
         self.node_name = node_name
-        self.monitor = MonitorNode(self.node_name)
+        self.monitor = monitor or MonitorNode(self.node_name)
 
         self.Kp = 0.12
         self.OPERATING_POINT = 80.0
         self.CPU_UTILIZATION_RANGE = (75.0, 85.0)
         self.MIN_PODS_LIMIT = 0
         self.MAX_PODS_LIMIT = 8
-        
+
+        # "cpu" regulates CPU utilization only, "mimo" CPU and memory together
+        self.mode = mode
+        self.MEMORY_OPERATING_POINT = 80.0
+        # steady-state % utilization one more pod adds: rows CPU, memory; columns CPU-bound, memory-bound
+        # (--vm) pods. The default matches Kp for CPU and a 1 GiB --vm pod on a 16 GiB node, fit the
+        # node's own with model_system.py --mimo
+        self.gain = gain or [[1 / self.Kp, 1 / self.Kp], [1.0, 6.25]]
+        # bytes a memory-bound pod held when the gain was measured, the stress run's --vm-bytes
+        self.GAIN_MEMORY = gain_memory or 2 ** 30
+
         self.error_k = 0.0
         self.control_input_k = 0.0
         self.state = {
             "max_pods": 0,
             "measured_cpu_util": 0.0,
+            "measured_memory_util": 0.0,
+            "limited_by": "cpu",
+            "stale": False,
+            # distance of each resource to its operating point, "mimo" only
+            "errors": None,
         }
 
-    def update_state(self):
-        measured_cpu_util = self.monitor.get_node_cpu_util()
+    # measured_cpu_util is normally the filtered value handed in by the Middleware
+    def update_state(self, measured_cpu_util=None, stale=False):
+        if measured_cpu_util is None and not stale:
+            measured_cpu_util = self.monitor.get_node_cpu_util()
+
+        self.state["stale"] = stale
+        if stale:
+            # no recent metrics, do not place more jobs on a node we cannot see
+            logging.warning(f"Node: {self.node_name}: CPU metrics are stale, holding max_pods at {self.MIN_PODS_LIMIT}")
+            self.state["max_pods"] = self.MIN_PODS_LIMIT
+            return
         if not measured_cpu_util:
             return
 
         self.state["measured_cpu_util"] = measured_cpu_util
         self.error_k = (self.OPERATING_POINT - measured_cpu_util)
-        # u(k) = Kp * e(k)
-        self.control_input_k = self.Kp * self.error_k
-
-        if self.control_input_k > self.MAX_PODS_LIMIT:
-            self.state["max_pods"] = self.MAX_PODS_LIMIT
-        elif self.control_input_k < self.MIN_PODS_LIMIT:
-            self.state["max_pods"] = self.MIN_PODS_LIMIT
+        if self.mode == "mimo":
+            self.control_input_k = self.multi_resource_input(measured_cpu_util)
         else:
-            self.state["max_pods"] = math.floor(self.control_input_k)
\ No newline at end of file
+            # u(k) = Kp * e(k)
+            self.control_input_k = self.Kp * self.error_k
+
+        self.state["max_pods"] = self.clamp(self.control_input_k)
+
+    def clamp(self, control_input):
+        if control_input > self.MAX_PODS_LIMIT:
+            return self.MAX_PODS_LIMIT
+        if control_input < self.MIN_PODS_LIMIT:
+            return self.MIN_PODS_LIMIT
+        return math.floor(control_input)
+
+    def multi_resource_input(self, measured_cpu_util):
+        self.state["errors"] = {
+            "cpu": self.OPERATING_POINT - measured_cpu_util,
+            "memory": self.MEMORY_OPERATING_POINT - self.monitor.current_memory_util,
+        }
+        self.state["measured_memory_util"] = self.monitor.current_memory_util
+        allowed = self.allowances()
+        if not allowed:
+            return self.MAX_PODS_LIMIT
+        self.state["limited_by"] = min(allowed, key=allowed.get)
+        if self.state["limited_by"] != "cpu":
+            logging.info(f"Node: {self.node_name}: memory at {self.monitor.current_memory_util:.1f}% limits max_pods")
+        return allowed[self.state["limited_by"]]
+
+    def allowances(self, memory_request=None):
+        """Pods each resource still has room for.
+
+        Each resource allows e_r / max_j G[r][j] more pods, its distance to its
+        operating point over what the heaviest pod type adds to it, so the
+        decision holds whatever kind of job comes next. With the memory request
+        of the next job (bytes) its memory gain is known instead: the memory-bound
+        pods of the model held GAIN_MEMORY each, so G[memory][memory-bound]
+        scales with the job's request. A resource no pod type loads does not limit.
+        """
+        allowed = {}
+        for resource, row in zip(self.state["errors"], self.gain):
+            gain = max(row)
+            if resource == "memory" and memory_request:
+                gain = row[1] * memory_request / self.GAIN_MEMORY
+            if gain > 0:
+                allowed[resource] = self.state["errors"][resource] / gain
+        return allowed
+
+    def max_pods_for(self, memory_request=None):
+        """max_pods for pods of the next job, which requests memory_request bytes each."""
+        if self.mode != "mimo" or not memory_request or self.state["stale"] or not self.state["errors"]:
+            return self.state["max_pods"]
+        allowed = self.allowances(memory_request)
+        return self.clamp(min(allowed.values())) if allowed else self.MAX_PODS_LIMIT
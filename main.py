@@ -1,34 +1,189 @@
 import logging
-from local_controller import LocalController
-from jobs.queue import JobQueue
+import argparse
+import kube
+from local_controller import LocalController, load_gain
+from monitor import MonitorNode
+from metrics_backend import MetricsServerBackend, KubeletSummaryBackend, PrometheusBackend, ReplayBackend, CachedMetricsBackend
+from jobs.queue import Job, JobQueue, TenantJobQueue
 from middleware import Middleware
 from global_controller import GlobalController
+from scaling_policy import PolicyEngine, ScalingPolicy
+
+def build_metrics_backend(args, shard=False):
+    """Metrics backend for --metrics-source. A shard worker's backend only reads
+    the shard's nodes, and the worker keeps their capacity from its node reads."""
+    if args.metrics_source == 'prometheus':
+        return PrometheusBackend(args.prometheus_url)
+    if args.metrics_source == 'replay':
+        return ReplayBackend(args.replay_metrics)
+    if args.metrics_source == 'kubelet':
+        backend = KubeletSummaryBackend()
+    else:
+        backend = MetricsServerBackend(per_node=shard)
+    if not shard:
+        # node capacity is cached until a node watch event changes it
+        backend.capacity.watch()
+    return backend
+
+def cpu_overcommit(value):
+    # below 1 the CPU requests would exceed the limits, which the apiserver rejects
+    overcommit = float(value)
+    if overcommit < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return overcommit
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Run the global controller')
+    parser.add_argument('--jobs-file', default='./static/jobs.txt', help='File with one stress-ng job per line')
+    parser.add_argument('--ingest-port', type=int, default=0, help='Accept job submissions over HTTP on this port (0 disables)')
+    parser.add_argument('--ingest-host', default='127.0.0.1', help='Address the ingestion endpoint binds to')
+    parser.add_argument('--metrics-source', choices=['metrics-server', 'kubelet', 'prometheus', 'replay'], default='metrics-server', help='Where node CPU utilization is read from')
+    parser.add_argument('--prometheus-url', default='http://localhost:9090', help='Prometheus server for --metrics-source prometheus')
+    parser.add_argument('--replay-metrics', help='CSV recorded with --record-metrics, for --metrics-source replay')
+    parser.add_argument('--record-metrics', help='Append every fetched node sample to this CSV')
+    parser.add_argument('--polling-interval', type=int, default=15, help='Seconds between controller cycles, the kubelet source supports a few seconds')
+    parser.add_argument('--smoothing', choices=['ewma', 'kalman', 'none'], default='ewma', help='Filter applied to node CPU samples')
+    parser.add_argument('--control', choices=['cpu', 'mimo'], default='cpu', help='Local controllers regulate CPU only, or CPU and memory together')
+    parser.add_argument('--mimo-model', help='Gain matrix printed by model/model_system.py --mimo, for --control mimo')
+    parser.add_argument('--api-qps', type=float, default=20, help='Kubernetes API calls per second, client side, for the controller and its shard workers together')
+    parser.add_argument('--api-burst', type=int, default=40, help='Kubernetes API calls allowed in a burst above --api-qps')
+    parser.add_argument('--api-retries', type=int, default=4, help='Retries of a Kubernetes API call on 429, 5xx and connection errors')
+    parser.add_argument('--placement', choices=['pods', 'cpu'], default='pods', help="Place jobs by the local controllers' pod budget, or by expected job CPU against node headroom")
+    parser.add_argument('--batch-size', type=int, default=1, help='Submit up to this many compatible queued jobs as one Indexed Job')
+    parser.add_argument('--prepull', action='store_true', help='Pre-pull the job image on every node with a DaemonSet, created once and ahead of node additions')
+    parser.add_argument('--warm-pool', type=int, default=0, help='Idle job pods kept per node that queued jobs are handed to without a pod start (0 disables)')
+    parser.add_argument('--warm-pool-job', default='stress-ng --cpu 1', help='Largest job the warm pool pods are sized for, bigger jobs are submitted as Jobs')
+    parser.add_argument('--cpu-overcommit', type=cpu_overcommit, default=1.0, help='Job CPU limits over requests, above 1 packs more jobs per node than it has cores')
+    parser.add_argument('--scaling', choices=['reactive', 'predictive'], default='reactive', help='Scale up on measured utilization only, or also on its trend and the queued work')
+    parser.add_argument('--scaling-policy', help='YAML scaling policy (see scaling-policy.yaml), defaults to the built-in rules')
+    parser.add_argument('--leader-elect', action='store_true', help='Run as one of several replicas, only the Lease holder acts')
+    parser.add_argument('--lease-name', default='global-controller', help='Lease used for leader election')
+    parser.add_argument('--lease-namespace', default='default', help='Namespace of the leader election Lease')
+    parser.add_argument('--nodes', help='Comma separated node names to control, defaults to the lab nodes')
+    parser.add_argument('--shards', type=int, default=0, help='Spread node metrics and local control over this many worker processes (0 disables)')
+    parser.add_argument('--snapshot-file', default='controller_snapshot.json', help='Controller state written every cycle for monitor_cluster.py, empty disables it')
+    parser.add_argument('--lease-miss-threshold', type=int, default=2, help='Missed node lease renewals before a node is taken out of placement')
+    parser.add_argument('--no-node-health', action='store_true', help='Detect node failures by node absence only')
+    parser.add_argument('--no-job-tracking', action='store_true', help='Do not watch jobs for completion metrics')
+    return parser
+
+def api_budget(args):
+    """API qps and burst of one process: the controller and every shard worker get an equal share."""
+    processes = args.shards + 1 if args.shards else 1
+    return args.api_qps / processes, max(args.api_burst // processes, 1)
+
+def build(args):
+    """Queue, middleware and global controller for the given arguments."""
+    qps, burst = api_budget(args)
+    kube.configure(qps=qps, burst=burst, max_retries=args.api_retries)
+    if args.ingest_port:
+        job_queue = TenantJobQueue(args.jobs_file)
+    else:
+        job_queue = JobQueue(args.jobs_file)
+
+    # node 2
+    # controllerParams = {
+    #     'a': 0.8709,
+    #     'b': -0.6688,
+    #     'Kp': 0.8,
+    #     'Ki': 0.006,
+    #     'node_name': "node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us"
+    # }
+    node_names = [
+        "node0",
+        "node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us",
+        "node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us"
+    ]
+    if args.nodes:
+        node_names = [name.strip() for name in args.nodes.split(',') if name.strip()]
+    if args.shards:
+        # local controllers run in the shard workers, the middleware only sees their summaries
+        from sharding import ShardCoordinator, ShardedMiddleware
+        coordinator = ShardCoordinator(node_names, args.shards, args)
+        coordinator.start()
+        gain, gain_memory = load_gain(args.mimo_model) if args.mimo_model else (None, None)
+        middleware = ShardedMiddleware(node_names, coordinator, smoothing=args.smoothing, mode=args.control, gain=gain, gain_memory=gain_memory)
+        return job_queue, middleware, build_global_controller(middleware, args)
+    # one backend shared by all nodes, each cycle fetches every node in a single call
+    metrics_backend = CachedMetricsBackend(build_metrics_backend(args), ttl=1.0, record_path=args.record_metrics)
+    controllers = [build_local_controller(name, MonitorNode(name, metrics_backend), args) for name in node_names]
+    middleware = Middleware(*controllers, smoothing=args.smoothing)
+    return job_queue, middleware, build_global_controller(middleware, args)
+
+def build_local_controller(node_name, monitor, args):
+    gain, gain_memory = load_gain(args.mimo_model) if args.mimo_model else (None, None)
+    return LocalController(node_name, monitor, mode=args.control, gain=gain, gain_memory=gain_memory)
+
+def build_global_controller(middleware, args):
+    middleware.placement = args.placement
+    globalController = GlobalController(middleware)
+    globalController.polling_interval = args.polling_interval
+    globalController.predictive = args.scaling == 'predictive'
+    globalController.cpu_overcommit = args.cpu_overcommit
+    globalController.batch_size = args.batch_size
+    globalController.snapshot_path = args.snapshot_file or None
+    if args.prepull or args.warm_pool:
+        from warm_start import WarmStart
+        warm_start = WarmStart(args.prepull, args.warm_pool, Job(args.warm_pool_job).resources(args.cpu_overcommit), middleware.cluster_metrics)
+        warm_start.ensure_prepull()
+        middleware.warm_start = warm_start
+        globalController.warm_start = warm_start
+    if args.scaling_policy:
+        globalController.policy = PolicyEngine(ScalingPolicy.load(args.scaling_policy))
+    return globalController
 
 def main():
+    args = build_parser().parse_args()
 
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
+    ingest_server = None
+    job_tracker = None
+    middleware = None
+    elector = None
+    node_health = None
     try:
-        job_queue = JobQueue('./static/jobs.txt')
-
-        # node 2
-        # controllerParams = {
-        #     'a': 0.8709,
-        #     'b': -0.6688,
-        #     'Kp': 0.8,
-        #     'Ki': 0.006,
-        #     'node_name': "node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us"
-        # }
-        controller1 = LocalController("node0")
-        controller2 = LocalController("node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us")
-        controller3 = LocalController("node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us")
-        middleware = Middleware(controller1, controller2, controller3)
-        globalController = GlobalController(middleware)
+        job_queue, middleware, globalController = build(args)
+
+        if not args.no_node_health:
+            from node_health import NodeHealthMonitor
+            node_health = NodeHealthMonitor(args.lease_miss_threshold, on_change=middleware.on_node_health)
+            node_health.start()
+            middleware.node_health = node_health
+
+        if args.leader_elect:
+            from leader_election import LeaderElector
+            elector = LeaderElector(args.lease_name, args.lease_namespace)
+            elector.start()
+            globalController.elector = elector
+
+        if not args.no_job_tracking:
+            from jobs.tracker import JobTracker
+            job_tracker = JobTracker(middleware.cluster_metrics)
+            job_tracker.start()
+
+        if args.ingest_port:
+            from jobs.ingest import JobIngestServer
+            ingest_server = JobIngestServer(job_queue, middleware, host=args.ingest_host, port=args.ingest_port)
+            ingest_server.start()
 
         globalController.run(job_queue)
         print("No more jobs in the queue.")
     except KeyboardInterrupt:
         print("Controller stopped.")
+    finally:
+        if elector:
+            elector.stop()
+        if node_health:
+            node_health.stop()
+        if ingest_server:
+            ingest_server.stop()
+        if getattr(middleware, "coordinator", None):
+            middleware.coordinator.stop()
+        if job_tracker:
+            job_tracker.stop()
+            if middleware.cluster_metrics["jobs"] or middleware.cluster_metrics.get("warm_pool"):
+                middleware.save_job_metrics()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,406 @@
+import csv
+import json
+import bisect
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import kube
+from kube import client
+
+from informer import Informer
+from quantity import parse_cpu_quantity, parse_memory_quantity
+
+# metrics-server and the kubelet report e.g. "2024-12-02T16:02:18Z" or "2024-12-02T16:02:18.123456789Z"
+def parse_timestamp(timestamp):
+    if not timestamp:
+        return None
+    timestamp = timestamp.rstrip('Z')
+    if '.' in timestamp:
+        seconds, fraction = timestamp.split('.')
+        timestamp = f"{seconds}.{fraction[:6]}"
+    return datetime.fromisoformat(timestamp + '+00:00').timestamp()
+
+# metrics-server reports e.g. "15s" or "20.043s"
+def parse_window(window):
+    if not window or not window.endswith('s'):
+        return None
+    return float(window.rstrip('s'))
+
+class NodeCapacityCache:
+    """CPU (cores) and memory (bytes) capacity per node.
+
+    Capacity is read once per node and kept until a node event replaces or
+    removes it, either from watch() or from node objects passed to observe().
+    """
+    def __init__(self, core_v1_api):
+        self.core_v1_api = core_v1_api
+        self.capacity = {}
+        self.informer = None
+
+    def get(self, node_name):
+        if node_name not in self.capacity:
+            self.observe(self.core_v1_api.read_node(node_name))
+        return self.capacity[node_name]
+
+    def observe(self, node):
+        capacity = node.status.capacity or {}
+        self.capacity[node.metadata.name] = {
+            "cpu": parse_cpu_quantity(capacity.get('cpu', 0)),
+            "memory": parse_memory_quantity(capacity.get('memory', 0)),
+        }
+
+    def invalidate(self, node_name=None):
+        if node_name is None:
+            self.capacity.clear()
+        else:
+            self.capacity.pop(node_name, None)
+
+    def watch(self):
+        self.informer = Informer(self.core_v1_api.list_node, name="node-capacity")
+        self.informer.add_handler(self.on_node_event)
+        self.informer.start()
+
+    def on_node_event(self, event_type, node):
+        if event_type == "DELETED":
+            self.invalidate(node.metadata.name)
+        else:
+            self.observe(node)
+
+class MetricsBackend(ABC):
+    """Source of node (and optionally pod) utilization samples.
+
+    get_node_samples returns {node: {"util", "memory_util", "timestamp", "window"}}
+    with utilizations in percent of capacity and None for nodes without data.
+    get_pod_samples returns {"namespace/name": {"cpu", "memory", "node"}} with
+    cpu in cores and memory in bytes.
+    """
+    def __init__(self):
+        self.node_names = set()
+
+    def register(self, node_name):
+        self.node_names.add(node_name)
+
+    @abstractmethod
+    def get_node_samples(self, node_names):
+        pass
+
+    def get_node_sample(self, node_name):
+        return self.get_node_samples([node_name]).get(node_name)
+
+    def get_pod_samples(self, namespace):
+        return {}
+
+class MetricsServerBackend(MetricsBackend):
+    """metrics.k8s.io, listing all nodes in one request.
+
+    With per_node, for a shard worker that controls a slice of the cluster,
+    its nodes are read one by one on a small thread pool instead, so a read
+    does not grow with the number of nodes in the cluster.
+    """
+    def __init__(self, capacity=None, per_node=False, max_workers=8):
+        super().__init__()
+        self.core_v1_api = kube.core_v1()
+        self.custom_api = kube.custom_objects()
+        self.capacity = capacity or NodeCapacityCache(self.core_v1_api)
+        self.per_node = per_node
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="node-metrics") if per_node else None
+
+    def get_node_samples(self, node_names):
+        if self.per_node:
+            items = dict(zip(node_names, self.executor.map(self.read_node_metrics, node_names)))
+        else:
+            metrics = self.custom_api.list_cluster_custom_object(
+                group="metrics.k8s.io",
+                version="v1beta1",
+                plural="nodes"
+            )
+            items = {item['metadata']['name']: item for item in metrics['items']}
+        samples = {}
+        for name in node_names:
+            item = items.get(name)
+            if item is None:
+                samples[name] = None
+                continue
+            capacity = self.capacity.get(name)
+            samples[name] = {
+                "util": parse_cpu_quantity(item['usage']['cpu']) / capacity["cpu"] * 100,
+                "memory_util": parse_memory_quantity(item['usage']['memory']) / capacity["memory"] * 100 if capacity["memory"] else None,
+                "timestamp": parse_timestamp(item.get('timestamp')),
+                "window": parse_window(item.get('window'))
+            }
+        return samples
+
+    def read_node_metrics(self, node_name):
+        try:
+            return self.custom_api.get_cluster_custom_object(
+                group="metrics.k8s.io",
+                version="v1beta1",
+                plural="nodes",
+                name=node_name
+            )
+        except Exception as e:
+            # 404 until metrics-server has scraped a new node
+            if not isinstance(e, client.ApiException) or e.status != 404:
+                logging.error(f"Node: {node_name}: Error getting metrics: {e}")
+            return None
+
+    def get_pod_samples(self, namespace):
+        metrics = self.custom_api.list_namespaced_custom_object(
+            group="metrics.k8s.io",
+            version="v1beta1",
+            namespace=namespace,
+            plural="pods"
+        )
+        samples = {}
+        for item in metrics['items']:
+            containers = item.get('containers', [])
+            samples[f"{namespace}/{item['metadata']['name']}"] = {
+                "cpu": sum(parse_cpu_quantity(c['usage']['cpu']) for c in containers),
+                "memory": sum(parse_memory_quantity(c['usage']['memory']) for c in containers),
+                "node": None
+            }
+        return samples
+
+class KubeletSummaryBackend(MetricsBackend):
+    """Scrapes /stats/summary of every kubelet through the apiserver node proxy.
+
+    The kubelet refreshes its CPU stats every few seconds, well below the 15 s
+    metrics-server resolution. Nodes are scraped concurrently on a bounded
+    thread pool and each summary is parsed as soon as its request completes.
+    Wrapped in a CachedMetricsBackend, one scrape serves every node for a
+    cycle. A node that is gone (404) has no summary, so its pods are not
+    reported any more.
+    """
+    def __init__(self, capacity=None, max_workers=8, timeout=5):
+        super().__init__()
+        self.core_v1_api = kube.core_v1()
+        self.capacity = capacity or NodeCapacityCache(self.core_v1_api)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kubelet-scrape")
+        self.summaries = {}         # node -> last parsed summary
+
+    def get_node_samples(self, node_names):
+        self.scrape(node_names)
+        return {name: self.summaries.get(name) and self.summaries[name]["node"] for name in node_names}
+
+    def get_pod_samples(self, namespace):
+        if not self.summaries:
+            self.scrape(self.node_names)
+        prefix = f"{namespace}/"
+        return {key: pod for summary in self.summaries.values() if summary
+                for key, pod in summary["pods"].items() if key.startswith(prefix)}
+
+    def scrape(self, node_names):
+        futures = {self.executor.submit(self.fetch, name): name for name in node_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                self.summaries[name] = future.result()
+            except Exception as e:
+                # 404 once the node was removed, or before it joined
+                if not isinstance(e, client.ApiException) or e.status != 404:
+                    logging.error(f"Node: {name}: Error scraping kubelet summary: {e}")
+                self.summaries[name] = None
+
+    def fetch(self, node_name):
+        response = self.core_v1_api.connect_get_node_proxy_with_path(
+            name=node_name,
+            path="stats/summary",
+            _preload_content=False,
+            _request_timeout=self.timeout
+        )
+        return self.parse(node_name, json.loads(response.data))
+
+    def parse(self, node_name, summary):
+        capacity = self.capacity.get(node_name)
+        node = summary['node']
+        timestamp = parse_timestamp(node['cpu'].get('time'))
+        previous = self.summaries.get(node_name)
+        previous_timestamp = previous["node"]["timestamp"] if previous else None
+        memory = node.get('memory', {}).get('workingSetBytes')
+
+        pods = {}
+        for pod in summary.get('pods', []):
+            cpu = pod.get('cpu') or {}
+            if 'usageNanoCores' not in cpu:
+                continue
+            ref = pod['podRef']
+            pods[f"{ref['namespace']}/{ref['name']}"] = {
+                "cpu": cpu['usageNanoCores'] / 1e9,
+                "memory": (pod.get('memory') or {}).get('workingSetBytes'),
+                "node": node_name
+            }
+
+        return {
+            "node": {
+                "util": node['cpu']['usageNanoCores'] / 1e9 / capacity["cpu"] * 100,
+                "memory_util": memory / capacity["memory"] * 100 if memory is not None and capacity["memory"] else None,
+                "timestamp": timestamp,
+                # the kubelet does not report a window, use the spacing of its samples
+                "window": timestamp - previous_timestamp if timestamp and previous_timestamp and timestamp > previous_timestamp else None
+            },
+            "pods": pods
+        }
+
+class PrometheusBackend(MetricsBackend):
+    """Prometheus HTTP query API (/api/v1/query).
+
+    The default queries assume cAdvisor and kube-state-metrics series labelled
+    with `node`; override them to match the scrape configuration in use.
+    """
+    NODE_CPU_QUERY = 'sum by (node) (rate(container_cpu_usage_seconds_total{id="/"}[1m])) / sum by (node) (kube_node_status_capacity{resource="cpu"}) * 100'
+    NODE_MEMORY_QUERY = 'sum by (node) (container_memory_working_set_bytes{id="/"}) / sum by (node) (kube_node_status_capacity{resource="memory"}) * 100'
+    POD_CPU_QUERY = 'sum by (namespace, pod, node) (rate(container_cpu_usage_seconds_total{container!="", namespace="%s"}[1m]))'
+    POD_MEMORY_QUERY = 'sum by (namespace, pod, node) (container_memory_working_set_bytes{container!="", namespace="%s"})'
+
+    def __init__(self, url, timeout=5, window=60.0):
+        super().__init__()
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.window = window        # seconds covered by the rate() range
+
+    def query(self, promql):
+        import requests
+        response = requests.get(f"{self.url}/api/v1/query", params={"query": promql}, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"Prometheus query failed: {body.get('error')}")
+        return body["data"]["result"]
+
+    def get_node_samples(self, node_names):
+        cpu = {r["metric"].get("node"): r["value"] for r in self.query(self.NODE_CPU_QUERY)}
+        memory = {r["metric"].get("node"): r["value"] for r in self.query(self.NODE_MEMORY_QUERY)}
+        samples = {}
+        for name in node_names:
+            if name not in cpu:
+                samples[name] = None
+                continue
+            timestamp, value = cpu[name]
+            samples[name] = {
+                "util": float(value),
+                "memory_util": float(memory[name][1]) if name in memory else None,
+                "timestamp": float(timestamp),
+                "window": self.window
+            }
+        return samples
+
+    def get_pod_samples(self, namespace):
+        memory = {(r["metric"]["namespace"], r["metric"]["pod"]): float(r["value"][1])
+                  for r in self.query(self.POD_MEMORY_QUERY % namespace)}
+        samples = {}
+        for r in self.query(self.POD_CPU_QUERY % namespace):
+            key = (r["metric"]["namespace"], r["metric"]["pod"])
+            samples["/".join(key)] = {
+                "cpu": float(r["value"][1]),
+                "memory": memory.get(key),
+                "node": r["metric"].get("node")
+            }
+        return samples
+
+class ReplayBackend(MetricsBackend):
+    """Plays back samples from a CSV file with columns
+    timestamp,node,cpu_util[,memory_util] (epoch seconds or '%Y-%m-%d %H:%M:%S').
+
+    Recorded time advances `speed` times faster than `clock`, starting at the
+    first request; each read returns the latest row per node at that point.
+    """
+    def __init__(self, path, speed=1.0, clock=time.time):
+        super().__init__()
+        self.speed = speed
+        self.clock = clock
+        self.rows = {}              # node -> [(timestamp, cpu_util, memory_util)]
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                self.rows.setdefault(row["node"], []).append((
+                    self.parse_time(row["timestamp"]),
+                    float(row["cpu_util"]),
+                    float(row["memory_util"]) if row.get("memory_util") else None
+                ))
+        for rows in self.rows.values():
+            rows.sort()
+        self.timestamps = {node: [row[0] for row in rows] for node, rows in self.rows.items()}
+        self.start = min((rows[0][0] for rows in self.rows.values() if rows), default=0.0)
+        self.started_at = None
+
+    @staticmethod
+    def parse_time(value):
+        try:
+            return float(value)
+        except ValueError:
+            return time.mktime(time.strptime(value, '%Y-%m-%d %H:%M:%S'))
+
+    def now(self):
+        if self.started_at is None:
+            self.started_at = self.clock()
+        return self.start + (self.clock() - self.started_at) * self.speed
+
+    def get_node_samples(self, node_names):
+        now = self.now()
+        samples = {}
+        for name in node_names:
+            position = bisect.bisect_right(self.timestamps.get(name, []), now)
+            if position == 0:
+                samples[name] = None
+                continue
+            timestamp, cpu_util, memory_util = self.rows[name][position - 1]
+            samples[name] = {"util": cpu_util, "memory_util": memory_util, "timestamp": timestamp, "window": None}
+        return samples
+
+class CachedMetricsBackend(MetricsBackend):
+    """TTL cache in front of another backend.
+
+    The first read after the TTL fetches every registered node in a single
+    backend call; concurrent readers wait for that fetch instead of issuing
+    their own. Fresh samples can be appended to a CSV that ReplayBackend reads.
+    """
+    def __init__(self, backend, ttl=1.0, record_path=None):
+        super().__init__()
+        self.backend = backend
+        self.ttl = ttl
+        self.record_path = record_path
+        self.samples = {}
+        self.pod_samples = {}       # namespace -> (fetched_at, samples)
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def register(self, node_name):
+        super().register(node_name)
+        self.backend.register(node_name)
+
+    def get_node_samples(self, node_names):
+        with self.lock:
+            missing = [name for name in node_names if name not in self.node_names]
+            for name in missing:
+                self.register(name)
+            if missing or time.time() - self.fetched_at > self.ttl:
+                try:
+                    self.samples = self.backend.get_node_samples(sorted(self.node_names))
+                except Exception as e:
+                    logging.error(f"Metrics: Error fetching node metrics: {e}")
+                    self.samples = {}
+                self.fetched_at = time.time()
+                self.record(self.samples)
+            return {name: self.samples.get(name) for name in node_names}
+
+    def get_pod_samples(self, namespace):
+        with self.lock:
+            fetched_at, samples = self.pod_samples.get(namespace, (0.0, {}))
+            if time.time() - fetched_at > self.ttl:
+                samples = self.backend.get_pod_samples(namespace)
+                self.pod_samples[namespace] = (time.time(), samples)
+            return samples
+
+    def record(self, samples):
+        if not self.record_path:
+            return
+        with open(self.record_path, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            if file.tell() == 0:
+                writer.writerow(["timestamp", "node", "cpu_util", "memory_util"])
+            for name, sample in samples.items():
+                if sample:
+                    writer.writerow([sample["timestamp"] or self.fetched_at, name, sample["util"], sample.get("memory_util") or ""])
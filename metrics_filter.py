@@ -0,0 +1,112 @@
+import numpy as np
+
+class MetricsFilter:
+    """Preprocesses raw node CPU samples for all nodes at once.
+
+    Each call to update() takes one sample per node (NaN where the fetch
+    failed) and, vectorized across nodes:
+      - skips samples whose metrics-server timestamp did not advance, so the
+        same 15 s window is not counted twice
+      - flags nodes as stale when no new window arrived for STALE_WINDOWS
+        metric windows, timed on the local clock from when the newest window
+        was first seen, so skew against the metrics-server clock does not count
+      - rejects outliers whose innovation exceeds OUTLIER_SIGMAS standard
+        deviations, unless they persist for OUTLIER_PERSISTENCE samples
+        (a real load step rather than a glitch) or follow a job submission
+        on the node within SUBMISSION_WINDOWS windows
+      - smooths accepted samples with an EWMA or a random-walk Kalman filter
+    """
+    METHODS = ("ewma", "kalman", "none")
+
+    def __init__(self, node_names, method="ewma", alpha=0.5, process_noise=4.0, measurement_noise=16.0):
+        if method not in self.METHODS:
+            raise ValueError(f"Unsupported smoothing method: {method}")
+        self.node_names = list(node_names)
+        self.index = {name: i for i, name in enumerate(self.node_names)}
+        self.method = method
+        self.alpha = alpha                          # EWMA weight of the newest sample
+        self.process_noise = process_noise          # Kalman Q, (% util)^2 per sample
+        self.measurement_noise = measurement_noise  # Kalman R, (% util)^2
+
+        self.STALE_WINDOWS = 3          # samples older than this many windows are stale
+        self.DEFAULT_WINDOW = 15.0      # seconds, metrics-server --metric-resolution
+        self.OUTLIER_SIGMAS = 4.0
+        self.OUTLIER_PERSISTENCE = 1    # rejections tolerated before a repeated jump is taken as a level shift
+        self.MIN_SIGMA = 2.0            # % util, floor for the innovation deviation
+        self.INNOVATION_ALPHA = 0.2     # EW weight for the innovation variance
+        self.SUBMISSION_WINDOWS = 4     # a submitted job's load shows up within this many windows
+
+        n = len(self.node_names)
+        self.estimate = np.full(n, np.nan)
+        self.variance = np.full(n, self.measurement_noise)      # Kalman P
+        self.innovation_var = np.full(n, self.MIN_SIGMA ** 2)
+        self.last_timestamp = np.full(n, np.nan)
+        self.observed_at = np.full(n, np.nan)       # local time the newest window was first seen
+        self.rejections = np.zeros(n, dtype=int)
+        self.stale = np.zeros(n, dtype=bool)
+
+    def update(self, samples, now, submitted_at=None):
+        """samples: {node_name: {"util", "timestamp", "window"}} or None per node,
+        submitted_at: {node_name: local time of its last job submission}.
+        Returns {node_name: (filtered_util, is_stale)} for every known node."""
+        n = len(self.node_names)
+        values = np.full(n, np.nan)
+        timestamps = np.full(n, np.nan)
+        windows = np.full(n, self.DEFAULT_WINDOW)
+        submitted = np.full(n, np.nan)
+        for name, submitted_time in (submitted_at or {}).items():
+            if name in self.index and submitted_time is not None:
+                submitted[self.index[name]] = submitted_time
+        for name, sample in samples.items():
+            if sample is None or name not in self.index:
+                continue
+            i = self.index[name]
+            values[i] = sample["util"]
+            timestamps[i] = sample.get("timestamp") or now
+            windows[i] = sample.get("window") or self.DEFAULT_WINDOW
+
+        received = ~np.isnan(values)
+        # only samples from a new metrics window carry information
+        fresh = received & ~(timestamps <= self.last_timestamp)
+        self.last_timestamp = np.where(fresh, timestamps, self.last_timestamp)
+        self.observed_at = np.where(fresh, now, self.observed_at)
+        age = now - self.observed_at
+        self.stale = np.isnan(age) | (age > self.STALE_WINDOWS * windows)
+
+        first = fresh & np.isnan(self.estimate)
+        tracked = fresh & ~first
+        innovation = np.where(tracked, values - self.estimate, 0.0)
+
+        sigma = np.maximum(np.sqrt(self.innovation_var), self.MIN_SIGMA)
+        jump = tracked & (np.abs(innovation) > self.OUTLIER_SIGMAS * sigma)
+        # a job submitted on the node moves its load, take the jump as the new level right away
+        stepped = jump & (now - submitted <= self.SUBMISSION_WINDOWS * windows)
+        outlier = jump & ~stepped
+        self.rejections = np.where(outlier, self.rejections + 1, np.where(tracked, 0, self.rejections))
+        # a persistent "outlier" is a level shift, take it and restart the filter there
+        shifted = outlier & (self.rejections > self.OUTLIER_PERSISTENCE)
+        accepted = tracked & ~jump
+        self.rejections[shifted] = 0
+
+        self.innovation_var = np.where(
+            accepted,
+            (1 - self.INNOVATION_ALPHA) * self.innovation_var + self.INNOVATION_ALPHA * innovation ** 2,
+            self.innovation_var)
+
+        if self.method == "ewma":
+            smoothed = self.estimate + self.alpha * innovation
+        elif self.method == "kalman":
+            predicted_var = self.variance + self.process_noise
+            gain = predicted_var / (predicted_var + self.measurement_noise)
+            smoothed = self.estimate + gain * innovation
+            self.variance = np.where(accepted, (1 - gain) * predicted_var, self.variance)
+        else:
+            smoothed = values
+
+        restart = first | shifted | stepped
+        self.estimate = np.where(accepted, smoothed, self.estimate)
+        self.estimate = np.where(restart, values, self.estimate)
+        self.variance = np.where(restart, self.measurement_noise, self.variance)
+
+        return {name: (None if np.isnan(self.estimate[i]) else float(self.estimate[i]), bool(self.stale[i]))
+                for name, i in self.index.items()}
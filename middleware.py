@@ -1,65 +1,157 @@
 from monitor import MonitorNode
+from metrics_filter import MetricsFilter
 import time
 import logging
-from kubernetes import client, config
+import kube
+from collections import namedtuple
+from kube import client
+from jobs.job import pod_remaining_seconds, pod_job_args, pod_nodetype, pod_tenant, nodetype_label, STRESSOR_LABEL_PREFIX, WARM_POOL_LABEL, JOB_POD_SELECTOR
+from cost_model import JobCostModel, STRESSORS
+from quantity import parse_cpu_quantity, parse_memory_quantity
+
+# nodes the cluster can be scaled over, in the order they are filled
+NODE_INVENTORY = [
+    {
+        "name": "node0",
+        "ip": "128.110.217.121",
+        "label": {"nodetype": "worker0", "role": "master"},
+        "can_remove": False,
+        "is_active": True,
+    },
+    {
+        "name": "node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us",
+        "ip": "128.110.217.136",
+        "label": {"nodetype": "worker1", "role": "worker"},
+        "can_remove": True,
+        "is_active": False,
+    },
+    {
+        "name": "node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us",
+        "ip": "128.110.217.157",
+        "label": {"nodetype": "worker2", "role": "worker"},
+        "can_remove": True,
+        "is_active": False,
+    },
+]
+
+def node_allocatable(node):
+    """Cores and bytes a node offers to pods, None if it does not say."""
+    allocatable = (node.status.allocatable or node.status.capacity) if node.status else None
+    if not allocatable:
+        return None
+    return {"cpu": parse_cpu_quantity(allocatable.get("cpu", 0)), "memory": parse_memory_quantity(allocatable.get("memory", 0))}
+
+def node_info(node):
+    """What refresh_active_nodes reads of a listed node."""
+    labels = node.metadata.labels or {}
+    return {"name": node.metadata.name, "role": labels.get("role", "unknown"), "nodetype": labels.get("nodetype"),
+            "allocatable": node_allocatable(node)}
+
+# what the Middleware reads of a job pod, decoded straight from the pod list JSON
+# idle: a warm pool pod waiting for a job, it holds its requests but runs nothing
+PodSummary = namedtuple("PodSummary", ["name", "phase", "node", "cpu", "memory", "nodetype", "stressors", "idle"])
+
+def pod_summary(pod):
+    """PodSummary of a raw pod dict: requested cores and bytes of all containers,
+    and the nodetype the JobSubmitter node affinity asks for."""
+    cpu = memory = 0.0
+    for container in kube.field(pod, "spec.containers", []):
+        requests = kube.field(container, "resources.requests", {})
+        cpu += parse_cpu_quantity(requests.get("cpu", 0))
+        memory += parse_memory_quantity(requests.get("memory", 0))
+    nodetype = None
+    terms = kube.field(pod, "spec.affinity.nodeAffinity.requiredDuringSchedulingIgnoredDuringExecution.nodeSelectorTerms", [])
+    for expression in (terms[0].get("matchExpressions") or []) if terms else []:
+        if expression.get("key") == "nodetype" and expression.get("values"):
+            nodetype = expression["values"][0]
+    labels = kube.field(pod, "metadata.labels", {})
+    stressors = {name: int(labels[f"{STRESSOR_LABEL_PREFIX}{name}"]) for name in STRESSORS if f"{STRESSOR_LABEL_PREFIX}{name}" in labels}
+    return PodSummary(kube.field(pod, "metadata.name"), kube.field(pod, "status.phase"), kube.field(pod, "spec.nodeName"),
+                      cpu, memory, nodetype, stressors, labels.get(WARM_POOL_LABEL) == "idle")
 
 class Middleware:
-    def __init__(self, controller_1, controller_2, controller_3):
+    def __init__(self, *controllers, smoothing="ewma"):
         self.target_cluster_util = 80
         self.MAX_CLUSTER_PODS = 0
         self.current_node_index = 0
         self.node_added_before = 0      # seconds
         self.failure_cool_down = 0      # seconds
+        self.NODE_JOIN_TIMEOUT = 300    # seconds a created node may take to show up
+        self.DRAIN_GRACE = 60           # seconds past the longest remaining job before a drain deletes pods
+        self.JOB_START_TIME = 10        # seconds from submission until a job's pod runs and loads its node
+        self.RESERVATION_TIMEOUT = 180  # seconds a job's expected CPU is held at most, e.g. without metrics
+        # optional NodeHealthMonitor, takes nodes with a failed kubelet out of placement
+        self.node_health = None
+        # "pods" places by the local controllers' max_pods, "cpu" by expected job cores against node headroom
+        self.placement = "pods"
+        self.cost_model = JobCostModel()
+        self.job_pods = []              # PodSummary of the job pods, from the last get_total_pods
+        # optional warm_start.WarmStart, pre-pulls the job image on the nodes this adds
+        self.warm_start = None
         
-        config.load_kube_config()
-        self.core_v1_api = client.CoreV1Api()
+        self.core_v1_api = kube.core_v1()
         
-        # keeps track of the nodes in the cluster
-        self.nodes = {
-            0: {
-                "name": "node0",
-                "ip": "128.110.217.121",
-                "label": {"nodetype": "worker0", "role": "master"},
-                "controller": controller_1,
-                "can_remove": False,
-                "was_removed": False,
-                "failure_detected": False,
-                "is_active": True,
-                "low_util_count": 0
-            },
-            1: {
-                "name": "node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us",
-                "ip": "128.110.217.136",
-                "label": {"nodetype": "worker1", "role": "worker"},
-                "controller": controller_2,
+        # keeps track of the nodes in the cluster, one entry per local controller
+        inventory = {node["name"]: node for node in NODE_INVENTORY}
+        self.nodes = {}
+        for index, controller in enumerate(controllers):
+            # nodes outside the inventory already exist, they are picked up by refresh_active_nodes
+            info = inventory.get(controller.node_name, {
+                "name": controller.node_name,
+                "ip": None,
+                "label": {"nodetype": nodetype_label(controller.node_name), "role": "worker"},
                 "can_remove": True,
-                "was_removed": False,
-                "failure_detected": False,
                 "is_active": False,
-                "low_util_count": 0
-            },
-            2: {
-                "name": "node2.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us",
-                "ip": "128.110.217.157",
-                "label": {"nodetype": "worker2", "role": "worker"},
-                "controller": controller_3,
-                "can_remove": True,
+            })
+            self.nodes[index] = {
+                "name": info["name"],
+                "ip": info["ip"],
+                "label": dict(info["label"]),
+                "controller": controller,
+                "can_remove": info["can_remove"],
                 "was_removed": False,
                 "failure_detected": False,
-                "is_active": False,
-                "low_util_count": 0
+                "is_active": info["is_active"],
+                "low_util_count": 0,
+                "pending_since": None,      # set while a created node has not joined yet
+                "draining_since": None,     # set while a cordoned node waits for its jobs to finish
+                "healthy": True,            # Ready condition and node lease, see NodeHealthMonitor
+                "drain_deadline": None,
+                # resource ledger: node allocatable and the requests of its pending and running job pods
+                "allocatable": None,        # {"cpu": cores, "memory": bytes}, None until the node is listed
+                "requested": {"cpu": 0.0, "memory": 0.0},
+                "expected_cpu": 0.0,        # cores of the submitted jobs no utilization sample shows yet
+                "reservations": [],         # (submitted_at, cores) behind expected_cpu
+                "submitted_at": None,       # last job submission, the metrics filter takes the load step after it
             }
-        }
         self.cluster_metrics = {}
+        # smoothing, staleness and outlier filtering of node CPU samples
+        self.metrics_filter = MetricsFilter([node["name"] for node in self.nodes.values()], method=smoothing)
+
+    # NodeHealthMonitor callback, runs as soon as a watch event shows the change
+    def on_node_health(self, node_name, healthy):
+        for node in self.nodes.values():
+            if node["name"] != node_name:
+                continue
+            node["healthy"] = healthy
+            if not healthy and node["is_active"]:
+                logging.info(f"Middleware: Node {node_name} failure detected, no more jobs are placed on it.")
+                node["failure_detected"] = True
+                self.failure_cool_down = time.time()
 
     # make sure the nodes in the middleware are active
     def refresh_active_nodes(self):
         print('####################################')
         logging.info("Heartbeat...")
+        if self.node_health and not self.node_health.watch:
+            self.node_health.poll()
         nodes = self.core_v1_api.list_node()
-        node_info = [{"name": node.metadata.name, "role": node.metadata.labels.get("role", "unknown")} for node in nodes.items]
+        self.update_active_nodes([node_info(node) for node in nodes.items])
+
+    # node_info of the listed nodes, nodes in `unknown` could not be read and keep their state
+    def update_active_nodes(self, listed, unknown=()):
         # make cluster nodes active to allow for job submission
-        active_node_names = [info["name"] for info in node_info]
+        active_node_names = {info["name"]: info for info in listed}
         # log active_node_count into to cluster_metrics
         if "active_node_count" not in self.cluster_metrics:
             self.cluster_metrics["active_node_count"] = []
@@ -69,36 +161,115 @@ class Middleware:
         })
         
         for node in self.nodes.values():
+            if node["name"] in unknown:
+                continue
             if node["name"] in active_node_names:
+                if node["pending_since"]:
+                    logging.info(f"Middleware: Node {node['name']} is now part of the cluster after {time.time() - node['pending_since']:.0f}s")
+                    # make node available
+                    node["can_remove"] = True
+                    node["was_removed"] = False
+                    node["low_util_count"] = 0
+                    node["pending_since"] = None
                 node["is_active"] = True
-                for info in node_info:
-                    if node["name"] == info["name"]:
-                        node["label"]["role"] = info["role"]
-                    if info["role"] == "master":
-                        node["can_remove"] = False
+                info = active_node_names[node["name"]]
+                node["label"]["role"] = info["role"]
+                node["allocatable"] = info["allocatable"]
+                if info["nodetype"] is None:
+                    self.label_node(node["name"], node["label"]["nodetype"])
+                if info["role"] == "master":
+                    node["can_remove"] = False
             else:
+                if node["pending_since"] and time.time() - node["pending_since"] > self.NODE_JOIN_TIMEOUT:
+                    logging.error(f"Middleware: Node {node['name']} did not join within {self.NODE_JOIN_TIMEOUT}s")
+                    node["pending_since"] = None
                 if node["is_active"] and not node["was_removed"]:
                     logging.info(f"Middleware: Node {node['name']} failure detected.")
                     node["failure_detected"] = True
                     self.failure_cool_down = time.time()
                 node["is_active"] = False
+                # a node that comes back is judged afresh
+                node["healthy"] = True
         # log the self.nodes dictionary in well formatted way
         for node in self.nodes.values():
-            logging.info(f"Middleware: Node State: {node['name']}, is_active: {node['is_active']}, can_remove: {node['can_remove']}, was_removed: {node['was_removed']}, failure_detected: {node['failure_detected']}")
+            logging.info(f"Middleware: Node State: {node['name']}, is_active: {node['is_active']}, can_remove: {node['can_remove']}, was_removed: {node['was_removed']}, failure_detected: {node['failure_detected']}, healthy: {node['healthy']}")
+
+    # nodes that joined without the inventory's labels, job pods for them ask for nodetype_label(name)
+    def label_node(self, node_name, nodetype):
+        try:
+            self.core_v1_api.patch_node(node_name, {"metadata": {"labels": {"nodetype": nodetype}}})
+            logging.info(f"Middleware: Labelled {node_name} nodetype={nodetype}")
+        except client.rest.ApiException as e:
+            logging.error(f"Middleware: Error labelling node {node_name}: {e}")
 
     def update_local_states(self):
         print('------------------------------------')
         logging.info("Local States...")
         self.get_total_pods()  # record metric
+        self.attribute_pod_cpu()
+        samples = {}
+        for node in self.nodes.values():
+            if node["is_active"]:
+                samples[node["name"]] = node["controller"].monitor.get_node_cpu_sample()
+            self.expire_reservations(node, samples.get(node["name"]))
+        filtered = self.metrics_filter.update(samples, time.time(), self.submission_times())
         for node in self.nodes.values():
             if node["is_active"]:
-                node["controller"].update_state()
+                cpu_util, stale = filtered[node["name"]]
+                if cpu_util is not None:
+                    node["controller"].monitor.current_util = cpu_util
+                node["controller"].update_state(cpu_util, stale)
+        self.update_max_cluster_pods()
+        print('------------------------------------')
+
+    def submission_times(self):
+        return {node["name"]: node["submitted_at"] for node in self.nodes.values() if node["submitted_at"]}
+
+    # measured CPU of every running job pod, by its stressor labels, into the job cost model
+    def attribute_pod_cpu(self):
+        running = {f"jobs/{pod.name}": pod for pod in self.job_pods if pod.phase == "Running" and pod.stressors}
+        if not running:
+            return
+        monitor = next(iter(self.nodes.values()))["controller"].monitor
+        try:
+            samples = monitor.backend.get_pod_samples("jobs")
+        except Exception as e:
+            logging.error(f"Middleware: Failed to read pod metrics: {e}")
+            return
+        for key, sample in samples.items():
+            if key in running and sample.get("cpu") is not None:
+                self.cost_model.observe(running[key].stressors, sample["cpu"])
+        logging.info(f"Middleware: Job cost model (cores): {self.cost_model.coefficients()}")
+
+    # a job's expected CPU holds headroom until a utilization window that began after the job started covers it;
+    # metrics-server samples lag the submission by 15-60 s, so the next cycle's sample does not show it yet
+    def expire_reservations(self, node, sample):
+        now = time.time()
+        window_start = None
+        if sample and sample.get("timestamp"):
+            window_start = sample["timestamp"] - (sample.get("window") or 0.0)
+        node["reservations"] = [
+            (submitted_at, cores) for submitted_at, cores in node["reservations"]
+            if node["is_active"] and now - submitted_at < self.RESERVATION_TIMEOUT
+            and (window_start is None or window_start < submitted_at + self.JOB_START_TIME)
+        ]
+        node["expected_cpu"] = sum(cores for _, cores in node["reservations"])
+
+    # cores a node can still take before its local controller's operating point, None if its size is unknown
+    def cpu_headroom(self, node):
+        if not node["allocatable"]:
+            return None
+        controller = node["controller"]
+        return node["allocatable"]["cpu"] * (controller.OPERATING_POINT - controller.monitor.current_util) / 100 - node["expected_cpu"]
+
+    def update_max_cluster_pods(self):
         # current total_pods running and then add the allowed pods on each node.
         # self.MAX_CLUSTER_PODS = self.get_total_pods()
         self.MAX_CLUSTER_PODS = 0
         for node in self.nodes.values():
             if node["is_active"]:
-                max_nodes_allowed = node["controller"].state["max_pods"]
+                # a draining or failed node takes no new pods
+                max_nodes_allowed = 0 if node["draining_since"] or not node["healthy"] else node["controller"].state["max_pods"]
                 max_pod_on_node = max_nodes_allowed + node["controller"].monitor.get_running_pod_count()
                 self.MAX_CLUSTER_PODS += max_pod_on_node
         logging.info(f"Middleware: Updated cluster max_pods: {self.MAX_CLUSTER_PODS}")
@@ -108,28 +279,59 @@ class Middleware:
             "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
             "value": self.MAX_CLUSTER_PODS
         })
-        print('------------------------------------')
+
+    # per node controller state for the dashboard
+    def snapshot(self):
+        return {
+            node["name"]: {
+                "active": node["is_active"],
+                "util": node["controller"].monitor.current_util,
+                "max_pods": node["controller"].state["max_pods"],
+                "stale": node["controller"].state["stale"],
+                "draining": bool(node["draining_since"]),
+                "healthy": node["healthy"],
+                "pending": bool(node["pending_since"]),
+                "requested_cpu": round(node["requested"]["cpu"], 2),
+                "allocatable_cpu": node["allocatable"]["cpu"] if node["allocatable"] else None,
+                "cpu_headroom": round(self.cpu_headroom(node), 2) if node["is_active"] and node["allocatable"] else None,
+            }
+            for node in self.nodes.values()
+        }
+
+    # fraction of the cluster pod budget in use, 1.0 means no free slots
+    def cluster_saturation(self):
+        if not self.cluster_metrics.get("total_pods"):
+            return 0.0
+        if self.MAX_CLUSTER_PODS <= 0:
+            return 1.0
+        return self.cluster_metrics["total_pods"][-1]["value"] / self.MAX_CLUSTER_PODS
 
     def avg_cluster_cpu_capacity(self):
         cpu_utils = [node["controller"].monitor.current_util for node in self.nodes.values() if node["is_active"]]
         if not cpu_utils:
             logging.info("Middleware: No active nodes to calculate CPU utilization.")
-            return 0
-        avg_cpu_util = sum(cpu_utils) / len(cpu_utils)
-        logging.info(f"Middleware: Average CPU utilization for cluster is {avg_cpu_util}%")
+            avg_cpu_util = 0
+        else:
+            avg_cpu_util = sum(cpu_utils) / len(cpu_utils)
+            logging.info(f"Middleware: Average CPU utilization for cluster is {avg_cpu_util}%")
+        # recorded so scaling policies can be replayed against cluster_metrics.csv
+        if "avg_cpu_util" not in self.cluster_metrics:
+            self.cluster_metrics["avg_cpu_util"] = []
+        self.cluster_metrics["avg_cpu_util"].append({
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+            "value": avg_cpu_util
+        })
         return avg_cpu_util
     
     def check_metrics_availability(self):
-        retries = 5
-        for _ in range(retries):
-            try:
-                metrics = self.core_v1_api.list_node()  # Or any other metrics call
-                if metrics:
-                    logging.info("Metrics API is available.")
-                    return True
-            except client.rest.ApiException as e:
-                logging.error(f"Error accessing metrics API: {e}")
-            time.sleep(5)
+        # transient errors are retried with backoff by the kube call layer
+        try:
+            metrics = self.core_v1_api.list_node()  # Or any other metrics call
+            if metrics:
+                logging.info("Metrics API is available.")
+                return True
+        except client.rest.ApiException as e:
+            logging.error(f"Error accessing metrics API: {e}")
         logging.error("Failed to access metrics API after retries.")
         return False
     
@@ -148,31 +350,129 @@ class Middleware:
                     type="InternalIP",
                     address=node_info["ip"]
                     )
-                ]
+                ] if node_info["ip"] else None
             )
         )
+        # the cooldown between additions is part of the scaling policy
         try:
-            if self.node_added_before and time.time() - self.node_added_before < 60:
-                logging.info("Middleware: A new node was added in the last 1 minutes. Skipping node addition.")
-                return
             self.core_v1_api.create_node(body=node)
             logging.info(f"Middleware: Node {node_info['name']} created successfully")
         except client.rest.ApiException as e:
             logging.error(f"Middleware: Error creating node: {e}")
-        
-        while True:
-            nodes = self.core_v1_api.list_node()
-            if any(n.metadata.name == node_info["name"] for n in nodes.items):
-                logging.info(f"Middleware: Node {node_info['name']} is now part of the cluster")
-                # make node available
-                node_info["is_active"] = True
-                node_info["can_remove"] = True
-                node_info["was_removed"] = False
-                node_info["low_util_count"] = 0
-                self.node_added_before = time.time()
-                break
-            logging.info(f"Middleware: Waiting for node {node_info['name']} to be added to the cluster...")
-            time.sleep(5)
+            return False
+        if self.warm_start:
+            self.warm_start.on_node_added(node_info["name"])
+        # do not wait for the node to join, refresh_active_nodes activates it once it is listed
+        node_info["pending_since"] = time.time()
+        self.node_added_before = time.time()
+        return True
+
+    def pending_nodes(self):
+        return [node["name"] for node in self.nodes.values() if node["pending_since"] and not node["is_active"]]
+
+    # Pending and Running job pods, the unscheduled ones have no node_name yet
+    def unfinished_job_pods(self):
+        pod_list = self.core_v1_api.list_namespaced_pod(namespace="jobs", field_selector="status.phase!=Succeeded,status.phase!=Failed",
+                                                        label_selector=JOB_POD_SELECTOR)
+        return pod_list.items
+
+    # job-seconds left on each node, jobs without a known timeout count as DRAIN_GRACE
+    def remaining_work(self, pods=None):
+        now = time.time()
+        work = {}
+        for pod in self.unfinished_job_pods() if pods is None else pods:
+            if not pod.spec.node_name:
+                continue
+            remaining = pod_remaining_seconds(pod, now)
+            work[pod.spec.node_name] = work.get(pod.spec.node_name, 0.0) + (self.DRAIN_GRACE if remaining is None else remaining)
+        return work
+
+    def cordon_node(self, node_name, unschedulable=True):
+        self.core_v1_api.patch_node(node_name, {"spec": {"unschedulable": unschedulable}})
+
+    # scale down: cordon now, remove_node once the jobs bound to it are done (progress_drains)
+    def start_drain(self, node_name):
+        node_info = next(node for node in self.nodes.values() if node["name"] == node_name)
+        try:
+            self.cordon_node(node_name)
+        except client.rest.ApiException as e:
+            logging.error(f"Middleware: Error cordoning node {node_name}: {e}")
+            return False
+        # a pod bound before the cordon still starts on the node
+        pods = [pod for pod in self.unfinished_job_pods() if pod.spec.node_name == node_name]
+        remaining = self.remaining_work(pods).get(node_name, 0.0)
+        node_info["draining_since"] = time.time()
+        # stress jobs cannot move, give the longest one its --timeout before deleting pods
+        longest = max([pod_remaining_seconds(pod) or 0.0 for pod in pods], default=0.0)
+        node_info["drain_deadline"] = time.time() + longest + self.DRAIN_GRACE
+        logging.info(f"Middleware: Draining {node_name}, {remaining:.0f} job-seconds left, removing within {longest + self.DRAIN_GRACE:.0f}s")
+        return True
+
+    def cancel_drain(self, node_name):
+        node_info = next(node for node in self.nodes.values() if node["name"] == node_name)
+        try:
+            self.cordon_node(node_name, unschedulable=False)
+        except client.rest.ApiException as e:
+            logging.error(f"Middleware: Error uncordoning node {node_name}: {e}")
+            return False
+        node_info["draining_since"] = None
+        node_info["drain_deadline"] = None
+        logging.info(f"Middleware: Drain of {node_name} cancelled, node takes jobs again")
+        return True
+
+    def draining_nodes(self):
+        return [node["name"] for node in self.nodes.values() if node["draining_since"] and node["is_active"]]
+
+    # Job pods pinned to a cordoned node by their nodetype affinity never schedule: delete them and
+    # return their stress-ng arguments and tenants to be queued again, a pod that never started lost no work.
+    # Job pods have no retries (backoffLimit and backoffLimitPerIndex 0), the Job controller does not replace them
+    def release_unscheduled_pods(self, node, pods):
+        released = []
+        for pod in pods:
+            if pod.spec.node_name or pod_nodetype(pod) != node["label"].get("nodetype"):
+                continue
+            args = pod_job_args(pod)
+            try:
+                self.core_v1_api.delete_namespaced_pod(name=pod.metadata.name, namespace="jobs")
+            except client.rest.ApiException as e:
+                logging.error(f"Middleware: Error deleting unscheduled pod {pod.metadata.name}: {e}")
+                continue
+            if args:
+                released.append((args, pod_tenant(pod)))
+        if released:
+            logging.info(f"Middleware: Requeueing {len(released)} jobs that cannot start on draining {node['name']}")
+        return released
+
+    # remove drained nodes, and nodes whose jobs overran the drain deadline;
+    # returns the stress-ng arguments and tenants of the jobs taken back from them
+    def progress_drains(self):
+        draining = [node for node in self.nodes.values() if node["draining_since"]]
+        if not draining:
+            return []
+        pods = self.unfinished_job_pods()
+        released = []
+        for node in draining:
+            if node["is_active"]:
+                released.extend(self.release_unscheduled_pods(node, pods))
+        running = {}
+        for pod in pods:
+            if pod.spec.node_name:
+                running[pod.spec.node_name] = running.get(pod.spec.node_name, 0) + 1
+        for node in draining:
+            if not node["is_active"]:
+                node["draining_since"] = None
+                continue
+            if running.get(node["name"], 0) and time.time() < node["drain_deadline"]:
+                logging.info(f"Middleware: {node['name']} still runs {running[node['name']]} jobs")
+                continue
+            if running.get(node["name"], 0):
+                logging.error(f"Middleware: {node['name']} drain deadline passed, deleting {running[node['name']]} jobs")
+                self.cleanup_node(node["name"])
+            logging.info(f"Middleware: {node['name']} drained after {time.time() - node['draining_since']:.0f}s")
+            node["draining_since"] = None
+            node["drain_deadline"] = None
+            self.remove_node(node["name"])
+        return released
 
     def remove_node(self, node_name):
         node_info = next(node for node in self.nodes.values() if node["name"] == node_name)
@@ -188,7 +488,7 @@ class Middleware:
 
     def find_inactive_nodes(self):
         for node in self.nodes.values():
-            if not node["is_active"]:
+            if not node["is_active"] and not node["pending_since"]:
                 if node["failure_detected"] and time.time() - self.failure_cool_down < 60:
                     logging.info("Middleware: Node failure was detected in the last 1 minutes. Skipping node addition for now.")
                     continue
@@ -196,50 +496,131 @@ class Middleware:
                     return node["name"]
         return None
 
+    # rebuild the requested side of the ledger from the job pods that hold resources
+    def update_requested(self, pods):
+        requested = {node["name"]: {"cpu": 0.0, "memory": 0.0} for node in self.nodes.values()}
+        by_nodetype = {node["label"].get("nodetype"): node["name"] for node in self.nodes.values()}
+        for pod in pods:
+            if pod.phase not in ("Pending", "Running"):
+                continue
+            # not scheduled yet, the nodetype affinity says where it will run
+            node_name = pod.node or by_nodetype.get(pod.nodetype)
+            if node_name in requested:
+                requested[node_name]["cpu"] += pod.cpu
+                requested[node_name]["memory"] += pod.memory
+        for node in self.nodes.values():
+            node["requested"] = requested[node["name"]]
+
+    # allocatable of the largest listed node per resource, what Job.resources caps requests at; None before any is listed
+    def largest_allocatable(self):
+        sizes = [node["allocatable"] for node in self.nodes.values() if node["allocatable"]]
+        if not sizes:
+            return None
+        return {resource: max(size[resource] for size in sizes) for resource in ("cpu", "memory")}
+
+    # O(1) check of a job's requests against what is left of the node's allocatable
+    def fits(self, node, resources):
+        if not resources or not node["allocatable"]:
+            return True
+        for resource, amount in resources["requests"].items():
+            if node["requested"][resource] + amount > node["allocatable"][resource]:
+                return False
+        return True
+
+    # count a submitted job's requests right away, the next pod list confirms them
+    def reserve(self, node_name, resources, count=1, expected_cpu=0.0):
+        node = next(node for node in self.nodes.values() if node["name"] == node_name)
+        for resource, amount in resources["requests"].items():
+            node["requested"][resource] += count * amount
+        node["submitted_at"] = time.time()
+        if expected_cpu:
+            node["reservations"].append((time.time(), count * expected_cpu))
+            node["expected_cpu"] += count * expected_cpu
+
+    # max_pods of the node's local controller for pods of the next job, under --control mimo
+    # its memory allowance depends on how much memory the job requests
+    def pod_allowance(self, node, resources=None):
+        memory = resources["requests"].get("memory") if resources else None
+        return node["controller"].max_pods_for(memory)
+
+    # pods of this size the node can still take: its local controller's max_pods, within its allocatable,
+    # and with "cpu" placement within its CPU headroom for jobs of expected_cpu cores
+    def free_slots(self, node_name, resources=None, expected_cpu=None):
+        node = next(node for node in self.nodes.values() if node["name"] == node_name)
+        slots = self.pod_allowance(node, resources)
+        headroom = self.cpu_headroom(node) if self.placement == "cpu" and expected_cpu else None
+        if headroom is not None:
+            slots = min(slots, int(headroom // expected_cpu))
+        if resources and node["allocatable"]:
+            for resource, amount in resources["requests"].items():
+                if amount > 0:
+                    slots = min(slots, int((node["allocatable"][resource] - node["requested"][resource]) // amount))
+        return max(slots, 0)
+
     # fill the nodes in orde
-    def determine_next_node(self):
-        active_nodes = [node for node in self.nodes.values() if node["is_active"]]
+    def determine_next_node(self, resources=None, expected_cpu=None):
+        active_nodes = [node for node in self.nodes.values() if node["is_active"] and node["healthy"] and not node["draining_since"]]
         for node in active_nodes:
+            if not self.fits(node, resources):
+                logging.info(f"Middleware: {node['name']} has {node['requested']['cpu']:.1f} of {node['allocatable']['cpu']:.1f} cores "
+                             f"requested, the next job does not fit")
+                continue
+            headroom = self.cpu_headroom(node) if self.placement == "cpu" and expected_cpu is not None else None
+            if headroom is not None:
+                # headroom only ranks the nodes the local controllers let take pods, a stale one is held at no new pods
+                if node["controller"].state["stale"] or self.pod_allowance(node, resources) <= 0:
+                    logging.info(f"Middleware: {node['name']} takes no new pods (stale metrics or max_pods reached)")
+                    continue
+                # a --cpu 6 job needs six times the room of a --cpu 1 job
+                if headroom >= expected_cpu:
+                    return node["name"]
+                logging.info(f"Middleware: {node['name']} has {headroom:.1f} cores of headroom, the next job needs {expected_cpu:.1f}")
             # validate if selected node has capacity
-            if node["controller"].monitor.has_pod_capacity(node["controller"].state["max_pods"]):
+            elif node["controller"].monitor.has_pod_capacity(self.pod_allowance(node, resources)):
                 return node["name"]
         logging.info("Middleware: No active nodes have available pod capacity. Checking for inactive nodes to add.")
         return None
 
     def determine_node_to_remove(self):
-        # determine the node with lowest CPU utilization
-        active_nodes = [node for node in self.nodes.values() if node["is_active"] and node["can_remove"]]
+        # determine the node with the least remaining job-seconds, then the lowest CPU utilization
+        active_nodes = [node for node in self.nodes.values() if node["is_active"] and node["can_remove"] and not node["draining_since"]]
         if not active_nodes:
             return None
-        node = min(active_nodes, key=lambda x: x["controller"].monitor.current_util)
+        try:
+            work = self.remaining_work()
+        except client.ApiException as e:
+            logging.error(f"Middleware: Failed to read running jobs: {e}")
+            work = {}
+        node = min(active_nodes, key=lambda x: (work.get(x["name"], 0.0), x["controller"].monitor.current_util))
         return node["name"]
 
     def get_total_pods(self):
         try:
-            pod_list = self.core_v1_api.list_namespaced_pod(
-                namespace="jobs"
-            )
-            running_pods = len([pod for pod in pod_list.items if pod.status.phase == 'Running'])
-            if "total_pods" not in self.cluster_metrics:
-                self.cluster_metrics["total_pods"] = []
-            self.cluster_metrics["total_pods"].append({
-                "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
-                "value": running_pods
-            })
+            pods = kube.list_compact(self.core_v1_api.list_namespaced_pod, pod_summary, namespace="jobs")
+            running_pods = len([pod for pod in pods if pod.phase == 'Running' and not pod.idle])
+            self.job_pods = pods
+            self.update_requested(pods)
+            self.record_total_pods(running_pods)
             return running_pods
         except client.ApiException as e:
             print(f"Failed to check node capacity: {e}")
             return None
 
+    def record_total_pods(self, running_pods):
+        if "total_pods" not in self.cluster_metrics:
+            self.cluster_metrics["total_pods"] = []
+        self.cluster_metrics["total_pods"].append({
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+            "value": running_pods
+        })
+
     # remove all jobs when removing a node
     def cleanup_node(self, node_name):
         try:
-            pod_list = self.core_v1_api.list_namespaced_pod(
-                namespace="jobs", 
-                field_selector=f'spec.nodeName={node_name}'
-            )
-            for pod in pod_list.items:
-                self.core_v1_api.delete_namespaced_pod(name=pod.metadata.name, namespace=pod.metadata.namespace)
+            pod_names = kube.list_compact(self.core_v1_api.list_namespaced_pod, lambda pod: kube.field(pod, "metadata.name"),
+                                          namespace="jobs", field_selector=f'spec.nodeName={node_name}')
+            for pod_name in pod_names:
+                self.core_v1_api.delete_namespaced_pod(name=pod_name, namespace="jobs")
         except client.ApiException as e:
             logging.error(f"Failed to delete pods: {e}")
     
@@ -254,11 +635,39 @@ class Middleware:
         import csv
         with open('cluster_metrics.csv', mode='w') as file:
             writer = csv.writer(file)
-            writer.writerow(["timestamp", "active_node_count", "max_pods", "total_pods"])
+            writer.writerow(["timestamp", "active_node_count", "max_pods", "total_pods", "avg_cpu_util"])
+            avg_cpu_util = self.cluster_metrics.get("avg_cpu_util", [])
             for i in range(len(self.cluster_metrics["active_node_count"])):
                 writer.writerow([
                     self.cluster_metrics["active_node_count"][i]["timestamp"],
                     self.cluster_metrics["active_node_count"][i]["value"],
                     self.cluster_metrics["max_pods"][i]["value"],
-                    self.cluster_metrics["total_pods"][i]["value"]
+                    self.cluster_metrics["total_pods"][i]["value"],
+                    round(avg_cpu_util[i]["value"], 2) if i < len(avg_cpu_util) else ""
                 ])
+        if self.cluster_metrics.get("jobs") or self.cluster_metrics.get("warm_pool"):
+            self.save_job_metrics()
+
+    def save_job_metrics(self):
+        # per job timings recorded by the JobTracker plus their percentiles
+        import csv
+        from jobs.tracker import LATENCY_METRICS, summarize_jobs, percentile
+        records = list(self.cluster_metrics.get("jobs", []))
+        if records:
+            with open('job_metrics.csv', mode='w') as file:
+                writer = csv.DictWriter(file, fieldnames=list(records[0].keys()))
+                writer.writeheader()
+                writer.writerows(records)
+        summary = summarize_jobs(records)
+        # jobs handed to warm pool pods, submit to running next to the Jobs' start_latency
+        warm_starts = [record["start_latency"] for record in self.cluster_metrics.get("warm_pool", []) if record["start_latency"] is not None]
+        with open('job_metrics_summary.csv', mode='w') as file:
+            writer = csv.writer(file)
+            writer.writerow(["metric", "count", "p50", "p90", "p99"])
+            for metric in LATENCY_METRICS:
+                stats = summary[metric]
+                writer.writerow([metric, stats["count"], stats["p50"], stats["p90"], stats["p99"]])
+            if warm_starts:
+                writer.writerow(["warm_pool_start_latency", len(warm_starts)] + [percentile(warm_starts, q) for q in (50, 90, 99)])
+        logging.info(f"Middleware: {summary['total']} jobs finished, {summary['failed']} failed, "
+                     f"total latency p50: {summary['total_latency']['p50']}s p99: {summary['total_latency']['p99']}s")
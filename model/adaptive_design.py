@@ -0,0 +1,116 @@
+from typing import List, Optional
+import numpy as np
+
+def mser_truncation(samples, batch: int = 5) -> int:
+    """Index where the warm-up transient ends, by the MSER-5 rule.
+
+    The samples are averaged in batches of `batch`, and the cut d minimizing
+    var(batches[d:]) / (n - d)^2 over the first half is taken as steady state.
+    """
+    samples = np.asarray(samples, dtype=float)
+    batches = samples[:len(samples) // batch * batch].reshape(-1, batch).mean(axis=1) if len(samples) >= 2 * batch else samples
+    scale = batch if len(samples) >= 2 * batch else 1
+    n = len(batches)
+    if n < 4:
+        return 0
+    cuts = np.arange(n // 2)
+    scores = [np.var(batches[d:]) / (n - d) ** 2 for d in cuts]
+    return int(cuts[int(np.argmin(scores))] * scale)
+
+def confidence_halfwidth(samples, z: float = 1.96) -> float:
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < 2:
+        return float('inf')
+    return float(z * samples.std(ddof=1) / np.sqrt(len(samples)))
+
+class AdaptiveDesign:
+    """Adaptive pod-level schedule for identifying y(k+1) = a*y(k) + b*u(k).
+
+    Each level stops once the CI of its steady-state CPU utilization is within
+    `ci_tolerance`. The next level is the candidate whose regressor
+    [y_hat - y_op, u - u_op] has the largest prediction variance under the
+    current fit (sequential D-optimal design), and the campaign ends once the
+    relative standard errors of a and b drop below `coef_tolerance`.
+    """
+    def __init__(self, max_pods: int, u_operating_point: float = 8, y_operating_point: float = 80,
+                 ci_tolerance: float = 1.0, min_samples: int = 5, coef_tolerance: float = 0.05, max_levels: int = 12):
+        self.candidates = list(range(1, max_pods + 1))
+        self.u_op = u_operating_point
+        self.y_op = y_operating_point
+        self.ci_tolerance = ci_tolerance
+        self.min_samples = min_samples
+        self.coef_tolerance = coef_tolerance
+        self.max_levels = max_levels
+        self.history = []           # (pods, steady-state cpu util) in run order
+
+    def steady_state(self, samples) -> List[float]:
+        return list(samples[mser_truncation(samples):])
+
+    def step_converged(self, samples) -> bool:
+        steady = self.steady_state(samples)
+        return len(steady) >= self.min_samples and confidence_halfwidth(steady) <= self.ci_tolerance
+
+    def record(self, pods: int, samples) -> Optional[float]:
+        steady = self.steady_state(samples)
+        if not steady:
+            return None
+        mean = float(np.mean(steady))
+        self.history.append((pods, mean))
+        return mean
+
+    def regressors(self):
+        u = np.array([pods for pods, _ in self.history], dtype=float) - self.u_op
+        y = np.array([util for _, util in self.history], dtype=float) - self.y_op
+        return np.column_stack([y[:-1], u[:-1]]), y[1:]
+
+    def fit(self):
+        """Returns (a, b, standard errors) or None while there are too few steps."""
+        X, Y = self.regressors()
+        if len(Y) < 3:
+            return None
+        theta, _, rank, _ = np.linalg.lstsq(X, Y, rcond=None)
+        if rank < 2:
+            return None
+        dof = max(len(Y) - 2, 1)
+        sigma2 = np.sum((Y - X @ theta) ** 2) / dof
+        stderr = np.sqrt(np.diag(sigma2 * np.linalg.pinv(X.T @ X)))
+        return theta[0], theta[1], stderr
+
+    def converged(self) -> bool:
+        fit = self.fit()
+        if fit is None:
+            return False
+        a, b, stderr = fit
+        return bool(np.all(stderr <= self.coef_tolerance * np.abs([a, b])))
+
+    def next_level(self) -> Optional[int]:
+        if len(self.history) >= self.max_levels or self.converged():
+            return None
+        # bootstrap with both ends of the range so the regressors span both directions
+        if len(self.history) < 2:
+            return self.candidates[0] if not self.history else self.candidates[-1]
+
+        X, Y = self.regressors()
+        information = X.T @ X + 1e-6 * np.eye(2)
+        fit = self.fit()
+        last_pods, last_util = self.history[-1]
+        if fit is not None:
+            a, b, _ = fit
+            predicted = a * (last_util - self.y_op) + b * (last_pods - self.u_op)
+        else:
+            predicted = last_util - self.y_op
+        inverse = np.linalg.inv(information)
+        # always step to a different level so every run excites the dynamics
+        candidates = [pods for pods in self.candidates if pods != last_pods] or self.candidates
+        # the level chosen now enters the fit as the regressor of the next step
+        scores = [np.array([predicted, pods - self.u_op]) @ inverse @ np.array([predicted, pods - self.u_op])
+                  for pods in candidates]
+        return candidates[int(np.argmax(scores))]
+
+    def levels(self):
+        """Generator of pod levels; advance it only after record() for the previous level."""
+        while True:
+            level = self.next_level()
+            if level is None:
+                return
+            yield level
@@ -0,0 +1,157 @@
+import argparse
+import csv
+import glob
+from pathlib import Path
+import numpy as np
+
+def load_dataset(file_path):
+    """Max Pods (input u) and CPU Utilization (output y) columns of a stress run CSV."""
+    with open(file_path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    u = np.array([float(row['Max Pods']) for row in rows])
+    y = np.array([float(row['CPU Utilization']) for row in rows])
+    return u, y
+
+def node_name_from_path(file_path):
+    # Node_data_node_1.csv -> node_1
+    stem = Path(file_path).stem
+    return stem[len('Node_data_'):] if stem.startswith('Node_data_') else stem
+
+def build_regressors(u, y, order):
+    """ARX(order, order) regressors: row k is [y(k-1)..y(k-n), u(k-1)..u(k-n)], target y(k)."""
+    N = len(y)
+    rows = np.arange(order, N)
+    X = np.column_stack([y[rows - i] for i in range(1, order + 1)] + [u[rows - i] for i in range(1, order + 1)])
+    return X, y[rows]
+
+def batch_fit(datasets, order, folds=5, ridge=1e-8):
+    """Fit ARX(order) to every dataset at once.
+
+    Normal equations of all datasets are stacked into (n_datasets, p, p) and
+    solved in one batched np.linalg.solve. K-fold cross-validation reuses the
+    same Gram matrices: the training Gram of a fold is the total minus the
+    held-out block. Returns (theta, r2, cv_r2) with one row per dataset;
+    datasets too short for the order get NaN.
+    """
+    p = 2 * order
+    n = len(datasets)
+    gram = np.zeros((n, p, p))
+    moment = np.zeros((n, p))
+    fold_gram = np.zeros((n, folds, p, p))
+    fold_moment = np.zeros((n, folds, p))
+    regressors = []
+    usable = np.zeros(n, dtype=bool)
+
+    for i, (u, y) in enumerate(datasets):
+        X, Y = build_regressors(u, y, order)
+        regressors.append((X, Y))
+        if len(Y) < max(p + 1, folds):
+            continue
+        usable[i] = True
+        gram[i] = X.T @ X
+        moment[i] = X.T @ Y
+        for f, block in enumerate(np.array_split(np.arange(len(Y)), folds)):
+            fold_gram[i, f] = X[block].T @ X[block]
+            fold_moment[i, f] = X[block].T @ Y[block]
+
+    eye = ridge * np.eye(p)
+    theta = np.full((n, p), np.nan)
+    theta[usable] = np.linalg.solve(gram[usable] + eye, moment[usable][..., None])[..., 0]
+    fold_theta = np.full((n, folds, p), np.nan)
+    fold_theta[usable] = np.linalg.solve(gram[usable][:, None] - fold_gram[usable] + eye,
+                                         (moment[usable][:, None] - fold_moment[usable])[..., None])[..., 0]
+
+    r2 = np.full(n, np.nan)
+    cv_r2 = np.full(n, np.nan)
+    for i in np.flatnonzero(usable):
+        X, Y = regressors[i]
+        r2[i] = r2_score(Y, X @ theta[i])
+        predictions = np.empty_like(Y)
+        for f, block in enumerate(np.array_split(np.arange(len(Y)), folds)):
+            predictions[block] = X[block] @ fold_theta[i, f]
+        cv_r2[i] = r2_score(Y, predictions)
+    return theta, r2, cv_r2
+
+def r2_score(y_true, y_pred):
+    var_y = np.var(y_true)
+    if var_y == 0:
+        return np.nan
+    return 1 - np.var(y_true - y_pred) / var_y
+
+def identify(files, orders=(1, 2, 3), u_operating_point=8, y_operating_point=80, folds=5):
+    """Model table rows for every file and order; `best` marks the order with the highest CV R2 per node."""
+    datasets = []
+    for file_path in files:
+        u, y = load_dataset(file_path)
+        datasets.append((u - u_operating_point, y - y_operating_point))
+
+    table = []
+    for order in orders:
+        theta, r2, cv_r2 = batch_fit(datasets, order, folds)
+        for i, file_path in enumerate(files):
+            row = {
+                "node": node_name_from_path(file_path),
+                "order": order,
+                "samples": len(datasets[i][1]),
+                "r2": r2[i],
+                "cv_r2": cv_r2[i],
+                "u_operating_point": u_operating_point,
+                "y_operating_point": y_operating_point,
+            }
+            for k in range(order):
+                row[f"a{k + 1}"] = theta[i, k]
+                row[f"b{k + 1}"] = theta[i, order + k]
+            table.append(row)
+
+    for node in {row["node"] for row in table}:
+        candidates = [row for row in table if row["node"] == node and not np.isnan(row["cv_r2"])]
+        best = max(candidates, key=lambda row: row["cv_r2"], default=None)
+        for row in table:
+            if row["node"] == node:
+                row["best"] = row is best
+    return table
+
+def write_table(table, file_path):
+    # first-order coefficients are named a, b as in LocalController's controllerParams
+    max_order = max(row["order"] for row in table)
+    fields = ["node", "order", "best", "samples", "r2", "cv_r2", "u_operating_point", "y_operating_point"]
+    fields += [f"{c}{k}" for k in range(1, max_order + 1) for c in ("a", "b")]
+    with open(file_path, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields, restval='')
+        writer.writeheader()
+        writer.writerows(table)
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit ARX models of several orders to many nodes at once')
+    parser.add_argument('--files', default='./data/Node_data_*.csv', help='Glob of stress run CSVs, one per node')
+    parser.add_argument('--orders', default='1,2,3', help='Comma separated model orders to fit')
+    parser.add_argument('--folds', type=int, default=5, help='Cross-validation folds')
+    parser.add_argument('--u-operating-point', type=float, default=8)
+    parser.add_argument('--y-operating-point', type=float, default=80)
+    parser.add_argument('--output', default='./data/model_table.csv', help='Model table to write')
+    parser.add_argument('--plot', action='store_true', help='Plot the first-order fit of every node (needs matplotlib)')
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(args.files))
+    if not files:
+        print(f"No datasets match {args.files}")
+        return
+    orders = [int(order) for order in args.orders.split(',')]
+    table = identify(files, orders, args.u_operating_point, args.y_operating_point, args.folds)
+    write_table(table, args.output)
+    for row in table:
+        if row["best"]:
+            print(f"{row['node']}: order {row['order']}, R2 {row['r2']:.4f}, CV R2 {row['cv_r2']:.4f}")
+    print(f"Model table saved in: {args.output}")
+
+    if args.plot:
+        # matplotlib is only imported when plots are requested
+        from model_system import plot_predictions
+        for file_path in files:
+            row = next(r for r in table if r["node"] == node_name_from_path(file_path) and r["order"] == 1)
+            u, y = load_dataset(file_path)
+            y_pred = row["a1"] * (y[:-1] - args.y_operating_point) + row["b1"] * (u[:-1] - args.u_operating_point)
+            plot_predictions(y[1:], y_pred + args.y_operating_point, Path(file_path).stem)
+
+if __name__ == '__main__':
+    main()
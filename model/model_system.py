@@ -1,9 +1,9 @@
-import pandas as pd
-from matplotlib import pyplot as plt 
 import numpy as np
 import argparse
 
 def load_data_from_csv(file_path):
+    # pandas is only needed when reading a dataset, not for the coefficient math
+    import pandas as pd
     data = pd.read_csv(file_path)
     # "CPU Workers" (input u) and "CPU Utilization" (output y)
     u_raw = data['Max Pods'].values
@@ -51,8 +51,65 @@ def calculate_r2(y_true, y_pred):
     
     return r2
 
+#### multi-resource (CPU + memory) model
+# y(k+1) = A y(k) + B u(k), y = [CPU, memory utilization] - operating points,
+# u = [CPU-bound pods, memory-bound (--vm) pods] - operating points
+
+def load_mimo_data_from_csv(file_path):
+    import pandas as pd
+    data = pd.read_csv(file_path)
+    U = data[['CPU Pods', 'Memory Pods']].values.astype(float)
+    Y = data[['CPU Utilization', 'Memory Utilization']].values.astype(float)
+    return U, Y
+
+def load_vm_bytes(file_path):
+    """--vm-bytes of the memory-bound pods (stress_runner.py writes it), None for older data."""
+    import pandas as pd
+    data = pd.read_csv(file_path)
+    return data['VM Bytes'].iloc[0] if 'VM Bytes' in data else None
+
+def mimo_least_squares(U, Y):
+    """A (outputs x outputs) and B (outputs x inputs) minimizing ||Y[1:] - [Y, U] Theta||."""
+    X = np.hstack([Y[:-1], U[:-1]])
+    if np.linalg.matrix_rank(X) < X.shape[1]:
+        raise ValueError("The regressors are rank deficient, vary both pod types in the data.")
+    theta, *_ = np.linalg.lstsq(X, Y[1:], rcond=None)
+    n = Y.shape[1]
+    return theta[:n].T, theta[n:].T
+
+def predict_next_outputs(A, B, U, Y):
+    return Y @ A.T + U @ B.T
+
+def steady_state_gain(A, B):
+    """G = (I - A)^-1 B, the utilization change per pod once the node settled."""
+    return np.linalg.solve(np.eye(A.shape[0]) - A, B)
+
+def print_matrix(name, M):
+    for i, row in enumerate(M):
+        for j, value in enumerate(row):
+            print(f"{name}{i + 1}{j + 1},{value}")
+
+def analyze_mimo(csv_file_path, u_operating_point, y_operating_point):
+    U_raw, Y_raw = load_mimo_data_from_csv(csv_file_path)
+    U = U_raw - np.asarray(u_operating_point)
+    Y = Y_raw - np.asarray(y_operating_point)
+    A, B = mimo_least_squares(U, Y)
+    print_matrix('A', A)
+    print_matrix('B', B)
+    # local_controller.load_gain reads G
+    print_matrix('G', steady_state_gain(A, B))
+    # the memory column of G holds for pods of this size, local_controller scales it by each job's memory
+    vm_bytes = load_vm_bytes(csv_file_path)
+    if vm_bytes is not None:
+        print(f"VMBytes,{vm_bytes}")
+    Y_pred = predict_next_outputs(A, B, U[:-1], Y[:-1])
+    for i, output in enumerate(['CPU', 'Memory']):
+        print(f"R2_{output},{calculate_r2(Y[1:, i], Y_pred[:, i])}")
+
 #### plots
+# matplotlib is imported only when a plot is drawn
 def plot_utilization(x_data, y_data, filename):
+    from matplotlib import pyplot as plt
     plt.figure(figsize=(6, 4))
     plt.scatter(x_data, y_data, marker='o')
     plt.title('# Pods vs CPU Utilization')
@@ -64,6 +121,7 @@ def plot_utilization(x_data, y_data, filename):
     plt.close()
     
 def plot_predictions(y_true, y_pred, filename):
+    from matplotlib import pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.scatter(y_true, y_pred, marker='*')
     
@@ -84,9 +142,16 @@ def plot_predictions(y_true, y_pred, filename):
 def main():
     parser = argparse.ArgumentParser(description='Analyse results for Node or Cluster')
     parser.add_argument('--filename', default='Node_data_node_1_11_14', help='Type of system to stressed')
+    parser.add_argument('--no-plot', action='store_true', help='Only print the coefficients')
+    parser.add_argument('--mimo', action='store_true', help='Fit CPU and memory utilization to CPU-bound and memory-bound pods')
     args = parser.parse_args()
     csv_file_path = f'./data/{args.filename}.csv'
 
+    if args.mimo:
+        # CPU Pods, Memory Pods, CPU Utilization, Memory Utilization columns
+        analyze_mimo(csv_file_path, u_operating_point=(4, 4), y_operating_point=(80, 80))
+        return
+
     # Analyze system
     u_raw, y_raw = load_data_from_csv(csv_file_path)
     u_operating_point =  8 # np.average(u_raw[:-1])
@@ -104,12 +169,14 @@ def main():
     r2_score = calculate_r2(y_normalized[1:], y_pred)
     print(f"R2,{r2_score}")
 
-    plot_predictions(y_raw[1:], y_pred+y_operating_point, args.filename)
-    plot_utilization(u_raw[1:], y_pred+y_operating_point, args.filename)
+    if not args.no_plot:
+        plot_predictions(y_raw[1:], y_pred+y_operating_point, args.filename)
+        plot_utilization(u_raw[1:], y_pred+y_operating_point, args.filename)
 
 if __name__ == '__main__':
     args = argparse.ArgumentParser(description='Analyse results for Node or Cluster')
     args.add_argument('--filename', help='Type of system to stressed')
     # python ./model_system.py --filename 'Node_data_node_1_11_14' > ./data/model.csv
+    # python ./model_system.py --filename 'Node_mimo_data_node1' --mimo > ./data/mimo_model.csv
     # cat ./data/model.csv
     main()
\ No newline at end of file
@@ -4,9 +4,11 @@ import csv
 from typing import List, Dict
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from stressors.stress_cluster import ClusterStressor
-from stressors.stress_node import NodeStressor
+from stressors.stress_node import NodeStressor, CpuNodeStressor, MemoryNodeStressor
+from adaptive_design import AdaptiveDesign
 
 class StressRunner:
     def __init__(self, output_dir: str = "stress_results"):
@@ -19,6 +21,14 @@ class StressRunner:
             writer.writerow(['Max Pods', 'CPU Utilization'])
             for max_pods, cpu_util in data:
                 writer.writerow([max_pods, cpu_util])
+
+    # input of model_system.py --mimo
+    def write_mimo(self, file_name, data):
+        with open(file_name, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['CPU Pods', 'Memory Pods', 'VM Bytes', 'CPU Utilization', 'Memory Utilization'])
+            for row in data:
+                writer.writerow(row)
         
     def run_test(self, StressClass, pods: List[int], duration: int = 300, interval: int = 5, stressors=2, node_name='all') -> Dict:
         results = []
@@ -42,13 +52,138 @@ class StressRunner:
             self.write(f'{self.output_dir}/{stressor.type}_data.csv', results)
             print(f"\nAll results saved in: data/")
 
+class StressCampaign:
+    """Runs the pod-level sweep on several nodes at the same time.
+
+    Each node gets its own NodeStressor on a worker thread. Per node the levels
+    are pipelined: one deployment is scaled through every level, ramp-up
+    samples are skipped with `warmup`, and cleanup happens once at the end.
+
+    With `adaptive` the levels come from an AdaptiveDesign instead: each level
+    stops once its estimate converged, warm-up is detected from the samples,
+    and `levels` only bounds the pod counts that may be chosen.
+
+    With `vm_levels` it records the CPU + memory model instead: CPU-bound and
+    memory-bound (--vm, holding `vm_bytes` each) pods run side by side, every
+    pair of `levels` and `vm_levels` is one level, and both CPU and memory
+    utilization are recorded.
+    """
+    def __init__(self, runner: StressRunner, node_names: List[str], levels: List[int], duration: int = 60,
+                 interval: int = 5, stressors=1, warmup: int = 10, adaptive: bool = False,
+                 vm_levels: List[int] = None, vm_bytes: str = "1G"):
+        self.runner = runner
+        self.node_names = node_names
+        self.levels = levels
+        self.duration = duration
+        self.interval = interval
+        self.stressors = stressors
+        self.warmup = warmup
+        self.adaptive = adaptive
+        self.vm_levels = vm_levels
+        self.vm_bytes = vm_bytes
+
+    def run(self) -> Dict:
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(self.node_names)) as pool:
+            run_node = self.run_node_mimo if self.vm_levels else self.run_node
+            futures = {pool.submit(run_node, node_name): node_name for node_name in self.node_names}
+            for future in as_completed(futures):
+                node_name = futures[future]
+                try:
+                    results[node_name] = future.result()
+                except Exception as e:
+                    print(f"Campaign on {node_name} failed: {e}")
+        return results
+
+    def run_node(self, node_name):
+        # containers must outlive the whole sweep, otherwise they restart mid-level
+        sweep_time = len(self.levels) * (self.duration + self.warmup + 60)
+        stressor = NodeStressor(
+            pods=self.levels[0],
+            duration=self.duration,
+            poll_every=self.interval,
+            node_name=node_name,
+            stressors=self.stressors,
+            stress_timeout=sweep_time
+        )
+        results = []
+        design = AdaptiveDesign(max(self.levels)) if self.adaptive else None
+
+        def on_level(level, cpu_utils):
+            samples = [util for utils in cpu_utils.values() for util in utils]
+            if not samples:
+                return
+            if design:
+                mean = design.record(level, samples)
+            else:
+                mean = float(np.mean(samples))
+            results.append((level, mean))
+            # keep partial results if the campaign is interrupted
+            self.runner.write(f'{self.runner.output_dir}/{stressor.type}_data_{stressor.node_name}.csv', results)
+
+        if design:
+            stressor.run_levels(design.levels(), on_level=on_level, stop=design.step_converged)
+            fit = design.fit()
+            if fit:
+                print(f"{node_name}: a,{fit[0]} b,{fit[1]} after {len(results)} levels")
+        else:
+            stressor.run_levels(self.levels, warmup=self.warmup, on_level=on_level)
+        return results
+
+    def run_node_mimo(self, node_name):
+        # serpentine over the memory levels, so consecutive rows differ in one pod type at a time
+        levels = [(cpu_pods, vm_pods) for index, cpu_pods in enumerate(self.levels)
+                  for vm_pods in (self.vm_levels if index % 2 == 0 else self.vm_levels[::-1])]
+        sweep_time = len(levels) * (self.duration + self.warmup + 60)
+        cpu_stressor = CpuNodeStressor(pods=levels[0][0], duration=self.duration, poll_every=self.interval, node_name=node_name,
+                                       stressors=self.stressors, stress_timeout=sweep_time)
+        vm_stressor = MemoryNodeStressor(pods=levels[0][1], duration=self.duration, poll_every=self.interval, node_name=node_name,
+                                         vm_bytes=self.vm_bytes, stress_timeout=sweep_time)
+        file_name = f'{self.runner.output_dir}/{cpu_stressor.type}_mimo_data_{cpu_stressor.node_name}.csv'
+        results = []
+        try:
+            for index, (cpu_pods, vm_pods) in enumerate(levels):
+                for stressor, pods in ((cpu_stressor, cpu_pods), (vm_stressor, vm_pods)):
+                    if index:
+                        stressor.scale(pods)
+                    else:
+                        stressor.pods = pods
+                        stressor.deploy_stress_ng_pods()
+                if not (cpu_stressor.wait_for_pods_ready() and vm_stressor.wait_for_pods_ready()):
+                    print(f"Failed to start {cpu_pods} CPU and {vm_pods} memory pods, skipping level...")
+                    continue
+                time.sleep(self.warmup)
+                cpu_utils, memory_utils = [], []
+                start_time = time.time()
+                while time.time() - start_time < self.duration:
+                    cpu_util = cpu_stressor.get_cpu_utilization()
+                    memory_util = cpu_stressor.get_memory_utilization()
+                    if cpu_util and memory_util:
+                        cpu_utils.append(cpu_util)
+                        memory_utils.append(memory_util)
+                    time.sleep(self.interval)
+                if not cpu_utils:
+                    continue
+                results.append((cpu_pods, vm_pods, self.vm_bytes, float(np.mean(cpu_utils)), float(np.mean(memory_utils))))
+                # keep partial results if the campaign is interrupted
+                self.runner.write_mimo(file_name, results)
+        finally:
+            cpu_stressor.cleanup()
+            vm_stressor.cleanup()
+        return results
+
 def main():
     parser = argparse.ArgumentParser(description='Run stress tests for the cluster or just a node')
-    parser.add_argument('--type', choices=['cluster', 'node'], default='cluster', help='Type of system to stress')
+    parser.add_argument('--type', choices=['cluster', 'node', 'campaign'], default='cluster', help='Type of system to stress')
     parser.add_argument('--interval', type=int, default=5, help='Interval to poll CPU utilization')
     parser.add_argument('--time', type=int, default=60, help='Duration of the stress test (Seconds)')
     parser.add_argument('--max-pods', type=int, default=2, help='Maximum number of pods to stress')
     parser.add_argument('--max-stressors', type=int, default=1, help='Maximum number of stressors to run')
+    parser.add_argument('--nodes', default='node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us', help='Comma separated nodes stressed in parallel by a campaign')
+    parser.add_argument('--warmup', type=int, default=10, help='Seconds of ramp-up discarded at each campaign level')
+    parser.add_argument('--adaptive', action='store_true', help='Campaign picks levels and stops each one once its estimate converged')
+    parser.add_argument('--max-vm-pods', type=int, default=0, help='Campaign also runs 0..N memory-bound pods next to the CPU-bound ones, for model_system.py --mimo')
+    parser.add_argument('--vm-bytes', default='1G', help='Memory each memory-bound pod holds (stress-ng --vm-bytes)')
     args = parser.parse_args()
     
     runner = StressRunner(output_dir='data')
@@ -63,5 +198,13 @@ def main():
         runner.run_test(NodeStressor, args.max_pods, args.time, args.interval, args.max_stressors, node_name='node1.goyal-project.ufl-eel6871-fa24-pg0.utah.cloudlab.us')
         print("\nDocker tests completed!")
 
+    if args.type == 'campaign':
+        print("\nStarting parallel node campaign...")
+        campaign = StressCampaign(runner, args.nodes.split(','), list(range(1, args.max_pods + 1)),
+                                  args.time, args.interval, args.max_stressors, args.warmup, args.adaptive,
+                                  list(range(0, args.max_vm_pods + 1)) if args.max_vm_pods else None, args.vm_bytes)
+        campaign.run()
+        print("\nCampaign completed!")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,6 +3,8 @@ import kubernetes
 from kubernetes import client, config
 from kubernetes.client import CustomObjectsApi
 
+from stressors.waiters import wait_for_running_pods, wait_for_deployment_deleted
+
 class ClusterStressor:
     def __init__(self, pods, duration=300, poll_every=5, image="polinux/stress-ng", namespace="default", node_name='all', stressors=2):
         self.duration = duration
@@ -73,23 +75,10 @@ class ClusterStressor:
 
     def wait_for_pods_ready(self):
         print("Waiting for pods to be ready...")
-        max_wait = 60
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            pods = self.core_v1_api.list_namespaced_pod(
-                namespace=self.namespace, 
-                label_selector="app=stress-ng"
-            )
-            
-            running_pods = len([p for p in pods.items if p.status.phase == "Running"])
-            
-            if running_pods == self.pods:
-                print(f"All {self.pods} pods are running")
-                return True
-            
-            time.sleep(2)
-        
+        if wait_for_running_pods(self.core_v1_api, self.namespace, "app=stress-ng", self.pods, timeout=60):
+            print(f"All {self.pods} pods are running")
+            return True
+
         print(f"Timeout waiting for pods to be ready")
         return False
     
@@ -108,18 +97,8 @@ class ClusterStressor:
                 if e.status != 404:  # Ignore if deployment doesn't exist
                     raise
 
-            while True:
-                try:
-                    self.apps_v1_api.read_namespaced_deployment(
-                        name="stress-ng",
-                        namespace=self.namespace
-                    )
-                    print("Waiting for deployment to be deleted...")
-                    time.sleep(2)
-                except kubernetes.client.rest.ApiException as e:
-                    if e.status == 404:
-                        break
-                    raise
+            print("Waiting for deployment to be deleted...")
+            wait_for_deployment_deleted(self.apps_v1_api, self.namespace, "stress-ng")
 
             # Double check and force delete any lingering pods
             try:
@@ -2,10 +2,15 @@ import time
 import kubernetes
 from kubernetes import client, config
 from kubernetes.client import CustomObjectsApi
+from kubernetes.utils import parse_quantity
+
+from stressors.waiters import wait_for_running_pods, wait_for_deployment_deleted
 
 class NodeStressor:
-    def __init__(self, pods, duration, node_name, poll_every=5, image="polinux/stress-ng", namespace="default", stressors=2):
+    def __init__(self, pods, duration, node_name, poll_every=5, image="polinux/stress-ng", namespace="default", stressors=2, stress_timeout=None):
         self.duration = duration
+        # how long each stress-ng container runs, longer than duration when levels are pipelined
+        self.stress_timeout = stress_timeout or duration
         self.pods = pods
         self.type = 'Node'
         self.image = image
@@ -15,6 +20,8 @@ class NodeStressor:
         self.node_cluster_name = node_name
         self.poll_interval = poll_every
         self.cpu_stressor = stressors
+        # deployment name and pod label
+        self.app = f"stress-ng-node{self.worker_number}"
         
         # Load Kubernetes configuration
         config.load_kube_config()
@@ -24,36 +31,39 @@ class NodeStressor:
         
         print(f"Node name: {self.node_name}, Worker number: {self.worker_number} started...")
 
+    def stress_args(self):
+        return [
+            "--cpu", str(self.cpu_stressor),
+            "--io", "2",
+            "--vm", "1",
+            "--vm-bytes", "1G",
+            "--timeout", str(self.stress_timeout),  # Add buffer time
+            "--metrics-brief"
+        ]
+
     def create_stress_ng_deployment(self):
         deployment = client.V1Deployment(
             api_version="apps/v1",
             kind="Deployment",
             metadata=client.V1ObjectMeta(
-                name=f"stress-ng-node{self.worker_number}",
+                name=self.app,
                 namespace=self.namespace
             ),
             spec=client.V1DeploymentSpec(
                 replicas=1,
                 selector=client.V1LabelSelector(
-                    match_labels={"app": f"stress-ng-node{self.worker_number}"}
+                    match_labels={"app": self.app}
                 ),
                 template=client.V1PodTemplateSpec(
                     metadata=client.V1ObjectMeta(
-                        labels={"app": f"stress-ng-node{self.worker_number}"}
+                        labels={"app": self.app}
                     ),
                     spec=client.V1PodSpec(
                         containers=[
                             client.V1Container(
                                 name="stress-ng",
                                 image=self.image,
-                                args=[
-                                    "--cpu", str(self.cpu_stressor),
-                                    "--io", "2",
-                                    "--vm", "1",
-                                    "--vm-bytes", "1G",
-                                    "--timeout", str(self.duration),  # Add buffer time
-                                    "--metrics-brief"
-                                ]
+                                args=self.stress_args()
                             )
                         ],
                         # Add node affinity to ensure pods run on specified node 
@@ -94,7 +104,7 @@ class NodeStressor:
         # Cleanup the environment before starting a new test
         try:
             self.apps_v1_api.read_namespaced_deployment(
-                name=f"stress-ng-node{self.worker_number}",
+                name=self.app,
                 namespace=self.namespace
             )
             self.cleanup()
@@ -109,33 +119,29 @@ class NodeStressor:
         )
         # Scale
         self.apps_v1_api.patch_namespaced_deployment_scale(
-            name=f"stress-ng-node{self.worker_number}",
+            name=self.app,
             namespace=self.namespace,
             body=client.V1Scale(spec=client.V1ScaleSpec(replicas=self.pods))
         )
 
     def wait_for_pods_ready(self):
         print("Waiting for pods to be ready...")
-        max_wait = 60
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            pods = self.core_v1_api.list_namespaced_pod(
-                namespace=self.namespace, 
-                label_selector=f"app=stress-ng-node{self.worker_number}"
-            )
-            
-            running_pods = len([p for p in pods.items if p.status.phase == "Running"])
-            
-            if running_pods == self.pods:
-                print(f"All {self.pods} pods are running on {self.node_name}")
-                return True
-            
-            time.sleep(2)
-        
+        if wait_for_running_pods(self.core_v1_api, self.namespace, f"app={self.app}", self.pods, timeout=60):
+            print(f"All {self.pods} pods are running on {self.node_name}")
+            return True
+
         print(f"Timeout waiting for pods to be ready")
         return False
 
+    # change the pod count of a running experiment in place
+    def scale(self, pods):
+        self.pods = pods
+        self.apps_v1_api.patch_namespaced_deployment_scale(
+            name=self.app,
+            namespace=self.namespace,
+            body=client.V1Scale(spec=client.V1ScaleSpec(replicas=self.pods))
+        )
+
     def get_cpu_utilization(self):
         try:
             metrics = self.custom_api.list_cluster_custom_object(
@@ -161,12 +167,29 @@ class NodeStressor:
             print(f"Error getting CPU metrics: {e}")
             return []
 
+    def get_memory_utilization(self):
+        try:
+            item = self.custom_api.get_cluster_custom_object(
+                group="metrics.k8s.io",
+                version="v1beta1",
+                plural="nodes",
+                name=self.node_cluster_name
+            )
+            memory_usage = parse_quantity(item['usage']['memory'])
+            node = self.core_v1_api.read_node(self.node_cluster_name)
+            memory_percent = float(memory_usage / parse_quantity(node.status.capacity['memory'])) * 100
+            print(f"Memory Utilization: {round(memory_percent, 2)}%")
+            return round(memory_percent, 2)
+        except Exception as e:
+            print(f"Error getting memory metrics: {e}")
+            return []
+
     def cleanup(self):
         print("Cleaning up resources...")
         try:
             try:
                 self.apps_v1_api.delete_namespaced_deployment(
-                    name=f"stress-ng-node{self.worker_number}",
+                    name=self.app,
                     namespace=self.namespace,
                     propagation_policy="Foreground"
                 )
@@ -174,26 +197,15 @@ class NodeStressor:
                 if e.status != 404:
                     raise e
                 
-            # check if pods are deleted
             # Wait for deployment to be fully deleted
-            while True:
-                try:
-                    self.apps_v1_api.read_namespaced_deployment(
-                        name=f"stress-ng-node{self.worker_number}",
-                        namespace=self.namespace
-                    )
-                    print("Waiting for deployment to be deleted...")
-                    time.sleep(2)
-                except kubernetes.client.rest.ApiException as e:
-                    if e.status == 404:
-                        break
-                    raise
+            print("Waiting for deployment to be deleted...")
+            wait_for_deployment_deleted(self.apps_v1_api, self.namespace, self.app)
 
             # Double check and force delete any lingering pods
             try:
                 pods = self.core_v1_api.list_namespaced_pod(
                     namespace=self.namespace,
-                    label_selector=f"app=stress-ng-node{self.worker_number}"
+                    label_selector=f"app={self.app}"
                 )
                 for pod in pods.items:
                     print(f'Force deleting pod {pod.metadata.name}')
@@ -228,8 +240,37 @@ class NodeStressor:
             print("An error occurred during the experiment")
         finally:
             self.cleanup()
-        
-    def monitor(self):
+
+    def run_levels(self, levels, warmup=0, on_level=None, stop=None):
+        """Pipelined sweep: deploy once and scale the same deployment through
+        every pod level, cleaning up only at the end. `levels` may be a generator
+        that picks the next level from earlier results. Returns {level: cpu_utils}."""
+        results = {}
+        deployed = False
+        try:
+            print(f"Starting pipelined experiment on node {self.node_cluster_name}")
+            for level in levels:
+                if deployed:
+                    self.scale(level)
+                else:
+                    self.pods = level
+                    self.deploy_stress_ng_pods()
+                    deployed = True
+                if not self.wait_for_pods_ready():
+                    print(f"Failed to start {level} pods, skipping level...")
+                    continue
+                results[level] = self.monitor(warmup, stop)
+                if on_level:
+                    on_level(level, results[level])
+            return results
+        finally:
+            self.cleanup()
+
+    # stop(samples) may end the level before duration, e.g. once the estimate converged
+    def monitor(self, warmup=0, stop=None):
+        # samples taken while the new pods ramp up are discarded
+        if warmup:
+            time.sleep(warmup)
         start_time = time.time()
         cpu_utils = {}
         cpu_utils[self.node_name] = []
@@ -239,9 +280,28 @@ class NodeStressor:
                 utilization = self.get_cpu_utilization()
                 if utilization:
                     cpu_utils[self.node_name].append(utilization)
+                    if stop and stop(cpu_utils[self.node_name]):
+                        print(f"Estimate converged after {len(cpu_utils[self.node_name])} samples.")
+                        break
                 time.sleep(self.poll_interval)
             except Exception as e:
                 print(f"Error during monitoring: {e}")
                 
         print(f"Test completed.")
-        return cpu_utils
\ No newline at end of file
+        return cpu_utils
+
+class CpuNodeStressor(NodeStressor):
+    """CPU-bound pods for the CPU + memory model: --cpu workers only, no memory beyond stress-ng's own."""
+    def stress_args(self):
+        return ["--cpu", str(self.cpu_stressor), "--timeout", str(self.stress_timeout), "--metrics-brief"]
+
+class MemoryNodeStressor(NodeStressor):
+    """Memory-bound pods for the CPU + memory model: one --vm worker each, holding vm_bytes."""
+    def __init__(self, pods, duration, node_name, vm_bytes="1G", **kwargs):
+        super().__init__(pods, duration, node_name, **kwargs)
+        self.vm_bytes = vm_bytes
+        self.app = f"stress-ng-vm-node{self.worker_number}"
+
+    def stress_args(self):
+        # --vm-keep holds the memory instead of freeing and mapping it again
+        return ["--vm", "1", "--vm-bytes", self.vm_bytes, "--vm-keep", "--timeout", str(self.stress_timeout), "--metrics-brief"]
@@ -0,0 +1,56 @@
+import time
+from kubernetes import client, watch
+
+def wait_for_running_pods(core_v1_api, namespace, label_selector, count, timeout=60):
+    """Block until `count` pods matching the selector are Running, using a watch instead of polling."""
+    deadline = time.time() + timeout
+    pods = core_v1_api.list_namespaced_pod(namespace=namespace, label_selector=label_selector)
+    running = {p.metadata.name for p in pods.items if p.status.phase == "Running"}
+    if len(running) == count:
+        return True
+
+    w = watch.Watch()
+    try:
+        for event in w.stream(core_v1_api.list_namespaced_pod, namespace=namespace, label_selector=label_selector,
+                              resource_version=pods.metadata.resource_version,
+                              timeout_seconds=max(int(deadline - time.time()), 1)):
+            pod = event["object"]
+            if event["type"] != "DELETED" and pod.status.phase == "Running":
+                running.add(pod.metadata.name)
+            else:
+                running.discard(pod.metadata.name)
+            if len(running) == count:
+                return True
+            if time.time() > deadline:
+                break
+    finally:
+        w.stop()
+    return False
+
+def wait_for_deployment_deleted(apps_v1_api, namespace, name, timeout=300):
+    """Block until the deployment is gone, using a watch instead of polling read_namespaced_deployment."""
+    deadline = time.time() + timeout
+    field_selector = f"metadata.name={name}"
+    deployments = apps_v1_api.list_namespaced_deployment(namespace=namespace, field_selector=field_selector)
+    if not deployments.items:
+        return True
+
+    w = watch.Watch()
+    try:
+        for event in w.stream(apps_v1_api.list_namespaced_deployment, namespace=namespace, field_selector=field_selector,
+                              resource_version=deployments.metadata.resource_version,
+                              timeout_seconds=max(int(deadline - time.time()), 1)):
+            if event["type"] == "DELETED":
+                return True
+            if time.time() > deadline:
+                break
+    finally:
+        w.stop()
+    # the watch may have expired without an event, check once more
+    try:
+        apps_v1_api.read_namespaced_deployment(name=name, namespace=namespace)
+        return False
+    except client.exceptions.ApiException as e:
+        if e.status == 404:
+            return True
+        raise
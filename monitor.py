@@ -1,51 +1,57 @@
 import logging
-from kubernetes import client, config
+import kube
+from kube import client
+from jobs.job import JOB_POD_SELECTOR
+
+from metrics_backend import MetricsServerBackend
 
 class MonitorNode:
-    def __init__(self, node):
+    def __init__(self, node, backend=None):
         self.node_name = node
         self.current_util = 0.0
-        
-        config.load_kube_config()
-        self.core_v1_api = client.CoreV1Api()
-        # metric api
-        self.custom_api = client.CustomObjectsApi()
-        
+        self.current_memory_util = 0.0
+
+        self.core_v1_api = kube.core_v1()
+        # metric api, usually a CachedMetricsBackend shared by all nodes
+        self.backend = backend or MetricsServerBackend()
+        self.backend.register(self.node_name)
+
     def get_node_cpu_util(self):
+        sample = self.get_node_cpu_sample()
+        if sample:
+            return sample["util"]
+
+    # CPU utilization together with the sample time and window
+    def get_node_cpu_sample(self):
         try:
-            metrics = self.custom_api.get_cluster_custom_object(
-                group="metrics.k8s.io",
-                version="v1beta1",
-                plural="nodes",
-                name=self.node_name
-            )
-
-            cpu_usage = metrics['usage']['cpu']
-            if cpu_usage.endswith('n'):
-                cpu_usage_nano = float(cpu_usage.rstrip('n'))
-            elif cpu_usage.endswith('u'):
-                cpu_usage_nano = float(cpu_usage.rstrip('u')) * 1000
-            else:
-                raise ValueError(f"Unsupported CPU metric unit: {cpu_usage}")
-
-            node = self.core_v1_api.read_node(self.node_name)
-            cpu_capacity = float(node.status.capacity['cpu']) * 1e9
-
-            cpu_util = (cpu_usage_nano / cpu_capacity) * 100
-            self.current_util = cpu_util
-            logging.info(f"Node: {self.node_name}: CPU utilization: {cpu_util}%")
-            return cpu_util
+            sample = self.backend.get_node_sample(self.node_name)
+            if sample is None:
+                logging.error(f"Node: {self.node_name}: No metrics available")
+                return None
+            self.current_util = sample["util"]
+            if sample.get("memory_util") is not None:
+                self.current_memory_util = sample["memory_util"]
+            logging.info(f"Node: {self.node_name}: CPU utilization: {sample['util']}%")
+            return sample
 
         except Exception as e:
             logging.error(f"Node: {self.node_name}: Error getting metrics: {e}")
-    
+
+    # CPU (cores) and memory (bytes) per pod in the namespace running on this node
+    def get_pod_usage(self, namespace="jobs"):
+        try:
+            samples = self.backend.get_pod_samples(namespace)
+        except Exception as e:
+            logging.error(f"Node: {self.node_name}: Error getting pod metrics: {e}")
+            return {}
+        return {key: sample for key, sample in samples.items() if sample["node"] in (None, self.node_name)}
+
     def get_running_pod_count(self):
-        pod_list = self.core_v1_api.list_namespaced_pod(
-            namespace="jobs",
-            field_selector=f'spec.nodeName={self.node_name}'
-        )
-        running_pods = len([pod for pod in pod_list.items if pod.status.phase == 'Running'])
-        return running_pods
+        # only counted, so filter on the server and skip decoding the pods into models
+        pods = kube.list_compact(self.core_v1_api.list_namespaced_pod, lambda pod: None, namespace="jobs",
+                                 field_selector=f'spec.nodeName={self.node_name},status.phase=Running',
+                                 label_selector=JOB_POD_SELECTOR)
+        return len(pods)
     
     def has_pod_capacity(self, max_pods_allowed_by_ctrlr) -> bool:
         try:
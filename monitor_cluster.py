@@ -1,27 +1,147 @@
-import subprocess
+import os
+import sys
+import json
 import time
+import argparse
+import threading
+import kube
 
-def run_command(command):
-    try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode == 0:
-            return result.stdout.strip()
+from informer import Informer
+
+class ClusterDashboard:
+    """Live terminal view of the cluster and the controller.
+
+    Nodes and job pods come from watch caches (one list, then only changes),
+    per node utilization and max_pods from the snapshot file the controller
+    writes after every cycle. Pods are kept as (node, phase) read from the
+    raw JSON, not as V1Pod models. The screen is redrawn only when one of
+    them changed, at most once per refresh interval however many events
+    arrive, so leaving it running costs next to nothing even on large
+    clusters.
+    """
+    def __init__(self, snapshot_path, namespace="jobs", refresh=0.5):
+        self.snapshot_path = snapshot_path
+        self.refresh = refresh
+        self.snapshot = {}
+        self.snapshot_mtime = None
+        self.changed = threading.Event()
+
+        core_v1_api = kube.core_v1()
+        self.node_informer = Informer(core_v1_api.list_node, name="dashboard-nodes")
+        self.pod_informer = Informer(core_v1_api.list_namespaced_pod, name="dashboard-pods", namespace=namespace,
+                                     extract=lambda pod: (kube.field(pod, "spec.nodeName"), kube.field(pod, "status.phase", "Unknown")))
+        for informer in (self.node_informer, self.pod_informer):
+            informer.add_handler(lambda event_type, obj: self.changed.set())
+
+    def start(self):
+        self.node_informer.start()
+        self.pod_informer.start()
+        self.node_informer.wait_for_sync(timeout=10)
+        self.pod_informer.wait_for_sync(timeout=10)
+
+    def stop(self):
+        self.node_informer.stop()
+        self.pod_informer.stop()
+
+    def load_snapshot(self):
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime
+        except OSError:
+            return
+        if mtime == self.snapshot_mtime:
+            return
+        try:
+            with open(self.snapshot_path, 'r') as file:
+                self.snapshot = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.snapshot_mtime = mtime
+        self.changed.set()
+
+    def pod_counts(self):
+        counts = {}
+        for node_name, phase in self.pod_informer.items():
+            per_node = counts.setdefault(node_name, {})
+            per_node[phase] = per_node.get(phase, 0) + 1
+        return counts
+
+    def render(self):
+        now = time.time()
+        snapshot_nodes = self.snapshot.get("nodes", {})
+        counts = self.pod_counts()
+        lines = []
+        if self.snapshot:
+            age = now - self.snapshot["timestamp"]
+            lines.append(f"controller: {'leader' if self.snapshot['leader'] else 'standby'}, "
+                         f"cycle {self.snapshot['cycle_latency'] * 1000:.0f} ms, updated {age:.0f}s ago")
+            lines.append(f"queue depth: {self.snapshot['queue_depth']}   submit rate: {self.snapshot['submit_rate']:.1f}/min   "
+                         f"submitted: {self.snapshot['submitted_jobs']}   cluster max_pods: {self.snapshot['max_cluster_pods']}")
+            api = self.snapshot.get("api", {})
+            if api:
+                calls = sum(stats["calls"] for stats in api.values())
+                slowest = max(api, key=lambda endpoint: api[endpoint]["mean_latency_s"])
+                lines.append(f"api calls: {calls}   errors: {sum(stats['errors'] for stats in api.values())}   "
+                             f"retries: {sum(stats['retries'] for stats in api.values())}   "
+                             f"throttled: {sum(stats['throttled_s'] for stats in api.values()):.1f}s   "
+                             f"slowest: {slowest.split('.')[-1]} {api[slowest]['mean_latency_s'] * 1000:.0f} ms")
         else:
-            return f"Error: {result.stderr.strip()}"
-    except Exception as e:
-        return f"Exception occurred: {str(e)}"
+            lines.append(f"controller: no snapshot at {self.snapshot_path}")
+        lines.append("")
+        lines.append(f"{'NODE':<40} {'STATUS':<12} {'CPU%':>6} {'MAX_PODS':>8} {'RUNNING':>8} {'PENDING':>8}")
 
-def main():
-    while True:
-        print("\n=== kubectl top nodes ===")
-        top_nodes_output = run_command(["kubectl", "top", "nodes"])
-        print(top_nodes_output)
+        nodes = {node.metadata.name: node for node in self.node_informer.items()}
+        for name in sorted(set(nodes) | set(snapshot_nodes)):
+            node = nodes.get(name)
+            state = snapshot_nodes.get(name, {})
+            if node is None:
+                status = "pending" if state.get("pending") else "absent"
+            elif state.get("draining") or (node.spec and node.spec.unschedulable):
+                status = "draining"
+            else:
+                ready = [c.status for c in (node.status.conditions or []) if c.type == "Ready"] if node.status else []
+                status = "ready" if ready == ["True"] else "notready"
+            if state.get("stale"):
+                status += "*"
+            util = f"{state['util']:.1f}" if "util" in state else "-"
+            max_pods = str(state["max_pods"]) if "max_pods" in state else "-"
+            phases = counts.get(name, {})
+            lines.append(f"{name.split('.')[0]:<40} {status:<12} {util:>6} {max_pods:>8} {phases.get('Running', 0):>8} {phases.get('Pending', 0):>8}")
+        unscheduled = counts.get(None, {}).get("Pending", 0)
+        if unscheduled:
+            lines.append(f"{'(unscheduled)':<40} {'':<12} {'':>6} {'':>8} {'':>8} {unscheduled:>8}")
+        lines.append("")
+        lines.append("* metrics stale")
+        # home the cursor and clear, then draw the frame in one write
+        sys.stdout.write("\033[H\033[J" + "\n".join(lines) + "\n")
+        sys.stdout.flush()
 
-        print("\n=== kubectl get pods --namespace=jobs ===")
-        get_pods_output = run_command(["kubectl", "get", "pods", "--namespace=jobs"])
-        print(get_pods_output)
+    def run(self):
+        self.changed.set()
+        rendered_at = 0.0
+        while True:
+            self.load_snapshot()
+            if self.changed.wait(self.refresh):
+                # the events of one refresh interval share a frame
+                time.sleep(max(rendered_at + self.refresh - time.monotonic(), 0))
+                self.changed.clear()
+                self.render()
+                rendered_at = time.monotonic()
 
-        time.sleep(5)
+def main():
+    parser = argparse.ArgumentParser(description='Live dashboard of the nodes, job pods and controller state')
+    parser.add_argument('--snapshot-file', default='controller_snapshot.json', help='Snapshot written by main.py --snapshot-file')
+    parser.add_argument('--namespace', default='jobs', help='Namespace of the job pods')
+    parser.add_argument('--refresh', type=float, default=0.5, help='Seconds between checks for changes, and at least between redraws')
+    args = parser.parse_args()
+
+    dashboard = ClusterDashboard(args.snapshot_file, args.namespace, args.refresh)
+    dashboard.start()
+    try:
+        dashboard.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dashboard.stop()
 
 if __name__ == "__main__":
     main()
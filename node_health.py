@@ -0,0 +1,119 @@
+import time
+import logging
+import threading
+import kube
+
+from informer import Informer
+
+class NodeHealthMonitor:
+    """Node failure detection from kubelet heartbeats instead of node absence.
+
+    Watches the Node objects (Ready condition) and their Leases in
+    kube-node-lease. A node is unhealthy as soon as Ready is not True, or once
+    its kubelet missed `miss_threshold` lease renewals, i.e. its renewTime has
+    not changed for miss_threshold renew intervals (a quarter of the lease
+    duration, as the kubelet renews). Renewals are timed on the local clock
+    when they are seen, so clock skew to the nodes does not matter.
+
+    With watch=False nothing runs in the background and poll() relists both,
+    e.g. against the simulated cluster.
+    """
+    NODE_LEASE_NAMESPACE = "kube-node-lease"
+    DEFAULT_LEASE_DURATION = 40     # seconds, kubelet --node-lease-duration-seconds
+
+    def __init__(self, miss_threshold=2, watch=True, on_change=None):
+        self.miss_threshold = miss_threshold
+        self.watch = watch
+        self.on_change = on_change      # called as on_change(node_name, healthy) on transitions
+        self.ready = {}                 # node -> Ready condition is True
+        self.renewals = {}              # node -> (renew_time, observed_at, lease_duration)
+        self.healthy = {}               # node -> last reported health
+        self.lock = threading.Lock()
+
+        self.node_informer = Informer(kube.core_v1().list_node, name="node-health")
+        self.lease_informer = Informer(kube.coordination_v1().list_namespaced_lease, name="node-leases",
+                                       namespace=self.NODE_LEASE_NAMESPACE)
+        self.node_informer.add_handler(self.on_node_event)
+        self.lease_informer.add_handler(self.on_lease_event)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if not self.watch:
+            return
+        self.node_informer.start()
+        self.lease_informer.start()
+        # lease misses show up without any event, check for them in between
+        self.thread = threading.Thread(target=self.run, name="node-health", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.node_informer.stop()
+        self.lease_informer.stop()
+
+    def run(self):
+        while not self.stopped.wait(1.0):
+            self.evaluate()
+
+    def poll(self):
+        self.node_informer.relist()
+        self.lease_informer.relist()
+        self.evaluate()
+
+    def on_node_event(self, event_type, node):
+        name = node.metadata.name
+        with self.lock:
+            if event_type == "DELETED":
+                self.ready.pop(name, None)
+                self.renewals.pop(name, None)
+                self.healthy.pop(name, None)
+                return
+            conditions = (node.status.conditions if node.status else None) or []
+            self.ready[name] = any(c.type == "Ready" and c.status == "True" for c in conditions)
+        self.evaluate(name)
+
+    def on_lease_event(self, event_type, lease):
+        name = lease.metadata.name
+        if event_type == "DELETED" or not lease.spec:
+            return
+        with self.lock:
+            previous = self.renewals.get(name)
+            if previous is None or previous[0] != lease.spec.renew_time:
+                self.renewals[name] = (lease.spec.renew_time, time.time(),
+                                       lease.spec.lease_duration_seconds or self.DEFAULT_LEASE_DURATION)
+        self.evaluate(name)
+
+    def missed_renewals(self, name, now=None):
+        renewal = self.renewals.get(name)
+        if renewal is None:
+            return 0.0
+        _, observed_at, lease_duration = renewal
+        return ((now or time.time()) - observed_at) / (lease_duration / 4)
+
+    def is_healthy(self, name):
+        with self.lock:
+            if name not in self.ready:
+                # not seen yet, node absence is handled by the middleware
+                return True
+            return self.ready[name] and self.missed_renewals(name) < self.miss_threshold
+
+    def evaluate(self, name=None):
+        names = [name] if name else list(self.ready)
+        for node_name in names:
+            healthy = self.is_healthy(node_name)
+            with self.lock:
+                changed = self.healthy.get(node_name, True) != healthy
+                self.healthy[node_name] = healthy
+            if not changed:
+                continue
+            if healthy:
+                logging.info(f"Node Health: {node_name} is healthy again")
+            else:
+                logging.critical(f"Node Health: {node_name} failed (ready: {self.ready.get(node_name)}, "
+                                 f"missed lease renewals: {self.missed_renewals(node_name):.1f})")
+            if self.on_change:
+                self.on_change(node_name, healthy)
+
+    def unhealthy_nodes(self):
+        return [name for name in list(self.ready) if not self.is_healthy(name)]
@@ -0,0 +1,33 @@
+import re
+
+# Kubernetes resource.Quantity suffixes
+DECIMAL_SUFFIXES = {
+    'n': 1e-9, 'u': 1e-6, 'm': 1e-3, '': 1.0,
+    'k': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12, 'P': 1e15, 'E': 1e18,
+}
+BINARY_SUFFIXES = {
+    'Ki': 2 ** 10, 'Mi': 2 ** 20, 'Gi': 2 ** 30, 'Ti': 2 ** 40, 'Pi': 2 ** 50, 'Ei': 2 ** 60,
+}
+QUANTITY_PATTERN = re.compile(r'^([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)([a-zA-Z]*)$')
+
+def parse_quantity(quantity) -> float:
+    """Parse a Kubernetes quantity ("250m", "1.5", "4Gi", "120974n", "1e3") into base units."""
+    if isinstance(quantity, (int, float)):
+        return float(quantity)
+    match = QUANTITY_PATTERN.match(str(quantity).strip())
+    if not match:
+        raise ValueError(f"Invalid quantity: {quantity}")
+    number, suffix = match.groups()
+    if suffix in BINARY_SUFFIXES:
+        return float(number) * BINARY_SUFFIXES[suffix]
+    if suffix in DECIMAL_SUFFIXES:
+        return float(number) * DECIMAL_SUFFIXES[suffix]
+    raise ValueError(f"Unsupported quantity suffix: {quantity}")
+
+def parse_cpu_quantity(quantity) -> float:
+    """CPU quantity in cores."""
+    return parse_quantity(quantity)
+
+def parse_memory_quantity(quantity) -> float:
+    """Memory quantity in bytes."""
+    return parse_quantity(quantity)
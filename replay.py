@@ -0,0 +1,143 @@
+import os
+import sys
+import csv
+import contextlib
+import logging
+import argparse
+from datetime import datetime
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+from scaling_policy import ScalingPolicy, PolicyEngine, load_cluster_metrics
+
+class ReplayEngine:
+    """Runs the real GlobalController and Middleware against a FakeCluster.
+
+    Cycles happen at the timestamps of a recorded cluster_metrics CSV on a fake
+    clock, so a recorded hour replays in seconds. Node utilization comes from
+    a node metrics CSV (--record-metrics) through ReplayBackend, or else from
+    the simulated load of the jobs the controller submits.
+    """
+    def __init__(self, start, initial_node_count, jobs_file, node_metrics=None, policy=None, predictive=False, cores=8, join_delay=0.0, control="cpu", batch_size=1, placement="pods"):
+        from middleware import NODE_INVENTORY, Middleware
+        from global_controller import GlobalController
+        from local_controller import LocalController
+        from monitor import MonitorNode
+        from metrics_backend import ReplayBackend, CachedMetricsBackend
+        from jobs.queue import JobQueue
+        from node_health import NodeHealthMonitor
+
+        self.clock = FakeClock(start)
+        # the first initial_node_count nodes of the inventory are up at the start
+        self.cluster = FakeCluster(self.clock, NODE_INVENTORY[:initial_node_count], cores=cores, join_delay=join_delay)
+        self.cluster.install()
+
+        with self.clock.patch():
+            if node_metrics:
+                source = ReplayBackend(node_metrics, clock=self.clock.time)
+            else:
+                source = FakeMetricsBackend(self.cluster)
+            backend = CachedMetricsBackend(source, ttl=1.0)
+            controllers = [LocalController(node["name"], MonitorNode(node["name"], backend), mode=control) for node in NODE_INVENTORY]
+            self.middleware = Middleware(*controllers)
+            # keep the replay from overwriting cluster_metrics.csv when the queue runs dry
+            self.middleware.save_metrics = lambda: None
+            self.middleware.placement = placement
+            # no watches on the fake API, the middleware polls node health every cycle
+            self.middleware.node_health = NodeHealthMonitor(watch=False, on_change=self.middleware.on_node_health)
+            self.controller = GlobalController(self.middleware)
+            self.controller.policy = PolicyEngine(policy)
+            self.controller.predictive = predictive
+            self.controller.batch_size = batch_size
+            self.queue = JobQueue(jobs_file)
+        self.decisions = []
+
+    @classmethod
+    def from_recording(cls, rows, jobs_file, **kwargs):
+        # the recording starts with its first active_node_count nodes up
+        return cls(rows[0]["timestamp"], rows[0]["active_node_count"], jobs_file, **kwargs)
+
+    def step(self, now):
+        """One controller cycle at time `now`; returns the cluster events it caused."""
+        events_seen = len(self.cluster.events)
+        self.clock.set(now)
+        self.cluster.advance()
+        with self.clock.patch():
+            self.controller.run_cycle(self.queue)
+        return self.cluster.events[events_seen:]
+
+    def run(self, rows):
+        for row in rows:
+            events = self.step(row["timestamp"])
+            metrics = self.middleware.cluster_metrics
+            self.decisions.append({
+                "timestamp": datetime.fromtimestamp(row["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
+                "recorded_nodes": row["active_node_count"],
+                "replayed_nodes": metrics["active_node_count"][-1]["value"],
+                "recorded_max_pods": row["max_pods"],
+                "replayed_max_pods": metrics["max_pods"][-1]["value"],
+                "recorded_total_pods": row["total_pods"],
+                "replayed_total_pods": metrics["total_pods"][-1]["value"],
+                "avg_cpu_util": round(metrics["avg_cpu_util"][-1]["value"], 2),
+                "actions": ";".join(f"{event}:{name.split('.')[0]}" for _, event, name in events
+                                    if event.startswith("node_") or event == "job_submitted" or event == "pod_lost"),
+            })
+        return self.decisions
+
+def diff(decisions):
+    """Where the replayed controller disagrees with the recording."""
+    summary = {"cycles": len(decisions), "node_count_mismatches": 0, "first_divergence": None}
+    for metric in ("nodes", "max_pods", "total_pods"):
+        errors = [abs(d[f"replayed_{metric}"] - d[f"recorded_{metric}"]) for d in decisions]
+        summary[f"{metric}_mean_abs_error"] = round(sum(errors) / len(errors), 2) if errors else 0.0
+    for decision in decisions:
+        if decision["replayed_nodes"] != decision["recorded_nodes"]:
+            summary["node_count_mismatches"] += 1
+            summary["first_divergence"] = summary["first_divergence"] or decision["timestamp"]
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded run through the controller on a simulated cluster')
+    parser.add_argument('metrics', help='cluster_metrics CSV written by Middleware.save_metrics')
+    parser.add_argument('--jobs-file', default='./static/jobs.txt', help='Jobs queued at the start of the recording')
+    parser.add_argument('--node-metrics', help='Per node CSV recorded with main.py --record-metrics, instead of simulated load')
+    parser.add_argument('--scaling-policy', help='YAML scaling policy to try, defaults to the built-in rules')
+    parser.add_argument('--scaling', choices=['reactive', 'predictive'], default='reactive')
+    parser.add_argument('--control', choices=['cpu', 'mimo'], default='cpu', help='Local control mode, see main.py --control')
+    parser.add_argument('--placement', choices=['pods', 'cpu'], default='pods', help='Job placement, see main.py --placement')
+    parser.add_argument('--batch-size', type=int, default=1, help='Submit compatible queued jobs as Indexed Jobs, see main.py --batch-size')
+    parser.add_argument('--cores', type=int, default=8, help='CPU cores per simulated node')
+    parser.add_argument('--join-delay', type=float, default=0.0, help='Seconds a created node takes to join')
+    parser.add_argument('--output', help='Write the per cycle decisions to this CSV instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Show the controller log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    policy = ScalingPolicy.load(args.scaling_policy) if args.scaling_policy else ScalingPolicy()
+    rows = load_cluster_metrics(args.metrics)
+    engine = ReplayEngine.from_recording(rows, args.jobs_file, node_metrics=args.node_metrics, policy=policy,
+                                         predictive=args.scaling == 'predictive', cores=args.cores, join_delay=args.join_delay,
+                                         control=args.control, batch_size=args.batch_size,
+                                         placement=args.placement)
+    if args.verbose:
+        decisions = engine.run(rows)
+    else:
+        # run_cycle prints section separators to stdout
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            decisions = engine.run(rows)
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    writer = csv.DictWriter(output, fieldnames=list(decisions[0].keys()))
+    writer.writeheader()
+    writer.writerows(decisions)
+    if args.output:
+        output.close()
+    summary = diff(decisions)
+    summary["jobs_submitted"] = len([e for e in engine.cluster.events if e[1] == "job_submitted"])
+    summary["pods_started"] = len([e for e in engine.cluster.events if e[1] == "pod_started"])
+    summary["jobs_lost"] = engine.cluster.jobs_lost()
+    print("# " + ", ".join(f"{key}: {value}" for key, value in summary.items()), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
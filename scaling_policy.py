@@ -0,0 +1,158 @@
+import csv
+import sys
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+
+@dataclass
+class DirectionPolicy:
+    threshold: float                # average CPU utilization (%) that triggers this direction
+    stabilization_cycles: int = 1   # consecutive triggering cycles before acting
+    cooldown_seconds: float = 0.0   # minimum time since the last scale event
+    step: int = 1                   # nodes added or drained per decision
+
+@dataclass
+class ScalingPolicy:
+    target_utilization: float = 80.0
+    scale_up: DirectionPolicy = field(default_factory=lambda: DirectionPolicy(threshold=80.0, stabilization_cycles=1, cooldown_seconds=60.0))
+    scale_down: DirectionPolicy = field(default_factory=lambda: DirectionPolicy(threshold=16.0, stabilization_cycles=4))
+
+    @classmethod
+    def load(cls, path):
+        """Read a policy like scaling-policy.yaml, missing keys keep their defaults."""
+        import yaml
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        policy = cls()
+        policy.target_utilization = float(config.get("target_utilization", policy.target_utilization))
+        for direction in ("scale_up", "scale_down"):
+            current = getattr(policy, direction)
+            values = config.get(direction) or {}
+            unknown = set(values) - set(current.__dataclass_fields__)
+            if unknown:
+                raise ValueError(f"Unknown {direction} settings in {path}: {', '.join(sorted(unknown))}")
+            setattr(policy, direction, DirectionPolicy(
+                threshold=float(values.get("threshold", current.threshold)),
+                stabilization_cycles=int(values.get("stabilization_cycles", current.stabilization_cycles)),
+                cooldown_seconds=float(values.get("cooldown_seconds", current.cooldown_seconds)),
+                step=int(values.get("step", current.step)),
+            ))
+        if policy.scale_down.threshold >= policy.scale_up.threshold:
+            raise ValueError(f"scale_down threshold must be below the scale_up threshold in {path}")
+        return policy
+
+class PolicyEngine:
+    """Turns one utilization reading per cycle into ("up" | "down" | "hold", nodes).
+
+    A direction fires after stabilization_cycles consecutive triggering cycles
+    and once its cooldown has passed. The scale-up cooldown counts from the
+    last scale-up; the scale-down cooldown from the last event in either
+    direction, so freshly added capacity is not given back right away.
+    """
+    def __init__(self, policy=None):
+        self.policy = policy or ScalingPolicy()
+        self.up_streak = 0
+        self.down_streak = 0
+        self.last_scaled = {"up": None, "down": None}
+
+    def cooled_down(self, now, direction):
+        events = [self.last_scaled["up"]] if direction == "up" else list(self.last_scaled.values())
+        cooldown = getattr(self.policy, f"scale_{direction}").cooldown_seconds
+        return all(event is None or now - event >= cooldown for event in events)
+
+    def decide(self, utilization, now, pressure=False, hold_down=False):
+        """pressure: an up signal besides utilization (e.g. a forecast);
+        hold_down: do not scale down this cycle (e.g. jobs are still queued)."""
+        up, down = self.policy.scale_up, self.policy.scale_down
+        self.up_streak = self.up_streak + 1 if pressure or utilization > up.threshold else 0
+        self.down_streak = self.down_streak + 1 if utilization < down.threshold and not hold_down else 0
+
+        if self.up_streak >= up.stabilization_cycles and self.cooled_down(now, "up"):
+            return "up", up.step
+        if self.down_streak >= down.stabilization_cycles and self.cooled_down(now, "down"):
+            return "down", down.step
+        return "hold", 0
+
+    def record(self, direction, now):
+        """Call after a decision was acted on; restarts the stabilization of that direction."""
+        self.last_scaled[direction] = now
+        if direction == "up":
+            self.up_streak = 0
+            self.down_streak = 0
+        else:
+            self.down_streak = 0
+
+def load_cluster_metrics(path):
+    with open(path, 'r') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row["timestamp"] = datetime.strptime(row["timestamp"], '%Y-%m-%d %H:%M:%S').timestamp()
+        for key in ("active_node_count", "max_pods", "total_pods"):
+            row[key] = int(float(row[key]))
+    return rows
+
+def row_utilization(row, target_utilization):
+    if row.get("avg_cpu_util") not in (None, ""):
+        return float(row["avg_cpu_util"])
+    # older recordings have no utilization: the local controllers size max_pods so
+    # that a full pod budget brings the nodes to the target, use the budget share
+    if row["max_pods"] <= 0:
+        return 0.0
+    return row["total_pods"] / row["max_pods"] * target_utilization
+
+def replay(policy, rows, max_nodes=None):
+    """Decisions the policy takes on a recorded cluster_metrics CSV.
+
+    The node count is simulated from the policy's own decisions; the recorded
+    load does not react to them, so rows after the first divergence are only
+    indicative."""
+    engine = PolicyEngine(policy)
+    max_nodes = max_nodes or max(row["active_node_count"] for row in rows)
+    nodes = rows[0]["active_node_count"] if rows else 0
+    results = []
+    previous = None
+    for row in rows:
+        utilization = row_utilization(row, policy.target_utilization)
+        direction, step = engine.decide(utilization, row["timestamp"])
+        if direction == "up":
+            step = min(step, max_nodes - nodes)
+        elif direction == "down":
+            step = min(step, nodes - 1)
+        if step <= 0:
+            direction, step = "hold", 0
+        else:
+            engine.record(direction, row["timestamp"])
+            nodes += step if direction == "up" else -step
+        recorded_change = row["active_node_count"] - previous if previous is not None else 0
+        previous = row["active_node_count"]
+        results.append({
+            "timestamp": datetime.fromtimestamp(row["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
+            "utilization": round(utilization, 2),
+            "recorded_nodes": row["active_node_count"],
+            "recorded_change": recorded_change,
+            "decision": direction,
+            "step": step,
+            "policy_nodes": nodes,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a scaling policy against recorded cluster metrics')
+    parser.add_argument('metrics', nargs='+', help='cluster_metrics CSV files written by Middleware.save_metrics')
+    parser.add_argument('--policy', help='Scaling policy YAML, defaults to the built-in rules')
+    parser.add_argument('--max-nodes', type=int, help='Nodes available to scale up to, defaults to the most recorded')
+    args = parser.parse_args()
+
+    policy = ScalingPolicy.load(args.policy) if args.policy else ScalingPolicy()
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["file", "timestamp", "utilization", "recorded_nodes", "recorded_change", "decision", "step", "policy_nodes"])
+    for path in args.metrics:
+        results = replay(policy, load_cluster_metrics(path), args.max_nodes)
+        for result in results:
+            writer.writerow([path] + list(result.values()))
+        recorded = len([r for r in results if r["recorded_change"]])
+        decided = len([r for r in results if r["decision"] != "hold"])
+        print(f"# {path}: {decided} policy scale events, {recorded} recorded node count changes", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import time
+import bisect
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import kube
+from kube import client
+from metrics_filter import MetricsFilter
+from local_controller import LocalController
+from middleware import Middleware, node_info, pod_summary
+
+def stable_hash(key):
+    # python's hash() is salted per process, the ring has to agree across restarts
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hashing of node names onto shards.
+
+    Every shard owns VIRTUAL_NODES points on the ring so nodes spread evenly,
+    and adding or removing a shard only moves the nodes next to its points.
+    """
+    VIRTUAL_NODES = 64
+
+    def __init__(self, shards):
+        self.points = sorted(
+            (stable_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in shards
+            for replica in range(self.VIRTUAL_NODES)
+        )
+        self.keys = [point for point, _ in self.points]
+
+    def shard_for(self, node_name):
+        position = bisect.bisect(self.keys, stable_hash(node_name)) % len(self.points)
+        return self.points[position][1]
+
+    def assign(self, node_names):
+        assignment = {}
+        for name in node_names:
+            assignment.setdefault(self.shard_for(name), []).append(name)
+        return assignment
+
+class ShardWorker:
+    """Metrics, filtering and local control for one shard of nodes.
+
+    Everything it reads is its own nodes': the node objects, the job pods
+    bound to them (spec.nodeName) and their metrics, read on a small thread
+    pool. A cycle costs the same whatever the size of the cluster, and the
+    node and pod views the coordinator needs come back in the summary instead
+    of being listed cluster wide.
+    """
+    def __init__(self, shard_id, controllers, capacity=None, smoothing="ewma", max_workers=8):
+        self.shard_id = shard_id
+        self.controllers = controllers      # node name -> LocalController
+        # NodeCapacityCache of the metrics backend, kept current by the node reads instead of a node watch
+        self.capacity = capacity
+        self.metrics_filter = MetricsFilter(list(controllers), method=smoothing)
+        self.core_v1_api = kube.core_v1()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"shard-{shard_id}")
+
+    def read_node(self, name):
+        """node_info and job pods of one node, (None, []) if it is not listed."""
+        try:
+            node = self.core_v1_api.read_node(name)
+        except client.ApiException as e:
+            if e.status == 404:
+                return None, []
+            raise
+        if self.capacity:
+            self.capacity.observe(node)
+        pods = kube.list_compact(self.core_v1_api.list_namespaced_pod, pod_summary, namespace="jobs",
+                                 field_selector=f"spec.nodeName={name}")
+        return node_info(node), pods
+
+    def step(self, cycle, submitted_at=None):
+        """Summary of one cycle: {"nodes": {name: view}} for the listed nodes, "unknown" for the
+        nodes that could not be read, the shard's utilization sum and free slots, and the
+        measured cores of its running job pods.
+        submitted_at has the last job submission per node, see MetricsFilter.update."""
+        started = time.perf_counter()
+        futures = {self.executor.submit(self.read_node, name): name for name in self.controllers}
+        views = {}
+        unknown = []
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                views[name] = future.result()
+            except Exception as e:
+                logging.error(f"Shard {self.shard_id}: Failed to read node {name}: {e}")
+                unknown.append(name)
+        listed = [name for name, (info, _) in views.items() if info]
+        samples = {name: self.controllers[name].monitor.get_node_cpu_sample() for name in listed}
+        filtered = self.metrics_filter.update(samples, time.time(), submitted_at)
+
+        nodes = {}
+        job_cpu = self.job_cpu([pod for name in listed for pod in views[name][1]])
+        for name in listed:
+            info, pods = views[name]
+            controller = self.controllers[name]
+            cpu_util, stale = filtered[name]
+            if cpu_util is not None:
+                controller.monitor.current_util = cpu_util
+            controller.update_state(cpu_util, stale)
+            # the Middleware ledger counts the requests of pending and running pods, idle pool pods too
+            holding = [pod for pod in pods if pod.phase in ("Pending", "Running")]
+            nodes[name] = {
+                "info": info,
+                "util": controller.monitor.current_util,
+                "max_pods": controller.state["max_pods"],
+                "errors": controller.state["errors"],
+                "running": len([pod for pod in pods if pod.phase == "Running" and not pod.idle]),
+                "stale": stale,
+                "requested": {"cpu": sum(pod.cpu for pod in holding), "memory": sum(pod.memory for pod in holding)},
+            }
+        return {
+            "shard": self.shard_id,
+            "cycle": cycle,
+            "nodes": nodes,
+            "unknown": unknown,
+            "util_sum": sum(view["util"] for view in nodes.values()),
+            "free_slots": sum(view["max_pods"] for view in nodes.values()),
+            "job_cpu": job_cpu,
+            "elapsed": time.perf_counter() - started,
+        }
+
+    def job_cpu(self, pods):
+        """(stressors, measured cores) of the shard's running job pods, the coordinator's cost model learns from them."""
+        running = {f"jobs/{pod.name}": pod for pod in pods if pod.phase == "Running" and pod.stressors}
+        if not running:
+            return []
+        monitor = next(iter(self.controllers.values())).monitor
+        try:
+            samples = monitor.backend.get_pod_samples("jobs")
+        except Exception as e:
+            logging.error(f"Shard {self.shard_id}: Failed to read pod metrics: {e}")
+            return []
+        return [(running[key].stressors, sample["cpu"]) for key, sample in samples.items()
+                if key in running and sample.get("cpu") is not None]
+
+def run_shard(shard_id, node_names, args, conn):
+    """Worker process of one shard: every ("cycle", number, submitted_at) message is
+    answered with the ShardWorker summary; None stops the worker."""
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - shard {shard_id} - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    from main import api_budget, build_metrics_backend, build_local_controller
+    # every worker process has its own API budget, together with the controller's they stay within --api-qps and --api-burst
+    qps, burst = api_budget(args)
+    kube.configure(qps=qps, burst=burst, max_retries=args.api_retries)
+    from metrics_backend import CachedMetricsBackend
+    from monitor import MonitorNode
+
+    record_path = f"{args.record_metrics}.shard{shard_id}" if args.record_metrics else None
+    source = build_metrics_backend(args, shard=True)
+    backend = CachedMetricsBackend(source, ttl=1.0, record_path=record_path)
+    controllers = {name: build_local_controller(name, MonitorNode(name, backend), args) for name in node_names}
+    worker = ShardWorker(shard_id, controllers, capacity=getattr(source, "capacity", None), smoothing=args.smoothing)
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        _, cycle, submitted_at = message
+        conn.send(worker.step(cycle, submitted_at))
+    conn.close()
+
+class ShardCoordinator:
+    """Runs one worker process per shard and gathers their summaries each cycle.
+
+    Requests go out to every shard before any reply is read, so shards work in
+    parallel and a cycle costs about as much as the slowest shard.
+    """
+    def __init__(self, node_names, shards, args, timeout=30):
+        self.args = args
+        self.timeout = timeout
+        self.ring = HashRing(range(shards))
+        self.assignment = self.ring.assign(node_names)
+        self.workers = {}       # shard -> (process, connection)
+        self.cycle = 0
+
+    def start(self):
+        # spawn, not fork: the parent may already hold kubernetes connections and threads
+        context = multiprocessing.get_context("spawn")
+        for shard, node_names in self.assignment.items():
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=run_shard, args=(shard, node_names, self.args, child_conn),
+                                      name=f"shard-{shard}", daemon=True)
+            process.start()
+            child_conn.close()
+            self.workers[shard] = (process, parent_conn)
+            logging.info(f"Sharding: Shard {shard} handles {len(node_names)} nodes")
+
+    def stop(self):
+        for process, conn in self.workers.values():
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process, conn in self.workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.workers = {}
+
+    def collect(self, submitted_at=None):
+        """Summaries of every shard for one cycle merged, see merge(). The nodes
+        of a shard that failed to answer are reported unknown. submitted_at has
+        the last job submission per node, each shard gets those of its nodes."""
+        self.cycle += 1
+        pending = {}
+        unknown = set()
+        for shard, (process, conn) in self.workers.items():
+            try:
+                nodes = set(self.assignment[shard])
+                conn.send(("cycle", self.cycle, {name: at for name, at in (submitted_at or {}).items() if name in nodes}))
+                pending[shard] = conn
+            except (BrokenPipeError, OSError) as e:
+                logging.error(f"Sharding: Shard {shard} is not running: {e}")
+                unknown.update(self.assignment[shard])
+
+        replies = []
+        deadline = time.monotonic() + self.timeout
+        for shard, conn in pending.items():
+            reply = None
+            while conn.poll(max(deadline - time.monotonic(), 0)):
+                reply = conn.recv()
+                # a late answer to a cycle that already timed out is dropped
+                if reply["cycle"] == self.cycle:
+                    break
+                reply = None
+            if reply is None:
+                logging.error(f"Sharding: Shard {shard} did not answer within {self.timeout}s")
+                unknown.update(self.assignment[shard])
+                continue
+            replies.append(reply)
+        return self.merge(replies, unknown)
+
+    @staticmethod
+    def merge(replies, unknown=()):
+        """{"nodes": {name: view}, "unknown": names, "util_sum", "free_slots", "job_cpu"} over the shard replies."""
+        summary = {"nodes": {}, "unknown": set(unknown), "util_sum": 0.0, "free_slots": 0, "job_cpu": []}
+        for reply in replies:
+            summary["nodes"].update(reply["nodes"])
+            summary["unknown"].update(reply["unknown"])
+            summary["util_sum"] += reply["util_sum"]
+            summary["free_slots"] += reply["free_slots"]
+            summary["job_cpu"].extend(reply["job_cpu"])
+            logging.info(f"Sharding: Shard {reply['shard']} updated {len(reply['nodes'])} nodes in {reply['elapsed']:.3f}s")
+        return summary
+
+class ShardMonitor:
+    """Stands in for MonitorNode in the coordinator, answers from the last shard summary."""
+    def __init__(self, node_name):
+        self.node_name = node_name
+        self.current_util = 0.0
+        self.running_pods = 0
+
+    def get_running_pod_count(self):
+        return self.running_pods
+
+    def has_pod_capacity(self, max_pods_allowed_by_ctrlr) -> bool:
+        return max_pods_allowed_by_ctrlr > 0
+
+class ShardController(LocalController):
+    """Stands in for LocalController in the coordinator, the control law runs in the shard.
+    Its state comes from the shard summaries, max_pods_for sizes it to the next job here."""
+    def __init__(self, node_name, mode="cpu", gain=None, gain_memory=None):
+        super().__init__(node_name, ShardMonitor(node_name), mode=mode, gain=gain, gain_memory=gain_memory)
+
+class ShardedMiddleware(Middleware):
+    """Middleware whose per node work is done by ShardCoordinator workers.
+
+    The node table holds ShardController stand-ins, and the shard summaries
+    stand in for the node list and the job pod list: placement and scaling
+    decisions read them without any per node API call, and the only cluster
+    wide read left is the list of job pods no node is bound to yet.
+    """
+    def __init__(self, node_names, coordinator, smoothing="ewma", mode="cpu", gain=None, gain_memory=None):
+        super().__init__(*[ShardController(name, mode, gain, gain_memory) for name in node_names], smoothing=smoothing)
+        self.coordinator = coordinator
+        self.summary = coordinator.merge([])
+
+    def refresh_active_nodes(self):
+        print('####################################')
+        logging.info("Heartbeat (sharded)...")
+        if self.node_health and not self.node_health.watch:
+            self.node_health.poll()
+        # one cycle of every shard, update_local_states uses the same summary
+        self.summary = self.coordinator.collect(self.submission_times())
+        self.update_active_nodes([view["info"] for view in self.summary["nodes"].values()], unknown=self.summary["unknown"])
+
+    def get_total_pods(self):
+        try:
+            # pods bound to a node are in that node's shard summary
+            unscheduled = kube.list_compact(self.core_v1_api.list_namespaced_pod, pod_summary, namespace="jobs",
+                                            field_selector="spec.nodeName=,status.phase=Pending")
+        except client.ApiException as e:
+            logging.error(f"Middleware: Failed to list unscheduled pods: {e}")
+            unscheduled = []
+        self.job_pods = unscheduled
+        self.update_requested(unscheduled)
+        for node in self.nodes.values():
+            view = self.summary["nodes"].get(node["name"])
+            if view:
+                node["requested"]["cpu"] += view["requested"]["cpu"]
+                node["requested"]["memory"] += view["requested"]["memory"]
+        running_pods = sum(view["running"] for view in self.summary["nodes"].values())
+        self.record_total_pods(running_pods)
+        return running_pods
+
+    def update_local_states(self):
+        print('------------------------------------')
+        logging.info("Local States (sharded)...")
+        self.get_total_pods()  # record metric
+        summary = self.summary
+        # the shards measure their job pods, the cost model placement reads lives here
+        for stressors, cpu in summary["job_cpu"]:
+            self.cost_model.observe(stressors, cpu)
+        if summary["job_cpu"]:
+            logging.info(f"Middleware: Job cost model (cores): {self.cost_model.coefficients()}")
+        for node in self.nodes.values():
+            # the shards do not pass sample times on, reservations run out by RESERVATION_TIMEOUT
+            self.expire_reservations(node, None)
+            controller = node["controller"]
+            view = summary["nodes"].get(node["name"])
+            if view:
+                controller.monitor.current_util = view["util"]
+                controller.monitor.running_pods = view["running"]
+                controller.state.update({"max_pods": view["max_pods"], "errors": view["errors"], "measured_cpu_util": view["util"], "stale": view["stale"]})
+            elif node["name"] in summary["unknown"]:
+                # its shard did not answer, take no new jobs there until it does
+                controller.state.update({"max_pods": 0, "stale": True})
+        logging.info(f"Middleware: {len(summary['nodes'])} nodes, utilization sum {summary['util_sum']:.1f}%, free slots {summary['free_slots']}")
+        self.update_max_cluster_pods()
+        print('------------------------------------')
@@ -0,0 +1,441 @@
+import copy
+import json
+import uuid
+import shlex
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from unittest import mock
+
+import kube
+from kube import client
+from metrics_backend import MetricsBackend
+from jobs.job import COMPLETION_INDEX_ANNOTATION, args_timeout_seconds
+from quantity import parse_cpu_quantity, parse_memory_quantity
+
+class FakeClock:
+    """Simulated time for replays: time.time() returns `now`, time.sleep() advances it."""
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+    def set(self, now):
+        self.now = max(self.now, now)
+
+    @contextmanager
+    def patch(self):
+        with mock.patch("time.time", self.time), mock.patch("time.sleep", self.sleep):
+            yield self
+
+class FakeCluster:
+    """In-memory stand-in for the parts of the API server the controller uses.
+
+    Nodes are created, cordoned and deleted like real Node objects. Every
+    submitted Job gets one pod per completion index. A pod stays unscheduled
+    until a listed, schedulable node matching its nodetype affinity has room
+    for its requests, then runs at once and succeeds after its stress-ng
+    --timeout. Pods on a deleted node, and unscheduled pods no remaining node
+    can take, are lost. install() puts the fake APIs
+    where kube.core_v1()/kube.batch_v1() find them.
+
+    Leases are kept with a resourceVersion, so replacing one read before
+    another writer's replace fails with 409 as on the real API server.
+
+    Faults for fault_injection.py: api_latency delays every API call on the
+    clock, metrics_down blanks all node metrics and set_ready(name, False)
+    stops a node's kubelet: its metrics go and its lease renewTime freezes.
+    Like the node lifecycle controller, the Ready condition only turns
+    Unknown NODE_MONITOR_GRACE_PERIOD after the last renewal.
+    """
+    LEASE_RENEW_INTERVAL = 10.0
+    NODE_MONITOR_GRACE_PERIOD = 40.0    # seconds, kube-controller-manager --node-monitor-grace-period
+
+    def __init__(self, clock, nodes=(), cores=8, join_delay=0.0):
+        self.clock = clock
+        self.cores = cores              # CPU cores per node, for FakeMetricsBackend
+        self.memory = 16 * 2 ** 30      # bytes per node
+        self.join_delay = join_delay    # seconds between create_node and the node being listed
+        self.nodes = {}                 # name -> {"labels", "unschedulable", "listed_at"}
+        self.pods = {}                  # name -> {"node", "phase", "started_at", "timeout", "cpu", "job", ...}
+        self.events = []                # (time, event, name)
+        self.leases = {}                # (namespace, name) -> V1Lease, e.g. the leader election lease
+        self.api_latency = 0.0          # seconds added to every API call
+        self.metrics_down = False
+        for node in nodes:
+            self.add_node(node["name"], node.get("label", {}), listed_at=clock.time())
+
+    def install(self):
+        kube._apis["CoreV1Api"] = FakeCoreV1Api(self)
+        kube._apis["BatchV1Api"] = FakeBatchV1Api(self)
+        kube._apis["CoordinationV1Api"] = FakeCoordinationV1Api(self)
+
+    def record(self, event, name):
+        self.events.append((self.clock.time(), event, name))
+
+    def add_node(self, name, labels, listed_at=None):
+        self.nodes[name] = {
+            "labels": dict(labels),
+            "unschedulable": False,
+            "ready": True,
+            "lease_renewed_at": None,   # frozen renewTime while the kubelet is down
+            "listed_at": self.clock.time() + self.join_delay if listed_at is None else listed_at,
+        }
+
+    def api_call(self):
+        if self.api_latency:
+            self.clock.sleep(self.api_latency)
+
+    def set_ready(self, name, ready):
+        self.nodes[name]["lease_renewed_at"] = None if ready else self.lease_renew_time(name)
+        self.nodes[name]["ready"] = ready
+        self.record("node_ready" if ready else "node_not_ready", name)
+
+    def ready_condition(self, name):
+        node = self.nodes[name]
+        if node["ready"] or self.clock.time() - node["lease_renewed_at"] < self.NODE_MONITOR_GRACE_PERIOD:
+            return "True"
+        return "Unknown"
+
+    def lease_renew_time(self, name):
+        # the kubelet renews its lease every LEASE_RENEW_INTERVAL seconds while it runs
+        node = self.nodes[name]
+        if node["lease_renewed_at"] is not None:
+            return node["lease_renewed_at"]
+        now = self.clock.time()
+        return now - now % self.LEASE_RENEW_INTERVAL
+
+    def listed_nodes(self):
+        now = self.clock.time()
+        return [name for name, node in self.nodes.items() if node["listed_at"] <= now]
+
+    def advance(self):
+        """Bring pods up to the current time: start pending ones, finish expired ones."""
+        now = self.clock.time()
+        listed = set(self.listed_nodes())
+        active_per_job = {}
+        for pod in self.pods.values():
+            if pod["phase"] in ("Pending", "Running"):
+                active_per_job[pod["job"]] = active_per_job.get(pod["job"], 0) + 1
+        for name, pod in self.pods.items():
+            # the Job controller creates an Indexed Job's next pod once one of `parallelism` finished
+            if pod["phase"] == "Waiting" and active_per_job.get(pod["job"], 0) < pod["parallelism"]:
+                pod["phase"] = "Pending"
+                active_per_job[pod["job"]] = active_per_job.get(pod["job"], 0) + 1
+            if pod["phase"] == "Pending" and pod["node"] is None:
+                # the scheduler binds a pod to a schedulable node with the requested nodetype whose requests still fit
+                pod["node"] = next((node_name for node_name in self.listed_nodes() if node_name in listed
+                                    and self.nodes[node_name]["labels"].get("nodetype") == pod["nodetype"]
+                                    and not self.nodes[node_name]["unschedulable"]
+                                    and self.requested_cpu(node_name) + pod["requested_cpu"] <= self.cores
+                                    and self.running_memory(node_name) + pod["requested_memory"] <= self.memory), None)
+            # a bound pod starts right away, also when its node was cordoned since
+            if pod["phase"] == "Pending" and pod["node"] is not None:
+                pod["phase"] = "Running"
+                pod["started_at"] = now
+                self.record("pod_started", name)
+            elif pod["phase"] == "Running" and pod["timeout"] is not None and now - pod["started_at"] >= pod["timeout"]:
+                pod["phase"] = "Succeeded"
+                active_per_job[pod["job"]] -= 1
+                self.record("pod_succeeded", name)
+
+    def requested_cpu(self, node_name):
+        return sum(pod["requested_cpu"] for pod in self.pods.values() if pod["node"] == node_name and pod["phase"] == "Running")
+
+    def running_memory(self, node_name):
+        # stress-ng --vm workers touch all of their --vm-bytes, which is what the pods request
+        return sum(pod["requested_memory"] for pod in self.pods.values() if pod["node"] == node_name and pod["phase"] == "Running")
+
+    def running_cpu(self, node_name):
+        return sum(pod["cpu"] for pod in self.pods.values() if pod["node"] == node_name and pod["phase"] == "Running")
+
+    def jobs_lost(self):
+        return len([event for event in self.events if event[1] == "pod_lost"])
+
+    def v1_node(self, name):
+        node = self.nodes[name]
+        return client.V1Node(
+            metadata=client.V1ObjectMeta(name=name, labels=dict(node["labels"])),
+            spec=client.V1NodeSpec(unschedulable=node["unschedulable"] or None),
+            status=client.V1NodeStatus(
+                capacity={"cpu": str(self.cores), "memory": str(self.memory)},
+                allocatable={"cpu": str(self.cores), "memory": str(self.memory)},
+                conditions=[client.V1NodeCondition(type="Ready", status=self.ready_condition(name))]
+            )
+        )
+
+    def v1_pod(self, name):
+        pod = self.pods[name]
+        started_at = datetime.fromtimestamp(pod["started_at"], timezone.utc) if pod["started_at"] else None
+        return client.V1Pod(
+            metadata=client.V1ObjectMeta(name=name, namespace="jobs", labels=dict(pod["labels"]), annotations=dict(pod["annotations"])),
+            spec=client.V1PodSpec(node_name=pod["node"], containers=[client.V1Container(name="job", args=pod["container_args"], command=pod["command"],
+                                                                                          resources=pod["resources"])],
+                                  affinity=self.v1_affinity(pod["nodetype"])),
+            status=client.V1PodStatus(phase=pod["phase"], start_time=started_at)
+        )
+
+    @staticmethod
+    def v1_affinity(nodetype):
+        if nodetype is None:
+            return None
+        requirement = client.V1NodeSelectorRequirement(key="nodetype", operator="In", values=[nodetype])
+        return client.V1Affinity(node_affinity=client.V1NodeAffinity(
+            required_during_scheduling_ignored_during_execution=client.V1NodeSelector(
+                node_selector_terms=[client.V1NodeSelectorTerm(match_expressions=[requirement])])))
+
+class RawResponse:
+    """What a generated API method returns with _preload_content=False, as far as kube.list_compact reads it."""
+    def __init__(self, data):
+        self.data = data
+        self.status = 200
+
+def raw_response(obj):
+    serialized = client.ApiClient().sanitize_for_serialization(obj)
+    return RawResponse(json.dumps(serialized).encode())
+
+def matches(fields, selector):
+    """Selectors like "spec.nodeName=node0,status.phase=Running", "key!=value" and "key" (label exists)."""
+    for term in filter(None, (selector or "").split(",")):
+        if "!=" in term:
+            key, value = term.split("!=", 1)
+            if str(fields.get(key)) == value:
+                return False
+        elif "=" in term:
+            key, value = term.split("=", 1)
+            if str(fields.get(key)) != value:
+                return False
+        elif fields.get(term) is None:
+            return False
+    return True
+
+class FakeCoreV1Api:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def list_node(self, **kwargs):
+        self.cluster.api_call()
+        return client.V1NodeList(items=[self.cluster.v1_node(name) for name in self.cluster.listed_nodes()],
+                                 metadata=client.V1ListMeta(resource_version=str(len(self.cluster.events))))
+
+    def read_node(self, name, **kwargs):
+        self.cluster.api_call()
+        if name not in self.cluster.listed_nodes():
+            raise client.ApiException(status=404, reason="Not Found")
+        return self.cluster.v1_node(name)
+
+    def create_node(self, body, **kwargs):
+        self.cluster.api_call()
+        name = body.metadata.name
+        if name in self.cluster.nodes:
+            raise client.ApiException(status=409, reason="AlreadyExists")
+        self.cluster.add_node(name, body.metadata.labels or {})
+        self.cluster.record("node_created", name)
+        return body
+
+    def delete_node(self, name, **kwargs):
+        self.cluster.api_call()
+        node = self.cluster.nodes.pop(name, None)
+        if node is None:
+            raise client.ApiException(status=404, reason="Not Found")
+        self.cluster.record("node_deleted", name)
+        nodetypes = {other["labels"].get("nodetype") for other in self.cluster.nodes.values()}
+        for pod_name, pod in self.cluster.pods.items():
+            if pod["phase"] not in ("Pending", "Running"):
+                continue
+            # unscheduled pods pinned to the deleted node's nodetype stay Pending for good
+            if pod["node"] == name or (pod["node"] is None and pod["nodetype"] == node["labels"].get("nodetype")
+                                       and pod["nodetype"] not in nodetypes):
+                pod["phase"] = "Failed"
+                self.cluster.record("pod_lost", pod_name)
+
+    def patch_node(self, name, body, **kwargs):
+        self.cluster.api_call()
+        if name not in self.cluster.nodes:
+            raise client.ApiException(status=404, reason="Not Found")
+        labels = body.get("metadata", {}).get("labels")
+        if labels:
+            self.cluster.nodes[name]["labels"].update(labels)
+            self.cluster.record("node_labelled", name)
+        if "spec" in body:
+            unschedulable = bool(body["spec"].get("unschedulable"))
+            self.cluster.nodes[name]["unschedulable"] = unschedulable
+            self.cluster.record("node_cordoned" if unschedulable else "node_uncordoned", name)
+
+    def list_namespaced_pod(self, namespace, field_selector=None, label_selector=None, limit=None, _continue=None,
+                            _preload_content=True, **kwargs):
+        self.cluster.api_call()
+        items = []
+        offset = int(_continue or 0)
+        names = list(self.cluster.pods)
+        for name in names[offset:offset + limit] if limit else names[offset:]:
+            pod = self.cluster.pods[name]
+            if pod["phase"] == "Waiting":
+                continue
+            # unscheduled pods match "spec.nodeName="
+            fields = {"spec.nodeName": pod["node"] or "", "status.phase": pod["phase"], "metadata.name": name}
+            if matches(fields, field_selector) and matches(pod["labels"], label_selector):
+                items.append(self.cluster.v1_pod(name))
+        # continue tokens are offsets into the pods
+        token = str(offset + limit) if limit and offset + limit < len(names) else None
+        pod_list = client.V1PodList(items=items, metadata=client.V1ListMeta(resource_version=str(len(self.cluster.events)), _continue=token))
+        return pod_list if _preload_content else raw_response(pod_list)
+
+    def delete_namespaced_pod(self, name, namespace, **kwargs):
+        self.cluster.api_call()
+        pod = self.cluster.pods.get(name)
+        if pod is None:
+            raise client.ApiException(status=404, reason="Not Found")
+        # a pod that never started lost no work, its job may be submitted again
+        if pod["phase"] == "Running":
+            self.cluster.record("pod_lost", name)
+        elif pod["phase"] == "Pending":
+            self.cluster.record("pod_deleted", name)
+        pod["phase"] = "Failed"
+
+    def read_namespace(self, name, **kwargs):
+        self.cluster.api_call()
+        return client.V1Namespace(metadata=client.V1ObjectMeta(name=name))
+
+    def create_namespace(self, body, **kwargs):
+        self.cluster.api_call()
+        return body
+
+class FakeBatchV1Api:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def create_namespaced_job(self, namespace, body, **kwargs):
+        self.cluster.api_call()
+        template = body.spec.template
+        nodetype = None
+        affinity = template.spec.affinity
+        if affinity and affinity.node_affinity:
+            terms = affinity.node_affinity.required_during_scheduling_ignored_during_execution.node_selector_terms
+            nodetype = terms[0].match_expressions[0].values[0]
+        container = template.spec.containers[0]
+        if body.spec.completion_mode == "Indexed":
+            # IndexedJobSubmitter: one stress-ng command line per completion index in a shell case
+            indexes = [shlex.split(line.split(" exec stress-ng ", 1)[1].rstrip(" ;")) for line in container.command[-1].splitlines() if " exec stress-ng " in line]
+        else:
+            indexes = [list(container.args or [])]
+        resources = container.resources
+        requests = (resources.requests if resources else None) or {}
+        parallelism = body.spec.parallelism or len(indexes)
+        for index, args in enumerate(indexes):
+            cpu = int(args[args.index("--cpu") + 1]) if "--cpu" in args else 1
+            pod_name = f"{body.metadata.name}-{str(uuid.uuid4())[:5]}"
+            self.cluster.pods[pod_name] = {
+                "node": None,
+                # pods past the parallelism do not exist yet
+                "phase": "Pending" if index < parallelism else "Waiting",
+                "started_at": None,
+                "timeout": args_timeout_seconds(args),
+                "cpu": cpu,
+                "requested_cpu": parse_cpu_quantity(requests.get("cpu", 0)),
+                "requested_memory": parse_memory_quantity(requests.get("memory", 0)),
+                "resources": resources,
+                "args": args,
+                # what the pod spec holds: an Indexed Job's pods run the shell case over their completion index
+                "container_args": container.args,
+                "command": container.command,
+                "job": body.metadata.name,
+                "parallelism": parallelism,
+                "nodetype": nodetype,
+                "labels": dict(template.metadata.labels or {}, **{"job-name": body.metadata.name}),
+                "annotations": dict(template.metadata.annotations or {},
+                                    **({COMPLETION_INDEX_ANNOTATION: str(index)} if body.spec.completion_mode == "Indexed" else {})),
+            }
+        self.cluster.record("job_submitted", body.metadata.name)
+        self.cluster.advance()
+        return body
+
+class FakeCoordinationV1Api:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def list_namespaced_lease(self, namespace, **kwargs):
+        self.cluster.api_call()
+        items = []
+        if namespace == "kube-node-lease":
+            for name in self.cluster.listed_nodes():
+                renew_time = datetime.fromtimestamp(self.cluster.lease_renew_time(name), timezone.utc)
+                items.append(client.V1Lease(
+                    metadata=client.V1ObjectMeta(name=name, namespace=namespace),
+                    spec=client.V1LeaseSpec(holder_identity=name, lease_duration_seconds=40, renew_time=renew_time)
+                ))
+        items.extend(copy.deepcopy(lease) for (lease_namespace, _), lease in self.cluster.leases.items() if lease_namespace == namespace)
+        return client.V1LeaseList(items=items, metadata=client.V1ListMeta(resource_version=str(len(self.cluster.events))))
+
+    def read_namespaced_lease(self, name, namespace, **kwargs):
+        self.cluster.api_call()
+        lease = self.cluster.leases.get((namespace, name))
+        if lease is None:
+            raise client.ApiException(status=404, reason="Not Found")
+        return copy.deepcopy(lease)
+
+    def create_namespaced_lease(self, namespace, body, **kwargs):
+        self.cluster.api_call()
+        if (namespace, body.metadata.name) in self.cluster.leases:
+            raise client.ApiException(status=409, reason="AlreadyExists")
+        return self.store_lease(namespace, body, 1)
+
+    def replace_namespaced_lease(self, name, namespace, body, **kwargs):
+        self.cluster.api_call()
+        current = self.cluster.leases.get((namespace, name))
+        if current is None:
+            raise client.ApiException(status=404, reason="Not Found")
+        # optimistic concurrency: the write has to carry the resourceVersion it read
+        if body.metadata.resource_version != current.metadata.resource_version:
+            raise client.ApiException(status=409, reason="Conflict")
+        return self.store_lease(namespace, body, int(current.metadata.resource_version) + 1)
+
+    def store_lease(self, namespace, body, version):
+        lease = copy.deepcopy(body)
+        lease.metadata.namespace = namespace
+        lease.metadata.resource_version = str(version)
+        self.cluster.leases[(namespace, lease.metadata.name)] = lease
+        self.cluster.record("lease_written", lease.metadata.name)
+        return copy.deepcopy(lease)
+
+class FakeMetricsBackend(MetricsBackend):
+    """Node utilization from the fake cluster's running pods: each stress-ng
+    cpu worker keeps one core busy, plus a small idle baseline."""
+    IDLE_UTIL = 2.0
+    IDLE_MEMORY = 2 * 2 ** 30   # bytes the node uses without jobs
+    WINDOW = 15.0
+
+    def __init__(self, cluster):
+        super().__init__()
+        self.cluster = cluster
+
+    def get_pod_samples(self, namespace):
+        if self.cluster.metrics_down:
+            return {}
+        samples = {}
+        for name, pod in self.cluster.pods.items():
+            if pod["phase"] != "Running":
+                continue
+            args = pod["args"]
+            workers = {option: int(args[args.index(option) + 1]) for option in ("--cpu", "--io", "--vm") if option in args}
+            # --cpu and --vm workers spin a core each, --io workers mostly wait on sync
+            cpu = workers.get("--cpu", 0) + workers.get("--vm", 0) + 0.1 * workers.get("--io", 0)
+            samples[f"{namespace}/{name}"] = {"cpu": cpu, "memory": pod["requested_memory"], "node": pod["node"]}
+        return samples
+
+    def get_node_samples(self, node_names):
+        now = self.cluster.clock.time()
+        listed = set(self.cluster.listed_nodes())
+        samples = {}
+        for name in node_names:
+            if name not in listed or self.cluster.metrics_down or not self.cluster.nodes[name]["ready"]:
+                samples[name] = None
+                continue
+            util = min(self.IDLE_UTIL + 100.0 * self.cluster.running_cpu(name) / self.cluster.cores, 100.0)
+            # metrics-server windows: the sample time only advances every WINDOW seconds
+            memory_util = min(100.0 * (self.IDLE_MEMORY + self.cluster.running_memory(name)) / self.cluster.memory, 100.0)
+            samples[name] = {"util": util, "memory_util": memory_util, "timestamp": now - now % self.WINDOW, "window": self.WINDOW}
+        return samples
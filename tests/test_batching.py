@@ -0,0 +1,76 @@
+import os
+import contextlib
+
+import pytest
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+
+# 2 cores each, an 8 core node has room for four
+JOBS = ["stress-ng --cpu 2 --timeout 600s"] * 10
+
+@pytest.fixture
+def cluster(tmp_path):
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    from middleware import NODE_INVENTORY
+    cluster.add_node(NODE_INVENTORY[0]["name"], NODE_INVENTORY[0]["label"], listed_at=clock.time())
+    cluster.install()
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("\n".join(JOBS) + "\n")
+    with clock.patch():
+        yield cluster, str(jobs_file)
+
+def cycle(controller, queue):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        controller.run_cycle(queue)
+
+def test_batch_holds_no_more_jobs_than_the_node_has_slots(cluster):
+    cluster, jobs_file = cluster
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    from global_controller import GlobalController
+    from jobs.queue import JobQueue
+
+    name = NODE_INVENTORY[0]["name"]
+    middleware = Middleware(LocalController(name, MonitorNode(name, FakeMetricsBackend(cluster))))
+    middleware.save_metrics = lambda: None
+    controller = GlobalController(middleware)
+    controller.batch_size = 8
+    queue = JobQueue(jobs_file)
+
+    cycle(controller, queue)
+    # four fit, all four indexes start at once and none waits to start outside the ledger
+    assert [pod["phase"] for pod in cluster.pods.values()] == ["Running"] * 4
+    assert queue.depth() == len(JOBS) - 4
+    assert middleware.nodes[0]["requested"]["cpu"] == 8
+
+    for _ in range(3):
+        cluster.clock.sleep(controller.SUBMIT_INTERVAL)
+        cluster.advance()
+        cycle(controller, queue)
+    # the node stays full while they run
+    assert [pod["phase"] for pod in cluster.pods.values()] == ["Running"] * 4
+    assert cluster.requested_cpu(name) == 8
+    assert queue.depth() == len(JOBS) - 4
+
+def test_no_batch_for_a_node_without_free_slots(cluster):
+    cluster, jobs_file = cluster
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    from global_controller import GlobalController
+    from jobs.queue import JobQueue
+
+    name = NODE_INVENTORY[0]["name"]
+    middleware = Middleware(LocalController(name, MonitorNode(name, FakeMetricsBackend(cluster))))
+    middleware.save_metrics = lambda: None
+    # the node is picked, but its ledger is full
+    middleware.free_slots = lambda node_name, resources=None, expected_cpu=None: 0
+    controller = GlobalController(middleware)
+    controller.batch_size = 8
+    queue = JobQueue(jobs_file)
+
+    cycle(controller, queue)
+    assert not cluster.pods
+    assert queue.depth() == len(JOBS)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from cost_model import JobCostModel
+
+def run(model, rng, observations, cpu_values, vm_values=(0,)):
+    for _ in range(observations):
+        cpu = int(rng.choice(cpu_values))
+        vm = int(rng.choice(vm_values))
+        model.observe({"cpu": cpu, "vm": vm}, 0.98 * cpu + 0.9 * vm + rng.normal(0, 0.05))
+
+def assert_bounded(model):
+    assert np.all(np.isfinite(model.rls.theta))
+    assert np.all(np.isfinite(model.rls.P))
+    assert np.trace(model.rls.P) <= model.rls.max_trace * (1 + 1e-9)
+    assert np.linalg.eigvalsh(model.rls.P).min() >= -1e-9
+
+def test_cpu_only_workload_stays_bounded_over_a_long_run():
+    # one observation per running pod per cycle, hours of runtime; io and vm are never excited
+    rng = np.random.default_rng(0)
+    model = JobCostModel()
+    run(model, rng, 200_000, cpu_values=range(1, 7))
+    assert_bounded(model)
+    coefficients = model.coefficients()
+    assert abs(coefficients["cpu"] - 0.98) < 0.02
+    assert abs(coefficients["base"]) < 0.05
+    # untouched directions keep the prior
+    assert coefficients["io"] == 0.1 and coefficients["vm"] == 1.0
+    assert abs(model.expected_cpu({"cpu": 2}) - 1.96) < 0.05
+
+def test_single_cpu_value_does_not_wind_up():
+    # base and cpu are collinear when every job is --cpu 2
+    rng = np.random.default_rng(1)
+    model = JobCostModel()
+    run(model, rng, 20_000, cpu_values=[2])
+    assert_bounded(model)
+    assert abs(model.expected_cpu({"cpu": 2}) - 1.96) < 0.05
+
+def test_new_stressor_is_learned_after_a_long_cpu_only_run():
+    rng = np.random.default_rng(2)
+    model = JobCostModel()
+    run(model, rng, 50_000, cpu_values=range(1, 7))
+    run(model, rng, 3_000, cpu_values=range(1, 7), vm_values=range(0, 3))
+    assert_bounded(model)
+    assert abs(model.coefficients()["vm"] - 0.9) < 0.05
+    assert abs(model.coefficients()["cpu"] - 0.98) < 0.05
@@ -0,0 +1,91 @@
+import pytest
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+from jobs.queue import Job, JobQueue, TenantJobQueue
+
+# 2 cores each, an 8 core node has room for four
+JOB = "stress-ng --cpu 2 --timeout 600s"
+BATCH = ["stress-ng --cpu 2 --timeout 600s --io 1", "stress-ng --cpu 2 --timeout 600s --io 2"]
+
+@pytest.fixture
+def cluster():
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    from middleware import NODE_INVENTORY
+    for node in NODE_INVENTORY[:2]:
+        cluster.add_node(node["name"], node["label"], listed_at=clock.time())
+    cluster.install()
+    with clock.patch():
+        yield cluster
+
+def middleware(cluster):
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    backend = FakeMetricsBackend(cluster)
+    middleware = Middleware(*[LocalController(node["name"], MonitorNode(node["name"], backend)) for node in NODE_INVENTORY[:2]])
+    middleware.refresh_active_nodes()
+    return middleware
+
+def events(cluster, kind):
+    return [name for _, event, name in cluster.events if event == kind]
+
+def test_jobs_pinned_to_a_draining_node_are_requeued_not_lost(cluster):
+    from middleware import NODE_INVENTORY
+    from jobs.job import JobSubmitter, IndexedJobSubmitter
+    name = NODE_INVENTORY[1]["name"]
+    mw = middleware(cluster)
+    for _ in range(4):
+        JobSubmitter(name, Job(JOB).to_args_list(), resources=Job(JOB).resources()).submit()
+    # bound to nothing: the node is full
+    IndexedJobSubmitter(name, [Job(cmd).to_args_list() for cmd in BATCH], resources=Job(BATCH[0]).resources()).submit()
+    assert sorted(pod["phase"] for pod in cluster.pods.values()) == ["Pending"] * 2 + ["Running"] * 4
+
+    assert mw.start_drain(name)
+    requeued = mw.progress_drains()
+    # the pending indexes come back with their own arguments, the node waits for the running ones
+    assert requeued == [(Job(cmd).to_args_list(), None) for cmd in BATCH]
+    assert len(events(cluster, "pod_deleted")) == 2
+    assert not events(cluster, "pod_lost")
+    assert name in cluster.nodes
+
+    cluster.clock.sleep(600)
+    cluster.advance()
+    assert mw.progress_drains() == []
+    assert name not in cluster.nodes
+    assert not events(cluster, "pod_lost")
+
+def test_bound_pending_pods_keep_the_node(cluster):
+    from middleware import NODE_INVENTORY
+    from jobs.job import JobSubmitter
+    name = NODE_INVENTORY[1]["name"]
+    mw = middleware(cluster)
+    JobSubmitter(name, Job(JOB).to_args_list(), resources=Job(JOB).resources()).submit()
+    # bound, still pulling the image when the node is cordoned: it starts there anyway
+    pod = next(iter(cluster.pods.values()))
+    pod["phase"] = "Pending"
+    assert mw.start_drain(name)
+    assert mw.progress_drains() == []
+    assert name in cluster.nodes
+    assert mw.remaining_work()[name] > 0
+
+def test_requeued_jobs_are_taken_first(tmp_path):
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("stress-ng --cpu 1\nstress-ng --cpu 2\n")
+    queue = JobQueue(str(jobs_file))
+    queue.requeue([Job("stress-ng --cpu 3"), Job("stress-ng --cpu 4")])
+    assert [queue.get_next_job().cpu for _ in range(queue.depth())] == [3, 4, 1, 2]
+
+def test_drained_jobs_go_back_to_their_tenants(cluster):
+    from middleware import NODE_INVENTORY
+    from jobs.job import JobSubmitter, IndexedJobSubmitter
+    name = NODE_INVENTORY[1]["name"]
+    mw = middleware(cluster)
+    for _ in range(4):
+        JobSubmitter(name, Job(JOB).to_args_list(), resources=Job(JOB).resources()).submit()
+    IndexedJobSubmitter(name, [Job(cmd).to_args_list() for cmd in BATCH], resources=Job(BATCH[0]).resources(),
+                        tenants=["svc-a", "svc-b"]).submit()
+    assert mw.start_drain(name)
+    queue = TenantJobQueue()
+    queue.requeue([Job(" ".join(["stress-ng"] + args), tenant) for args, tenant in mw.progress_drains()])
+    assert queue.depths() == {"svc-a": 1, "svc-b": 1}
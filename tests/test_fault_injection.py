@@ -0,0 +1,15 @@
+import os
+import contextlib
+
+from testing.fake_cluster import FakeCluster
+
+def test_notready_is_detected_by_the_lease_misses_before_ready_changes(tmp_path):
+    from fault_injection import NodeNotReady, measure_simulated
+    from middleware import NODE_INVENTORY
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("stress-ng --cpu 1 --timeout 60s\n" * 20)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = measure_simulated(NodeNotReady, NODE_INVENTORY[1], str(jobs_file))
+    # two missed renewals, one cycle to see them: not the fake's instant status change
+    assert FakeCluster.LEASE_RENEW_INTERVAL < result["detect_s"] < FakeCluster.NODE_MONITOR_GRACE_PERIOD
+    assert result["recover_s"] is not None
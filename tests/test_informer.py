@@ -0,0 +1,61 @@
+import json
+import threading
+
+from informer import Informer
+
+def pod(name, node, phase, version):
+    return {"metadata": {"name": name, "namespace": "jobs", "resourceVersion": version},
+            "spec": {"nodeName": node}, "status": {"phase": phase}}
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, amt=None, decode_content=False):
+        # split mid-line, as chunks arrive
+        yield self.data[:7]
+        yield self.data[7:]
+
+    def release_conn(self):
+        pass
+
+class PodList:
+    """list_namespaced_pod of a namespace with two pods, then a watch with two events."""
+    def __init__(self):
+        self.watched = False
+        self.calls = []
+
+    def __call__(self, namespace, watch=False, _preload_content=True, **kwargs):
+        self.calls.append((watch, _preload_content))
+        if not watch:
+            body = {"metadata": {"resourceVersion": "10"}, "items": [pod("a", "node0", "Running", "9"), pod("b", None, "Pending", "10")]}
+            return Response(json.dumps(body).encode())
+        if self.watched:
+            # until the informer is stopped
+            return Response(b"")
+        self.watched = True
+        events = [{"type": "MODIFIED", "object": pod("b", "node1", "Running", "11")},
+                  {"type": "DELETED", "object": pod("a", "node0", "Running", "12")}]
+        return Response("".join(json.dumps(event) + "\n" for event in events).encode())
+
+def test_compact_informer_keeps_extracted_records():
+    list_fn = PodList()
+    informer = Informer(list_fn, name="pods", namespace="jobs",
+                        extract=lambda item: (item["spec"]["nodeName"], item["status"]["phase"]))
+    events = []
+    deleted = threading.Event()
+    def handler(event_type, obj):
+        events.append((event_type, obj))
+        if event_type == "DELETED":
+            deleted.set()
+    informer.add_handler(handler)
+    assert informer.relist() == "10"
+    assert sorted(informer.items(), key=str) == [("node0", "Running"), (None, "Pending")]
+
+    informer.start()
+    assert deleted.wait(10)
+    informer.stop()
+    assert informer.items() == [("node1", "Running")]
+    assert events[-2:] == [("MODIFIED", ("node1", "Running")), ("DELETED", ("node0", "Running"))]
+    # no model objects anywhere
+    assert all(preload is False for _, preload in list_fn.calls)
@@ -0,0 +1,34 @@
+import argparse
+
+import pytest
+
+import kube
+
+class Api:
+    def connect_get_node_proxy_with_path(self, name, path):
+        return name
+
+    def list_node(self):
+        return []
+
+@pytest.fixture
+def limiter():
+    saved = kube.limiter
+    # one call now, the next one a thousand seconds later
+    kube.configure(qps=0.001, burst=1)
+    yield kube.limiter
+    kube.limiter = saved
+
+def test_per_node_scrapes_are_not_held_back(limiter):
+    api = kube.RateLimitedApi(Api(), "TestApi")
+    api.list_node()
+    assert limiter.tokens < 1
+    # a whole cluster's worth of scrapes goes through while the budget is used up
+    assert [api.connect_get_node_proxy_with_path(f"node{index}", "stats/summary") for index in range(100)] == [
+        f"node{index}" for index in range(100)]
+    assert kube.stats.snapshot()["TestApi.connect_get_node_proxy_with_path"]["throttled_s"] == 0.0
+
+def test_api_qps_is_split_over_the_controller_and_its_shards():
+    from main import api_budget
+    assert api_budget(argparse.Namespace(api_qps=20, api_burst=40, shards=0)) == (20, 40)
+    assert api_budget(argparse.Namespace(api_qps=20, api_burst=40, shards=4)) == (4, 8)
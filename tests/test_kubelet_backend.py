@@ -0,0 +1,60 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import kube
+from kube import client
+
+CAPACITY = {"cpu": 8.0, "memory": 16 * 2 ** 30}
+
+def summary(node_cores, pods, time="2024-12-02T16:02:18.123456789Z"):
+    return {
+        "node": {"cpu": {"usageNanoCores": node_cores * 1e9, "time": time}, "memory": {"workingSetBytes": 4 * 2 ** 30}},
+        "pods": [{"podRef": {"namespace": "jobs", "name": name}, "cpu": {"usageNanoCores": cores * 1e9},
+                  "memory": {"workingSetBytes": 2 ** 28}} for name, cores in pods.items()],
+    }
+
+class CoreApi:
+    def __init__(self, summaries):
+        self.summaries = summaries
+
+    def connect_get_node_proxy_with_path(self, name, path, **kwargs):
+        assert path == "stats/summary"
+        if name not in self.summaries:
+            raise client.ApiException(status=404, reason="Not Found")
+        return SimpleNamespace(data=json.dumps(self.summaries[name]).encode())
+
+class Capacity:
+    def get(self, node_name):
+        return CAPACITY
+
+@pytest.fixture
+def backend(monkeypatch):
+    from metrics_backend import KubeletSummaryBackend
+    core = CoreApi({"node0": summary(2.0, {"job-a": 1.5}), "node1": summary(6.0, {"job-b": 5.0})})
+    monkeypatch.setitem(kube._apis, "CoreV1Api", core)
+    return KubeletSummaryBackend(capacity=Capacity()), core
+
+def test_node_and_pod_samples(backend):
+    backend, _ = backend
+    samples = backend.get_node_samples(["node0", "node1"])
+    assert samples["node0"]["util"] == 25.0 and samples["node1"]["util"] == 75.0
+    assert samples["node0"]["memory_util"] == 25.0
+    assert samples["node0"]["timestamp"] == pytest.approx(1733155338.123456)
+    assert backend.get_pod_samples("jobs") == {
+        "jobs/job-a": {"cpu": 1.5, "memory": 2 ** 28, "node": "node0"},
+        "jobs/job-b": {"cpu": 5.0, "memory": 2 ** 28, "node": "node1"},
+    }
+    assert backend.get_pod_samples("default") == {}
+
+def test_removed_node_drops_out_quietly(backend, caplog):
+    backend, core = backend
+    backend.get_node_samples(["node0", "node1"])
+    del core.summaries["node1"]
+    with caplog.at_level(logging.ERROR):
+        assert backend.get_node_samples(["node0", "node1"])["node1"] is None
+    assert not caplog.records
+    # its pods are not attributed any more
+    assert list(backend.get_pod_samples("jobs")) == ["jobs/job-a"]
@@ -0,0 +1,106 @@
+import os
+import contextlib
+
+import pytest
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+
+# one batch of three fits on the node, six jobs are two batches
+JOBS = ["stress-ng --cpu 1 --timeout 60s"] * 6
+
+@pytest.fixture
+def cluster(tmp_path):
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    from middleware import NODE_INVENTORY
+    cluster.add_node(NODE_INVENTORY[0]["name"], NODE_INVENTORY[0]["label"], listed_at=clock.time())
+    cluster.install()
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("\n".join(JOBS) + "\n")
+    with clock.patch():
+        yield cluster, str(jobs_file)
+
+def replica(cluster, jobs_file, identity):
+    """One GlobalController replica with its own queue and elector, like a second main.py --leader-elect."""
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    from global_controller import GlobalController
+    from leader_election import LeaderElector
+    from jobs.queue import JobQueue
+
+    name = NODE_INVENTORY[0]["name"]
+    middleware = Middleware(LocalController(name, MonitorNode(name, FakeMetricsBackend(cluster))))
+    middleware.save_metrics = lambda: None
+    controller = GlobalController(middleware)
+    controller.batch_size = 3
+    controller.elector = LeaderElector(identity=identity)
+    return controller, JobQueue(jobs_file)
+
+def cycle(controller, queue):
+    # run_cycle prints section separators
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        controller.run_cycle(queue)
+
+def submitted(cluster):
+    """Job objects created and the job pods they hold."""
+    return len([event for event in cluster.events if event[1] == "job_submitted"]), len(cluster.pods)
+
+def take_over(elector):
+    # the old leader stopped renewing long enough for `elector` to take the lease
+    elector.observed_at -= elector.LEASE_DURATION + 1
+    elector.try_acquire_or_renew()
+    assert elector.is_leader()
+
+def test_leader_loss_between_dequeue_and_submission_does_not_double_submit(cluster):
+    cluster, jobs_file = cluster
+    leader, leader_queue = replica(cluster, jobs_file, "replica-a")
+    standby, standby_queue = replica(cluster, jobs_file, "replica-b")
+    leader.elector.try_acquire_or_renew()
+    standby.elector.try_acquire_or_renew()
+    assert leader.elector.is_leader() and not standby.elector.is_leader()
+
+    # the lease changes hands after the leader took its batch from the queue, before it submits it
+    take_batch = leader.take_batch
+    def take_batch_then_lose_lease(queue, limit=None):
+        batch = take_batch(queue, limit)
+        take_over(standby.elector)
+        return batch
+    leader.take_batch = take_batch_then_lose_lease
+
+    cycle(leader, leader_queue)
+    # the fenced claim on the lease fails, the deposed leader submits nothing and drops the batch
+    assert submitted(cluster) == (0, 0)
+    assert not leader.elector.is_leader()
+    assert leader.submitted_jobs == 3 and leader_queue.depth() == 3
+
+    # the new leader resumes from the count on the lease, which never recorded the dropped batch
+    cycle(standby, standby_queue)
+    assert submitted(cluster) == (1, 3)
+    assert standby.elector.get_annotation("submitted-jobs") == "3"
+    assert standby_queue.depth() == 3
+
+    # the deposed leader stays a standby, the next batch is the new leader's alone
+    cycle(leader, leader_queue)
+    assert submitted(cluster) == (1, 3)
+    standby.last_job_submission_time = 0
+    cycle(standby, standby_queue)
+    # every job exactly once
+    assert submitted(cluster) == (2, len(JOBS))
+    assert standby.elector.get_annotation("submitted-jobs") == str(len(JOBS))
+
+def test_connection_error_on_the_claim_is_a_lost_claim(cluster):
+    import urllib3
+    import kube
+    cluster, jobs_file = cluster
+    leader, leader_queue = replica(cluster, jobs_file, "replica-a")
+    leader.elector.try_acquire_or_renew()
+    assert leader.elector.is_leader()
+
+    def unreachable(*args, **kwargs):
+        raise urllib3.exceptions.ProtocolError("Connection aborted.")
+    kube._apis["CoordinationV1Api"].replace_namespaced_lease = unreachable
+    cycle(leader, leader_queue)
+    # the controller keeps running and submits nothing without the claim
+    assert submitted(cluster) == (0, 0)
+    assert not leader.elector.is_leader()
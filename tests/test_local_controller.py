@@ -0,0 +1,29 @@
+from local_controller import LocalController, load_gain
+
+class Monitor:
+    current_util = 0.0
+    current_memory_util = 70.0
+
+def controller(**kwargs):
+    controller = LocalController("node1", Monitor(), mode="mimo", **kwargs)
+    controller.update_state(20.0)
+    return controller
+
+def test_memory_allowance_scales_with_the_jobs_memory_request():
+    mimo = controller()
+    # 10% of memory left, a 1 GiB --vm pod adds 6.25%: one more pod whatever the job
+    assert mimo.state["max_pods"] == 1
+    assert mimo.state["limited_by"] == "memory"
+    # a job holding a quarter of that fits four times as often, CPU still allows seven
+    assert mimo.max_pods_for(2 ** 28) == 6
+    assert mimo.max_pods_for(2 ** 31) == 0
+    assert mimo.max_pods_for(None) == 1
+
+def test_gain_memory_is_read_from_the_model(tmp_path):
+    model = tmp_path / "mimo_model.csv"
+    model.write_text("A11,0.1\nG11,8.0\nG12,8.0\nG21,0.5\nG22,12.5\nR2_CPU,0.9\nVMBytes,2G\n")
+    gain, gain_memory = load_gain(str(model))
+    assert gain == [[8.0, 8.0], [0.5, 12.5]]
+    assert gain_memory == 2 ** 31
+    # 12.5% per 2 GiB pod is 6.25% per GiB, as the default model
+    assert controller(gain=gain, gain_memory=gain_memory).max_pods_for(2 ** 30) == 1
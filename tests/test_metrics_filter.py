@@ -0,0 +1,41 @@
+from metrics_filter import MetricsFilter
+
+WINDOW = 15.0
+
+def sample(util, timestamp):
+    return {"node1": {"util": util, "timestamp": timestamp, "window": WINDOW}}
+
+def settled(filter, now, util=40.0, cycles=6):
+    for _ in range(cycles):
+        now += WINDOW
+        filter.update(sample(util, now), now)
+    return now
+
+def test_staleness_ignores_clock_skew():
+    filter = MetricsFilter(["node1"])
+    # metrics-server runs ten minutes behind the controller
+    skew = 600.0
+    now = 1000.0
+    for _ in range(3):
+        now += WINDOW
+        assert filter.update(sample(40.0, now - skew), now)["node1"] == (40.0, False)
+    # the same window for longer than STALE_WINDOWS windows is stale
+    stuck = now - skew
+    now += filter.STALE_WINDOWS * WINDOW + 1
+    assert filter.update(sample(40.0, stuck), now)["node1"][1]
+
+def test_jump_after_a_submission_is_taken_at_once():
+    filter = MetricsFilter(["node1"])
+    now = settled(filter, 1000.0)
+    # four --cpu 2 jobs on an 8 core node: a 50% step one window after they were submitted
+    submitted_at = now + 5.0
+    now += WINDOW
+    assert filter.update(sample(90.0, now), now, {"node1": submitted_at})["node1"] == (90.0, False)
+
+def test_jump_without_a_submission_waits_for_a_repeat():
+    filter = MetricsFilter(["node1"])
+    now = settled(filter, 1000.0)
+    now += WINDOW
+    assert filter.update(sample(90.0, now), now)["node1"] == (40.0, False)
+    now += WINDOW
+    assert filter.update(sample(90.0, now), now)["node1"] == (90.0, False)
@@ -0,0 +1,27 @@
+import pytest
+
+from jobs.queue import JobQueue
+
+@pytest.fixture
+def controller():
+    from middleware import Middleware
+    from local_controller import LocalController
+    from global_controller import GlobalController
+
+    class Monitor:
+        current_util = 0.0
+    return GlobalController(Middleware(LocalController("node0", Monitor())))
+
+def queue(tmp_path, jobs):
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("\n".join(jobs) + "\n")
+    return JobQueue(str(jobs_file))
+
+def test_backlog_demand_counts_one_pod_per_job(controller, tmp_path):
+    # one job per 15 s that runs 60 s keeps four pods busy, whatever its --cpu
+    assert controller.backlog_demand(queue(tmp_path, ["stress-ng --cpu 6 --timeout 60s"] * 10)) == 4
+    assert controller.backlog_demand(queue(tmp_path, ["stress-ng --cpu 1 --timeout 60s"] * 10)) == 4
+    # never more than the queued jobs
+    assert controller.backlog_demand(queue(tmp_path, ["stress-ng --cpu 6 --timeout 600s"] * 3)) == 3
+    controller.batch_size = 2
+    assert controller.backlog_demand(queue(tmp_path, ["stress-ng --cpu 6 --timeout 60s"] * 10)) == 8
@@ -0,0 +1,81 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from metrics_backend import PrometheusBackend
+
+NOW = 1733155338.0
+
+def vector(*series):
+    return [{"metric": labels, "value": [NOW, str(value)]} for labels, value in series]
+
+# instant query results by PromQL, as Prometheus returns them
+RESULTS = {
+    PrometheusBackend.NODE_CPU_QUERY: vector(({"node": "node0"}, 81.5), ({"node": "node1"}, 12.25)),
+    # node1 has no memory series
+    PrometheusBackend.NODE_MEMORY_QUERY: vector(({"node": "node0"}, 40.0)),
+    PrometheusBackend.POD_CPU_QUERY % "jobs": vector(
+        ({"namespace": "jobs", "pod": "job-a", "node": "node0"}, 1.98),
+        ({"namespace": "jobs", "pod": "job-b", "node": "node1"}, 0.5),
+    ),
+    # job-b has no memory series, job-c only a memory series
+    PrometheusBackend.POD_MEMORY_QUERY % "jobs": vector(
+        ({"namespace": "jobs", "pod": "job-a"}, 67108864),
+        ({"namespace": "jobs", "pod": "job-c"}, 1024),
+    ),
+}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query).get("query", [""])[0]
+        if url.path != "/api/v1/query":
+            self.reply(404, {"status": "error", "error": "not found"})
+        elif query in RESULTS:
+            self.reply(200, {"status": "success", "data": {"resultType": "vector", "result": RESULTS[query]}})
+        else:
+            self.reply(400, {"status": "error", "errorType": "bad_data", "error": f"unexpected query {query}"})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def prometheus():
+    server = HTTPServer(("127.0.0.1", 0), QueryHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+def test_node_samples(prometheus):
+    backend = PrometheusBackend(prometheus)
+    samples = backend.get_node_samples(["node0", "node1", "node2"])
+    assert samples["node0"] == {"util": 81.5, "memory_util": 40.0, "timestamp": NOW, "window": backend.window}
+    # a missing memory series leaves memory out, a missing node has no sample
+    assert samples["node1"]["util"] == 12.25 and samples["node1"]["memory_util"] is None
+    assert samples["node2"] is None
+
+def test_pod_samples(prometheus):
+    samples = PrometheusBackend(prometheus).get_pod_samples("jobs")
+    assert samples == {
+        "jobs/job-a": {"cpu": 1.98, "memory": 67108864.0, "node": "node0"},
+        "jobs/job-b": {"cpu": 0.5, "memory": None, "node": "node1"},
+    }
+
+def test_query_errors_raise(prometheus):
+    backend = PrometheusBackend(prometheus)
+    backend.NODE_CPU_QUERY = "up{"
+    with pytest.raises(Exception):
+        backend.get_node_samples(["node0"])
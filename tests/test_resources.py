@@ -0,0 +1,57 @@
+import pytest
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+from jobs.queue import Job
+
+# about 32 GiB of --vm-bytes, twice what a fake node has
+BIG_JOB = "stress-ng --vm 8 --vm-bytes 4G --timeout 60s"
+
+@pytest.fixture
+def cluster():
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    cluster.add_node("node0", {"nodetype": "worker0", "role": "master"}, listed_at=clock.time())
+    cluster.install()
+    with clock.patch():
+        yield cluster
+
+def middleware(cluster):
+    from middleware import Middleware
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    middleware = Middleware(LocalController("node0", MonitorNode("node0", FakeMetricsBackend(cluster))))
+    middleware.refresh_active_nodes()
+    middleware.get_total_pods()
+    return middleware
+
+def submit(resources):
+    from jobs.job import JobSubmitter
+    JobSubmitter("node0", Job(BIG_JOB).to_args_list(), resources=resources).submit()
+
+def phases(cluster):
+    return [pod["phase"] for pod in cluster.pods.values()]
+
+def test_job_bigger_than_any_node_never_binds_uncapped(cluster):
+    resources = Job(BIG_JOB).resources()
+    assert resources["requests"]["memory"] > cluster.memory
+    assert not middleware(cluster).fits(middleware(cluster).nodes[0], resources)
+    submit(resources)
+    cluster.advance()
+    assert phases(cluster) == ["Pending"]
+
+def test_requests_are_capped_at_the_largest_node(cluster):
+    mw = middleware(cluster)
+    largest = mw.largest_allocatable()
+    assert largest == {"cpu": cluster.cores, "memory": cluster.memory}
+    resources = Job(BIG_JOB).resources(largest=largest)
+    assert resources["requests"] == {"cpu": 8, "memory": cluster.memory}
+    # limits are what the job uses, the cap only lets it be scheduled
+    assert resources["limits"]["memory"] > cluster.memory
+    assert mw.fits(mw.nodes[0], resources)
+
+    submit(resources)
+    cluster.advance()
+    assert phases(cluster) == ["Running"]
+    mw.get_total_pods()
+    # the node is full for anything else until it finishes
+    assert not mw.fits(mw.nodes[0], Job("stress-ng --cpu 1").resources(largest=largest))
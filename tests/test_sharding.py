@@ -0,0 +1,134 @@
+import os
+import contextlib
+
+import pytest
+
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+
+@pytest.fixture
+def cluster():
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    for name in ("node0", "node1", "node2", "node3"):
+        cluster.add_node(name, {"nodetype": f"worker{name[4:]}", "role": "worker"}, listed_at=clock.time())
+    # joined outside the controller, without the nodetype label job pods ask for
+    cluster.add_node("node7", {"role": "worker"}, listed_at=clock.time())
+    cluster.install()
+    with clock.patch():
+        yield cluster
+
+class InlineCoordinator:
+    """ShardCoordinator that runs its ShardWorkers in this process."""
+    def __init__(self, workers):
+        self.workers = workers
+
+    def merge(self, replies, unknown=()):
+        from sharding import ShardCoordinator
+        return ShardCoordinator.merge(replies, unknown)
+
+    def collect(self, submitted_at=None):
+        return self.merge([worker.step(0, submitted_at) for worker in self.workers])
+
+def sharded_middleware(cluster, shards):
+    from monitor import MonitorNode
+    from local_controller import LocalController
+    from sharding import ShardWorker, ShardedMiddleware
+    workers = []
+    for shard, names in enumerate(shards):
+        backend = FakeMetricsBackend(cluster)
+        workers.append(ShardWorker(shard, {name: LocalController(name, MonitorNode(name, backend)) for name in names}))
+    return ShardedMiddleware([name for names in shards for name in names], InlineCoordinator(workers))
+
+def cycle(middleware):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        middleware.refresh_active_nodes()
+        middleware.update_local_states()
+
+def record_calls(api, names, calls):
+    for name in names:
+        method = getattr(api, name)
+        def recorded(*args, _name=name, _method=method, **kwargs):
+            calls.append((_name, kwargs.get("field_selector")))
+            return _method(*args, **kwargs)
+        setattr(api, name, recorded)
+
+def submit(node_name, cmd="stress-ng --cpu 2 --timeout 60s"):
+    from jobs.job import JobSubmitter
+    from jobs.queue import Job
+    job = Job(cmd)
+    JobSubmitter(node_name, job.to_args_list(), resources=job.resources()).submit()
+
+def node(middleware, name):
+    return next(node for node in middleware.nodes.values() if node["name"] == name)
+
+def test_shards_read_only_their_own_nodes(cluster):
+    import kube
+    calls = []
+    record_calls(kube._apis["CoreV1Api"], ["list_node", "read_node", "list_namespaced_pod"], calls)
+    middleware = sharded_middleware(cluster, [["node0", "node1"], ["node2", "node3"]])
+    submit("node0")
+    submit("node3")
+    cluster.advance()
+    cycle(middleware)
+
+    # no cluster wide node list, every pod list is one node's or the unscheduled pods
+    assert not [call for call in calls if call[0] == "list_node"]
+    assert sorted(selector for name, selector in calls if name == "list_namespaced_pod") == [
+        "spec.nodeName=,status.phase=Pending",
+        "spec.nodeName=node0", "spec.nodeName=node1", "spec.nodeName=node2", "spec.nodeName=node3",
+    ]
+    assert all(node(middleware, name)["is_active"] for name in ("node0", "node1", "node2", "node3"))
+    assert node(middleware, "node0")["controller"].monitor.get_running_pod_count() == 1
+    assert node(middleware, "node3")["requested"]["cpu"] == 2.0
+    assert node(middleware, "node1")["requested"]["cpu"] == 0.0
+    assert middleware.cluster_metrics["total_pods"][-1]["value"] == 2
+
+def test_generic_node_is_labelled_for_its_job_pods(cluster):
+    middleware = sharded_middleware(cluster, [["node0"], ["node7"]])
+    # submitted before the node carries the label its pods ask for, nothing can schedule it yet
+    submit("node7")
+    cluster.advance()
+    assert [pod["node"] for pod in cluster.pods.values()] == [None]
+
+    cycle(middleware)
+    assert cluster.nodes["node7"]["labels"]["nodetype"] == "worker7"
+    assert node(middleware, "node7")["label"]["nodetype"] == "worker7"
+    # the unscheduled pod is counted on the node its affinity names
+    assert node(middleware, "node7")["requested"]["cpu"] == 2.0
+
+    cluster.advance()
+    cycle(middleware)
+    assert [(pod["node"], pod["phase"]) for pod in cluster.pods.values()] == [("node7", "Running")]
+    assert node(middleware, "node7")["controller"].monitor.get_running_pod_count() == 1
+    assert node(middleware, "node7")["requested"]["cpu"] == 2.0
+
+def test_nodes_of_a_failed_shard_take_no_jobs(cluster):
+    middleware = sharded_middleware(cluster, [["node0", "node1"]])
+    cycle(middleware)
+    assert node(middleware, "node1")["controller"].state["max_pods"] > 0
+
+    middleware.coordinator.collect = lambda submitted_at=None: middleware.coordinator.merge([], unknown={"node0", "node1"})
+    cycle(middleware)
+    # not taken for failed, not placed on either
+    assert node(middleware, "node1")["is_active"] and not node(middleware, "node1")["failure_detected"]
+    assert node(middleware, "node1")["controller"].state["max_pods"] == 0
+    assert middleware.determine_next_node() is None
+
+def test_cost_model_learns_from_the_shards(cluster):
+    middleware = sharded_middleware(cluster, [["node0"], ["node1"]])
+    submit("node0", "stress-ng --cpu 3 --timeout 600s")
+    submit("node1", "stress-ng --cpu 1 --io 2 --timeout 600s")
+    cluster.advance()
+    for _ in range(6):
+        cycle(middleware)
+    assert middleware.cost_model.rls.count == 12
+
+def test_stale_node_takes_no_jobs_under_cpu_placement(cluster):
+    middleware = sharded_middleware(cluster, [["node0", "node1"]])
+    middleware.placement = "cpu"
+    cycle(middleware)
+    for name in ("node0", "node1"):
+        node(middleware, name)["controller"].state.update({"max_pods": 0, "stale": True})
+    # plenty of headroom, and a job that expects no CPU at all
+    assert middleware.cost_model.expected_cpu({"cpu": 0}) == middleware.cost_model.MIN_CPU
+    assert middleware.determine_next_node(expected_cpu=middleware.cost_model.expected_cpu({"cpu": 0})) is None
@@ -0,0 +1,97 @@
+import os
+import contextlib
+
+import pytest
+
+from kube import client
+from testing.fake_cluster import FakeClock, FakeCluster, FakeMetricsBackend
+
+JOBS = ["stress-ng --cpu 1 --timeout 60s"] * 2
+
+@pytest.fixture
+def cluster(tmp_path):
+    from jobs.job import JobSubmitter
+    clock = FakeClock(1000.0)
+    cluster = FakeCluster(clock, [])
+    from middleware import NODE_INVENTORY
+    cluster.add_node(NODE_INVENTORY[0]["name"], NODE_INVENTORY[0]["label"], listed_at=clock.time())
+    cluster.install()
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text("\n".join(JOBS) + "\n")
+    # checked once per process, this test needs the check
+    JobSubmitter.known_namespaces.discard("jobs")
+    with clock.patch():
+        yield cluster, str(jobs_file)
+    JobSubmitter.known_namespaces.discard("jobs")
+
+def cycle(controller, queue):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        controller.run_cycle(queue)
+
+def test_job_is_requeued_when_its_namespace_cannot_be_read(cluster):
+    import kube
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    from global_controller import GlobalController
+    from jobs.queue import JobQueue
+    cluster, jobs_file = cluster
+
+    name = NODE_INVENTORY[0]["name"]
+    middleware = Middleware(LocalController(name, MonitorNode(name, FakeMetricsBackend(cluster))))
+    middleware.save_metrics = lambda: None
+    controller = GlobalController(middleware)
+    queue = JobQueue(jobs_file)
+
+    core = kube._apis["CoreV1Api"]
+    read_namespace = core.read_namespace
+    calls = []
+    def forbidden(*args, **kwargs):
+        calls.append(kwargs)
+        raise client.ApiException(status=403, reason="Forbidden")
+    core.read_namespace = forbidden
+    cycle(controller, queue)
+    assert calls
+    # not submitted, not lost, and the controller keeps running
+    assert not cluster.pods
+    assert queue.depth() == len(JOBS)
+
+    core.read_namespace = read_namespace
+    cluster.clock.sleep(controller.SUBMIT_INTERVAL)
+    cycle(controller, queue)
+    assert len(cluster.pods) == 1
+    assert queue.depth() == len(JOBS) - 1
+    # the requeued job is one line of the queue file, taken once as far as a new leader is concerned
+    assert controller.submitted_jobs == 1
+
+def test_rejected_batch_is_requeued(cluster):
+    import kube
+    from middleware import Middleware, NODE_INVENTORY
+    from local_controller import LocalController
+    from monitor import MonitorNode
+    from global_controller import GlobalController
+    from jobs.queue import JobQueue
+    cluster, jobs_file = cluster
+
+    name = NODE_INVENTORY[0]["name"]
+    middleware = Middleware(LocalController(name, MonitorNode(name, FakeMetricsBackend(cluster))))
+    middleware.save_metrics = lambda: None
+    controller = GlobalController(middleware)
+    controller.batch_size = 2
+    queue = JobQueue(jobs_file)
+
+    batch = kube._apis["BatchV1Api"]
+    create_namespaced_job = batch.create_namespaced_job
+    def over_quota(*args, **kwargs):
+        raise client.ApiException(status=403, reason="Forbidden: exceeded quota")
+    batch.create_namespaced_job = over_quota
+    cycle(controller, queue)
+    assert not cluster.pods
+    assert queue.depth() == len(JOBS)
+    assert middleware.nodes[0]["requested"]["cpu"] == 0
+
+    batch.create_namespaced_job = create_namespaced_job
+    cluster.clock.sleep(controller.SUBMIT_INTERVAL)
+    cycle(controller, queue)
+    assert len(cluster.pods) == len(JOBS)
+    assert controller.submitted_jobs == len(JOBS)
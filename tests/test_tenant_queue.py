@@ -0,0 +1,32 @@
+import threading
+
+from jobs.queue import Job, TenantJobQueue
+
+def test_requeued_jobs_go_back_to_their_own_tenant():
+    queue = TenantJobQueue()
+    queue.put_many([Job("stress-ng --cpu 1"), Job("stress-ng --cpu 2")], "svc-a")
+    queue.put_many([Job("stress-ng --cpu 3")], "svc-b")
+    batch = [queue.get_next_job(), queue.get_next_job()]
+    assert [job.tenant for job in batch] == ["svc-a", "svc-b"]
+    queue.requeue(batch)
+    assert queue.depths() == {"svc-a": 2, "svc-b": 1}
+    assert [queue.get_next_job().cpu for _ in range(3)] == [1, 3, 2]
+
+def test_concurrent_posts_stay_within_the_queue_limit():
+    from jobs.ingest import JobIngestServer
+    queue = TenantJobQueue()
+    ingest = JobIngestServer(queue)
+    ingest.MAX_QUEUE_DEPTH = 10
+    ingest.MAX_TENANT_DEPTH = 10
+    start = threading.Barrier(20)
+    statuses = []
+    def post(tenant):
+        start.wait()
+        statuses.append(ingest.submit(tenant, ["stress-ng --cpu 1 --timeout 60s"] * 3)[0])
+    threads = [threading.Thread(target=post, args=(f"svc-{index % 4}",)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert queue.depth() <= 10
+    assert statuses.count(202) == queue.depth() // 3
@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import kube
+from kube import client
+from jobs.job import COMPLETION_INDEX_ANNOTATION
+
+def at(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+def pod(job_name, index, started, finished):
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name=f"{job_name}-{index}", labels={"job-name": job_name},
+                                     annotations={COMPLETION_INDEX_ANNOTATION: str(index)}),
+        spec=client.V1PodSpec(node_name="node0", containers=[]),
+        status=client.V1PodStatus(container_statuses=[client.V1ContainerStatus(
+            name="job", image="polinux/stress-ng", image_id="", ready=False, restart_count=0,
+            state=client.V1ContainerState(terminated=client.V1ContainerStateTerminated(
+                exit_code=0, started_at=at(started), finished_at=at(finished))))]))
+
+@pytest.fixture
+def tracker(monkeypatch):
+    # fed by hand below, the informers are never started
+    monkeypatch.setitem(kube._apis, "BatchV1Api", SimpleNamespace(list_namespaced_job=None))
+    monkeypatch.setitem(kube._apis, "CoreV1Api", SimpleNamespace(list_namespaced_pod=None))
+    from jobs.tracker import JobTracker
+    return JobTracker()
+
+def test_indexed_job_is_recorded_per_index(tracker):
+    # a batch of three submitted at 1000: the indexes start and end at different times
+    for index, (started, finished) in enumerate([(1002, 1010), (1003, 1030), (1020, 1090)]):
+        tracker.on_pod_event("MODIFIED", pod("job-node0-abc", index, started, finished))
+    job = client.V1Job(
+        metadata=client.V1ObjectMeta(name="job-node0-abc", uid="1", annotations={"enqueued-at": "990", "submitted-at": "1000"}),
+        spec=client.V1JobSpec(completion_mode="Indexed", completions=3, template=client.V1PodTemplateSpec()),
+        status=client.V1JobStatus(start_time=at(1001), completion_time=at(1090),
+                                  conditions=[client.V1JobCondition(type="Complete", status="True", last_transition_time=at(1090))]))
+    tracker.on_job_event("MODIFIED", job)
+    records = tracker.metrics["jobs"]
+    assert [record["job"] for record in records] == ["job-node0-abc/0", "job-node0-abc/1", "job-node0-abc/2"]
+    assert [record["start_latency"] for record in records] == [2.0, 3.0, 20.0]
+    assert [record["total_latency"] for record in records] == [20.0, 40.0, 100.0]
+    assert tracker.summary()["total_latency"]["count"] == 3
@@ -0,0 +1,42 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import kube
+from jobs.job import WARM_POOL_LABEL
+
+NODE = "node1.example"
+
+class CoreApi:
+    def __init__(self):
+        self.pods = []
+        self.created = 0
+
+    def list_namespaced_pod(self, namespace, label_selector=None, limit=None, _preload_content=True, **kwargs):
+        return SimpleNamespace(data=json.dumps({"items": self.pods}).encode())
+
+    def create_namespaced_pod(self, namespace, body, **kwargs):
+        self.created += 1
+        # the node cannot take it: it stays Pending and unbound
+        self.pods.append({"metadata": {"name": body.metadata.name, "labels": body.metadata.labels},
+                          "spec": {}, "status": {"phase": "Pending"}})
+
+@pytest.fixture
+def core(monkeypatch):
+    core = CoreApi()
+    monkeypatch.setitem(kube._apis, "CoreV1Api", core)
+    monkeypatch.setitem(kube._apis, "AppsV1Api", SimpleNamespace())
+    monkeypatch.setitem(kube._apis, "BatchV1Api", SimpleNamespace())
+    from jobs.job import JobSubmitter
+    monkeypatch.setattr(JobSubmitter, "known_namespaces", {"jobs"})
+    return core
+
+def test_unscheduled_pool_pods_are_not_replaced(core):
+    from warm_start import WarmStart
+    warm_start = WarmStart(prepull=False, pool_size=2)
+    for _ in range(5):
+        warm_start.refill([NODE])
+    assert core.created == 2
+    assert all(pod["metadata"]["labels"][WARM_POOL_LABEL] == "idle" for pod in core.pods)
+    assert warm_start.idle == {NODE: []}
@@ -0,0 +1,316 @@
+import sys
+import csv
+import time
+import shlex
+import logging
+import argparse
+import kube
+from kube import client
+
+from jobs.job import JobSubmitter, stressor_labels, args_timeout_seconds, TIMEOUT_ANNOTATION, WARM_POOL_LABEL
+from jobs.tracker import percentile
+
+def pool_app(node_name):
+    """app label of the job pods, and so of the pool pods, pinned to node_name."""
+    return f"job-node{node_name.split('.')[0].replace('node', '')}"
+
+class WarmStart:
+    """Takes image pulls and pod creation out of the job start path.
+
+    Pre-pull: a DaemonSet in kube-system whose init container runs the job
+    image on every node, so a node pulls it as soon as it joins instead of
+    when its first job arrives. ensure_prepull() creates it once, Middleware
+    calls on_node_added() when it creates a node, and refill() logs how long
+    the node took to have the image.
+
+    Warm pool: with pool_size > 0 every schedulable node keeps pool_size idle
+    pods of the job image (label warm-pool=idle) that wait for an arguments
+    file. take() execs the job's stress-ng arguments into one of them, so the
+    job starts without scheduling, pulling or container creation, and waits
+    for the pod's start marker, the counterpart of a Job's running container. Idle pods
+    request `slot` (Job.resources() form), which only jobs that fit it are
+    handed; they hold that much of the node while they wait. Handed jobs are
+    pods, not Jobs, so the JobTracker does not see them; their submit to
+    running latency goes to metrics["warm_pool"] instead.
+    """
+    PREPULL_NAME = "stress-ng-prepull"
+    PREPULL_NAMESPACE = "kube-system"
+    PAUSE_IMAGE = "registry.k8s.io/pause:3.9"
+    ARGS_FILE = "/tmp/job-args"
+    STARTED_FILE = "/tmp/job-started"      # touched by the pool pod right before it execs stress-ng
+    START_TIMEOUT = 10                      # seconds take() waits for it
+    NODE_JOIN_TIMEOUT = 300
+
+    def __init__(self, prepull=True, pool_size=0, slot=None, metrics=None, image="polinux/stress-ng", namespace="jobs"):
+        self.prepull = prepull
+        self.pool_size = pool_size
+        self.slot = slot or {"requests": {"cpu": 1.0, "memory": 512 * 2 ** 20}, "limits": {"cpu": 1.0, "memory": 512 * 2 ** 20}}
+        self.image = image
+        self.namespace = namespace
+        self.metrics = metrics if metrics is not None else {}
+        self.metrics.setdefault("warm_pool", [])
+
+        self.core_v1_api = kube.core_v1()
+        self.apps_v1_api = kube.apps_v1()
+        self.exec_api = None
+        self.prepull_exists = False
+        self.added_at = {}              # node name -> time it was created, until it has the image
+        self.idle = {}                  # node name -> names of its running idle pool pods, from the last refill
+
+    # ---- pre-pull ------------------------------------------------------------
+
+    def prepull_daemon_set(self):
+        labels = {"app": self.PREPULL_NAME}
+        return client.V1DaemonSet(
+            api_version="apps/v1",
+            kind="DaemonSet",
+            metadata=client.V1ObjectMeta(name=self.PREPULL_NAME, namespace=self.PREPULL_NAMESPACE, labels=labels),
+            spec=client.V1DaemonSetSpec(
+                selector=client.V1LabelSelector(match_labels=labels),
+                template=client.V1PodTemplateSpec(
+                    metadata=client.V1ObjectMeta(labels=labels),
+                    spec=client.V1PodSpec(
+                        # running the image once is what pulls it, the pause container then keeps the pod alive
+                        init_containers=[client.V1Container(name="pull", image=self.image, args=["--version"],
+                                                            image_pull_policy="IfNotPresent")],
+                        containers=[client.V1Container(
+                            name="pause",
+                            image=self.PAUSE_IMAGE,
+                            resources=client.V1ResourceRequirements(requests={"cpu": "1m", "memory": "8Mi"})
+                        )],
+                        tolerations=[client.V1Toleration(key="node-role.kubernetes.io/control-plane", operator="Exists", effect="NoSchedule")]
+                    )
+                )
+            )
+        )
+
+    def ensure_prepull(self):
+        if not self.prepull or self.prepull_exists:
+            return
+        try:
+            self.apps_v1_api.read_namespaced_daemon_set(self.PREPULL_NAME, self.PREPULL_NAMESPACE)
+        except client.ApiException as e:
+            if e.status != 404:
+                logging.error(f"Warm Start: Failed to read the pre-pull DaemonSet: {e}")
+                return
+            try:
+                self.apps_v1_api.create_namespaced_daemon_set(self.PREPULL_NAMESPACE, self.prepull_daemon_set())
+                logging.info(f"Warm Start: Created DaemonSet {self.PREPULL_NAMESPACE}/{self.PREPULL_NAME} pre-pulling {self.image}")
+            except client.ApiException as e:
+                logging.error(f"Warm Start: Failed to create the pre-pull DaemonSet: {e}")
+                return
+        self.prepull_exists = True
+
+    def on_node_added(self, node_name):
+        self.ensure_prepull()
+        self.added_at[node_name] = time.time()
+
+    def has_image(self, node_name):
+        """Whether the kubelet of node_name reports the job image among its cached images."""
+        node = self.core_v1_api.read_node(node_name)
+        repository = self.image.split(':')[0]
+        for image in (node.status.images if node.status else None) or []:
+            if any(name.split('@')[0].split(':')[0].endswith(repository) for name in image.names or []):
+                return True
+        return False
+
+    def check_added(self):
+        for node_name, added_at in list(self.added_at.items()):
+            try:
+                if self.has_image(node_name):
+                    logging.info(f"Warm Start: {node_name} has {self.image} {time.time() - added_at:.0f}s after it was added")
+                    del self.added_at[node_name]
+            except client.ApiException as e:
+                # not joined yet, given up on after as long as Middleware waits for it
+                if e.status != 404 or time.time() - added_at > self.NODE_JOIN_TIMEOUT:
+                    del self.added_at[node_name]
+
+    # ---- warm pool -----------------------------------------------------------
+
+    def pool_pod(self, node_name):
+        # the JobSubmitter pod template pins the pod to the node, the container waits for its arguments
+        template = JobSubmitter(node_name, [], resources=self.slot).create_job().spec.template
+        template.metadata.labels[WARM_POOL_LABEL] = "idle"
+        container = template.spec.containers[0]
+        container.command = ["/bin/sh", "-c",
+                             f'while [ ! -s {self.ARGS_FILE} ]; do sleep 0.1; done; touch {self.STARTED_FILE}; '
+                             f'eval exec stress-ng "$(cat {self.ARGS_FILE})"']
+        container.args = None
+        template.metadata.name = f"warm-{template.metadata.labels['app']}-{template.metadata.labels['job-id']}"
+        return client.V1Pod(api_version="v1", kind="Pod", metadata=template.metadata, spec=template.spec)
+
+    def refill(self, node_names):
+        """Deletes finished pool pods and tops every node in node_names up to pool_size idle pods."""
+        self.check_added()
+        if self.pool_size <= 0:
+            return
+        try:
+            pods = kube.list_compact(self.core_v1_api.list_namespaced_pod,
+                                     lambda pod: (kube.field(pod, "metadata.name"), kube.field(pod, "metadata.labels.app"),
+                                                  kube.field(pod, "status.phase"), kube.field(pod, f"metadata.labels.{WARM_POOL_LABEL}")),
+                                     namespace=self.namespace, label_selector=WARM_POOL_LABEL)
+        except client.ApiException as e:
+            logging.error(f"Warm Start: Failed to list pool pods: {e}")
+            return
+        # counted by the node their affinity pins them to: one that cannot schedule is Pending without a nodeName
+        pool = {}
+        for name, app, phase, state in pods:
+            if phase in ("Succeeded", "Failed"):
+                try:
+                    self.core_v1_api.delete_namespaced_pod(name=name, namespace=self.namespace)
+                except client.ApiException as e:
+                    logging.error(f"Warm Start: Failed to delete finished pool pod {name}: {e}")
+            elif state == "idle":
+                pool.setdefault(app, {"Running": [], "Pending": []}).setdefault(phase, []).append(name)
+        self.idle = {node_name: pool[pool_app(node_name)]["Running"] for node_name in node_names if pool_app(node_name) in pool}
+        for node_name in node_names:
+            phases = pool.get(pool_app(node_name), {})
+            if phases.get("Pending"):
+                # not scheduled or not started yet, more of them would only queue behind
+                continue
+            missing = self.pool_size - sum(len(names) for names in phases.values())
+            for _ in range(missing):
+                pod = self.pool_pod(node_name)
+                try:
+                    self.core_v1_api.create_namespaced_pod(self.namespace, pod)
+                except client.ApiException as e:
+                    logging.error(f"Warm Start: Failed to create pool pod on {node_name}: {e}")
+                    break
+            if missing > 0:
+                logging.info(f"Warm Start: Added {missing} pool pods on {node_name}")
+
+    def fits(self, resources):
+        """Whether a job with these Job.resources() can run inside a pool pod without more of anything."""
+        for kind in ("requests", "limits"):
+            for resource, value in resources.get(kind, {}).items():
+                slot = self.slot.get(kind, {}).get(resource)
+                if value is None:
+                    # no limit, the pool pod's limit would cap it
+                    if slot is not None:
+                        return False
+                elif slot is not None and value > slot:
+                    return False
+        return True
+
+    def exec(self, pod_name, command):
+        # stream() swaps the request function of the API client it is given, so exec gets one of its own
+        from kubernetes.stream import stream
+        if self.exec_api is None:
+            self.exec_api = client.CoreV1Api(client.ApiClient())
+        return kube.call("CoreV1Api.connect_get_namespaced_pod_exec", "connect_get_namespaced_pod_exec", stream,
+                         self.exec_api.connect_get_namespaced_pod_exec, pod_name, self.namespace, command=command,
+                         stderr=True, stdin=False, stdout=True, tty=False)
+
+    def take(self, node_name, job_args, resources):
+        """Hands job_args to an idle pool pod on node_name; False if there is none or the job does not fit one."""
+        if not self.idle.get(node_name) or not self.fits(resources):
+            return False
+        pod_name = self.idle[node_name].pop(0)
+        submitted_at = time.time()
+        args = shlex.quote(shlex.join(job_args))
+        polls = int(self.START_TIMEOUT / 0.05)
+        try:
+            # written aside and renamed, the waiting loop never reads half the arguments; the same exec then
+            # waits for the start marker, the exec round-trip alone is not when stress-ng starts
+            output = self.exec(pod_name, ["/bin/sh", "-c",
+                                          f"printf '%s' {args} > {self.ARGS_FILE}.tmp && mv {self.ARGS_FILE}.tmp {self.ARGS_FILE} && "
+                                          f"i=0; while [ ! -e {self.STARTED_FILE} ] && [ $i -lt {polls} ]; do sleep 0.05; i=$((i+1)); done; "
+                                          f"[ -e {self.STARTED_FILE} ] && echo started"])
+        except Exception as e:
+            logging.error(f"Warm Start: Failed to hand job to {pod_name}: {e}")
+            return False
+        # the job was handed either way, only its start time is unknown
+        started_at = time.time() if "started" in (output or "") else None
+        if started_at is None:
+            logging.warning(f"Warm Start: {pod_name} did not start the job within {self.START_TIMEOUT}s")
+        timeout = args_timeout_seconds(job_args)
+        annotations = {"submitted-at": str(submitted_at)}
+        if timeout is not None:
+            annotations[TIMEOUT_ANNOTATION] = str(timeout)
+        try:
+            # counted as a job pod from now on, and its CPU attributed to the job's stressors
+            self.core_v1_api.patch_namespaced_pod(pod_name, self.namespace, {"metadata": {
+                "labels": dict({WARM_POOL_LABEL: "taken"}, **stressor_labels(job_args)),
+                "annotations": annotations,
+            }})
+        except client.ApiException as e:
+            logging.error(f"Warm Start: Failed to label {pod_name}: {e}")
+        start_latency = started_at - submitted_at if started_at is not None else None
+        self.metrics["warm_pool"].append({"pod": pod_name, "node": node_name, "submitted_at": submitted_at,
+                                          "start_latency": start_latency})
+        if start_latency is not None:
+            logging.info(f"Job Queue: Handed job {job_args} to pool pod {pod_name}, started in {start_latency:.2f}s")
+        return True
+
+# ---- submit to running latency ----------------------------------------------
+
+def wait_running(core_v1_api, namespace, label_selector, timeout):
+    """Time the first pod matching label_selector has a running container, None on timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for pod in core_v1_api.list_namespaced_pod(namespace, label_selector=label_selector).items:
+            for container in (pod.status.container_statuses if pod.status else None) or []:
+                if container.state and (container.state.running or container.state.terminated):
+                    return time.time()
+        time.sleep(0.1)
+    return None
+
+def measure(node_name, mode, count, job_args, timeout=300):
+    """Submit to running seconds of `count` jobs on node_name, submitted as Jobs or handed to the warm pool."""
+    warm_start = WarmStart(prepull=False, pool_size=1 if mode == "pool" else 0)
+    core_v1_api = kube.core_v1()
+    latencies = []
+    for _ in range(count):
+        if mode == "pool":
+            # a fresh idle pod, waited for outside the measurement like the controller's refill does
+            deadline = time.time() + timeout
+            while not warm_start.idle.get(node_name) and time.time() < deadline:
+                warm_start.refill([node_name])
+                time.sleep(1)
+            if warm_start.take(node_name, job_args, warm_start.slot) and warm_start.metrics["warm_pool"][-1]["start_latency"] is not None:
+                latencies.append(warm_start.metrics["warm_pool"][-1]["start_latency"])
+            continue
+        submitter = JobSubmitter(node_name, job_args)
+        job = submitter.create_job()
+        submitted_at = time.time()
+        submitter.batch_v1_api.create_namespaced_job(namespace=submitter.namespace, body=job)
+        running_at = wait_running(core_v1_api, submitter.namespace, f"job-name={job.metadata.name}", timeout)
+        if running_at is not None:
+            latencies.append(running_at - submitted_at)
+    if mode == "pool":
+        # the last refill left an idle pod behind
+        for name in sum(warm_start.idle.values(), []):
+            core_v1_api.delete_namespaced_pod(name=name, namespace=warm_start.namespace)
+    return latencies
+
+def main():
+    from middleware import NODE_INVENTORY
+    parser = argparse.ArgumentParser(description='Measure job submit to running latency on the cluster, with and without warm start')
+    parser.add_argument('--node', type=int, default=1, help='Inventory index of the node to run the jobs on')
+    parser.add_argument('--modes', default='job,pool', help='Comma separated: job (a Job per submission), pool (handed to a warm pool pod)')
+    parser.add_argument('--count', type=int, default=10, help='Jobs per mode')
+    parser.add_argument('--job', default='--cpu 1 --timeout 5s', help='stress-ng arguments of the measured jobs')
+    parser.add_argument('--prepull', action='store_true', help='Create the pre-pull DaemonSet and wait for the image on the node first')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    node_name = NODE_INVENTORY[args.node]["name"]
+    warm_start = WarmStart()
+    if args.prepull:
+        warm_start.ensure_prepull()
+        while not warm_start.has_image(node_name):
+            time.sleep(1)
+    # whether the first job has to pull the image is what pre-pulling changes
+    image_cached = warm_start.has_image(node_name)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["mode", "node", "image_cached", "count", "first", "p50", "p90", "max"])
+    for mode in args.modes.split(','):
+        latencies = measure(node_name, mode.strip(), args.count, shlex.split(args.job))
+        stats = [round(value, 2) if value is not None else None
+                 for value in (latencies[0] if latencies else None, percentile(latencies, 50), percentile(latencies, 90), max(latencies, default=None))]
+        writer.writerow([mode.strip(), node_name.split('.')[0], image_cached, len(latencies)] + stats)
+        image_cached = True
+
+if __name__ == "__main__":
+    main()